@@ -11,6 +11,9 @@ CREATE TABLE systemdb.AIB_T_REPLY_SENTENSE(
     ts_regist DATETIME NOT NULL,
     nm_regist VARCHAR(20) NOT NULL,
     PRIMARY KEY(id_user, ts_question)
+)
+PARTITION BY RANGE (TO_DAYS(ts_question)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
 );
 
 CREATE TABLE systemdb.AIB_M_TOKEN_COEF(
@@ -24,3 +27,185 @@ CREATE TABLE systemdb.AIB_M_TOKEN_COEF(
     nm_regist VARCHAR(20) NOT NULL,
     PRIMARY KEY(nm_ai_model)
 );
+
+CREATE TABLE systemdb.AIB_T_ANSWER_CACHE(
+    cd_cache_key CHAR(64) NOT NULL,
+    nm_ai_model VARCHAR(50) NOT NULL,
+    cm_answer VARCHAR(1500) NOT NULL,
+    su_cost DOUBLE(9, 8) NOT NULL,
+    ts_expire DATETIME NOT NULL,
+    flg_delete CHAR(1) NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(cd_cache_key)
+);
+
+CREATE TABLE systemdb.AIB_T_OUTBOUND_REPLY(
+    cd_reply_key VARCHAR(100) NOT NULL,
+    id_acct VARCHAR(500) NOT NULL,
+    id_reply_to VARCHAR(100) NOT NULL,
+    nm_visibility VARCHAR(20) NOT NULL,
+    cm_parts TEXT NOT NULL,
+    nu_part INT NOT NULL,
+    flg_delete CHAR(1) NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(cd_reply_key)
+);
+
+
+CREATE TABLE systemdb.AIB_T_MENTION_JOB(
+    id_job BIGINT NOT NULL AUTO_INCREMENT,
+    id_status VARCHAR(100) NOT NULL,
+    id_user VARCHAR(500) NOT NULL,
+    cm_payload MEDIUMTEXT NOT NULL,
+    nm_state VARCHAR(10) NOT NULL,
+    nu_attempt INT NOT NULL,
+    id_worker VARCHAR(100),
+    ts_lease DATETIME,
+    ts_available DATETIME NOT NULL,
+    ts_accepted DATETIME,
+    cm_error VARCHAR(500),
+    flg_delete CHAR(1) NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(id_job),
+    UNIQUE KEY(id_status),
+    KEY(nm_state, ts_available),
+    KEY(id_user, id_job)
+);
+
+CREATE TABLE systemdb.AIB_T_COST_BUDGET(
+    dt_cost DATE NOT NULL,
+    su_cost DOUBLE(12, 8) NOT NULL,
+    su_reserved DOUBLE(12, 8) NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(dt_cost)
+);
+
+CREATE TABLE systemdb.AIB_T_RATE_BUCKET(
+    id_user VARCHAR(500) NOT NULL,
+    su_tokens DOUBLE NOT NULL,
+    ts_refill DATETIME(6) NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(id_user)
+);
+
+CREATE TABLE systemdb.AIB_T_INTAKE_STATE(
+    nm_stream VARCHAR(100) NOT NULL,
+    id_last_notification VARCHAR(100) NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(nm_stream)
+);
+
+CREATE TABLE systemdb.AIB_T_INTAKE_PROCESSED(
+    nm_stream VARCHAR(100) NOT NULL,
+    id_status VARCHAR(100) NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(nm_stream, id_status),
+    INDEX IDX_INTAKE_PROCESSED_01(ts_regist)
+);
+
+CREATE TABLE systemdb.AIB_T_COST_DAILY(
+    dt_cost DATE NOT NULL,
+    nm_ai_model VARCHAR(50) NOT NULL,
+    id_user VARCHAR(500) NOT NULL,
+    su_cost DOUBLE(14, 8) NOT NULL,
+    nu_input_tokens BIGINT NOT NULL,
+    nu_output_tokens BIGINT NOT NULL,
+    nu_answer INT NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(dt_cost, nm_ai_model, id_user)
+);
+
+CREATE TABLE systemdb.AIB_T_REPLY_SENTENSE_ARCHIVE(
+    id_user VARCHAR(500) NOT NULL,
+    ts_question DATETIME NOT NULL,
+    cm_question VARCHAR(500) NOT NULL,
+    ts_answer DATETIME,
+    cm_answer VARCHAR(1500),
+    su_cost DOUBLE(9, 8),
+    flg_delete char(1) NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(id_user, ts_question)
+);
+
+CREATE TABLE systemdb.AIB_T_REJECTION_DAILY(
+    dt_reject DATE NOT NULL,
+    nm_reason VARCHAR(50) NOT NULL,
+    nu_count INT NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(dt_reject, nm_reason)
+);
+
+CREATE TABLE systemdb.AIB_T_CONVERSATION_LINK(
+    id_status VARCHAR(100) NOT NULL,
+    id_thread VARCHAR(100) NOT NULL,
+    nm_acct VARCHAR(500) NOT NULL,
+    id_user VARCHAR(500) NOT NULL,
+    ts_question DATETIME NOT NULL,
+    ts_update DATETIME NOT NULL,
+    nm_update VARCHAR(20) NOT NULL,
+    ts_regist DATETIME NOT NULL,
+    nm_regist VARCHAR(20) NOT NULL,
+    PRIMARY KEY(id_status),
+    INDEX IDX_CONVERSATION_LINK_01(id_thread, nm_acct)
+);
+
+DELIMITER //
+CREATE PROCEDURE systemdb.AIB_P_ADD_REPLY_PARTITION(IN p_name VARCHAR(10), IN p_less_than DATE)
+BEGIN
+    IF p_name NOT REGEXP '^p[0-9]{6}$' THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'invalid partition name';
+    END IF;
+    SET @stmt = CONCAT('ALTER TABLE AIB_T_REPLY_SENTENSE REORGANIZE PARTITION pmax INTO (PARTITION ', p_name,
+                       ' VALUES LESS THAN (TO_DAYS(''', p_less_than, ''')), PARTITION pmax VALUES LESS THAN MAXVALUE)');
+    PREPARE stmt FROM @stmt;
+    EXECUTE stmt;
+    DEALLOCATE PREPARE stmt;
+END//
+
+CREATE PROCEDURE systemdb.AIB_P_DROP_REPLY_PARTITION(IN p_name VARCHAR(10), IN p_archive CHAR(1))
+BEGIN
+    IF p_name NOT REGEXP '^p[0-9]{6}$' THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'invalid partition name';
+    END IF;
+    IF p_archive = '1' THEN
+        SET @stmt = CONCAT('INSERT IGNORE INTO AIB_T_REPLY_SENTENSE_ARCHIVE SELECT * FROM AIB_T_REPLY_SENTENSE PARTITION (', p_name, ')');
+        PREPARE stmt FROM @stmt;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+    SET @stmt = CONCAT('ALTER TABLE AIB_T_REPLY_SENTENSE DROP PARTITION ', p_name);
+    PREPARE stmt FROM @stmt;
+    EXECUTE stmt;
+    DEALLOCATE PREPARE stmt;
+END//
+DELIMITER ;
\ No newline at end of file
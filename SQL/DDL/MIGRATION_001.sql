@@ -0,0 +1,63 @@
+-- 既存環境の移行(AIB_T_COST_DAILYの導入、AIB_T_REPLY_SENTENSEの月別パーティション化)
+-- botを停止し、DDL.sqlのAIB_T_COST_DAILY、AIB_T_REPLY_SENTENSE_ARCHIVE、AIB_P_ADD_REPLY_PARTITION、AIB_P_DROP_REPLY_PARTITIONを作成してから実行する。
+-- 月ごとのパーティションは、以降maintenance_entry_point.pyが追加する。
+
+-- 質問・回答日時はJSTで登録する。旧バージョンはホストのタイムゾーンで登録していたため、JSTに変換する。
+-- @host_tzには旧バージョンのbotを実行していたホストのUTCからの時差を指定する(JSTのホストの場合は変換しない)。
+SET @host_tz = '+09:00';
+SET @shift_seconds = TIMESTAMPDIFF(SECOND, '2000-01-01 00:00:00', CONVERT_TZ('2000-01-01 00:00:00', @host_tz, '+09:00'));
+
+-- 主キー(id_user, ts_question)の重複を避けるため、ずらす向きの端の行から更新する
+UPDATE systemdb.AIB_T_REPLY_SENTENSE
+SET
+ts_question = ts_question + INTERVAL @shift_seconds SECOND
+, ts_answer = ts_answer + INTERVAL @shift_seconds SECOND
+WHERE
+@shift_seconds <> 0
+ORDER BY
+SIGN(@shift_seconds) * TO_SECONDS(ts_question) DESC;
+
+ALTER TABLE systemdb.AIB_T_REPLY_SENTENSE
+PARTITION BY RANGE (TO_DAYS(ts_question)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- 登録済みの回答のコストを日次集計へ登録する。モデル名は記録がないため'-'、トークン数は0とする
+INSERT INTO systemdb.AIB_T_COST_DAILY
+(
+dt_cost
+,nm_ai_model
+,id_user
+,su_cost
+,nu_input_tokens
+,nu_output_tokens
+,nu_answer
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+SELECT
+	DATE(REPLY_SENTENSE.ts_answer)
+	, '-'
+	, REPLY_SENTENSE.id_user
+	, IFNULL(SUM(REPLY_SENTENSE.su_cost), 0)
+	, 0
+	, 0
+	, COUNT(*)
+	, CURRENT_TIMESTAMP()
+	, 'system'
+	, CURRENT_TIMESTAMP()
+	, 'system'
+FROM
+	systemdb.AIB_T_REPLY_SENTENSE REPLY_SENTENSE
+WHERE
+	REPLY_SENTENSE.ts_answer IS NOT NULL
+GROUP BY
+	DATE(REPLY_SENTENSE.ts_answer)
+	, REPLY_SENTENSE.id_user
+ON DUPLICATE KEY UPDATE
+su_cost = VALUES(su_cost)
+, nu_answer = VALUES(nu_answer)
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
@@ -1,6 +1,6 @@
 SELECT
-	IFNULL(SUM(REPLY_SENTENSE.su_cost) , 0) AS API_COST
+	IFNULL(SUM(COST_DAILY.su_cost) , 0) AS API_COST
 FROM
-	AIB_T_REPLY_SENTENSE REPLY_SENTENSE
+	AIB_T_COST_DAILY COST_DAILY
 WHERE
-	DATE_FORMAT(ts_update, '%%Y%%m%%d') = DATE_FORMAT(CURRENT_DATE(), '%%Y%%m%%d');
+	COST_DAILY.dt_cost = %s;
\ No newline at end of file
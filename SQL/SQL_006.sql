@@ -0,0 +1,9 @@
+SELECT
+	ANSWER_CACHE.cm_answer AS ANSWER
+	, ANSWER_CACHE.su_cost AS COST
+FROM
+	AIB_T_ANSWER_CACHE ANSWER_CACHE
+WHERE
+	ANSWER_CACHE.cd_cache_key = %s
+	AND ANSWER_CACHE.ts_expire > NOW()
+	AND ANSWER_CACHE.flg_delete = '0';
\ No newline at end of file
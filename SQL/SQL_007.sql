@@ -0,0 +1,34 @@
+INSERT INTO
+AIB_T_ANSWER_CACHE
+(
+cd_cache_key
+,nm_ai_model
+,cm_answer
+,su_cost
+,ts_expire
+,flg_delete
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(
+%s
+,%s
+,%s
+,%s
+,NOW() + INTERVAL %s SECOND
+,'0'
+,CURRENT_TIMESTAMP()
+,'system'
+,CURRENT_TIMESTAMP()
+,'system'
+)
+ON DUPLICATE KEY UPDATE
+cm_answer = VALUES(cm_answer)
+, su_cost = VALUES(su_cost)
+, ts_expire = VALUES(ts_expire)
+, flg_delete = '0'
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
@@ -0,0 +1,23 @@
+INSERT INTO
+AIB_T_REPLY_SENTENSE
+(
+id_user
+,ts_question
+,cm_question
+,ts_answer
+,cm_answer
+,su_cost
+,flg_delete
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+ON DUPLICATE KEY UPDATE
+ts_answer = COALESCE(VALUES(ts_answer), ts_answer)
+, cm_answer = COALESCE(VALUES(cm_answer), cm_answer)
+, su_cost = COALESCE(VALUES(su_cost), su_cost)
+, ts_update = VALUES(ts_update)
+, nm_update = VALUES(nm_update);
\ No newline at end of file
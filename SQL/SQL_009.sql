@@ -0,0 +1,36 @@
+INSERT INTO
+AIB_T_OUTBOUND_REPLY
+(
+cd_reply_key
+,id_acct
+,id_reply_to
+,nm_visibility
+,cm_parts
+,nu_part
+,flg_delete
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(
+%s
+,%s
+,%s
+,%s
+,%s
+,%s
+,%s
+,CURRENT_TIMESTAMP()
+,'system'
+,CURRENT_TIMESTAMP()
+,'system'
+)
+ON DUPLICATE KEY UPDATE
+id_reply_to = VALUES(id_reply_to)
+, cm_parts = VALUES(cm_parts)
+, nu_part = VALUES(nu_part)
+, flg_delete = VALUES(flg_delete)
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
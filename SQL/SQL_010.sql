@@ -0,0 +1,13 @@
+SELECT
+	OUTBOUND_REPLY.cd_reply_key AS REPLY_KEY
+	, OUTBOUND_REPLY.id_acct AS ACCT
+	, OUTBOUND_REPLY.id_reply_to AS REPLY_TO_ID
+	, OUTBOUND_REPLY.nm_visibility AS VISIBILITY
+	, OUTBOUND_REPLY.cm_parts AS PARTS
+	, OUTBOUND_REPLY.nu_part AS PART_NO
+FROM
+	AIB_T_OUTBOUND_REPLY OUTBOUND_REPLY
+WHERE
+	OUTBOUND_REPLY.flg_delete = '0'
+ORDER BY
+	OUTBOUND_REPLY.ts_regist;
\ No newline at end of file
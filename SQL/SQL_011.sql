@@ -0,0 +1,29 @@
+INSERT IGNORE INTO
+AIB_T_MENTION_JOB
+(
+id_status
+,id_user
+,cm_payload
+,nm_state
+,nu_attempt
+,ts_available
+,flg_delete
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(
+%s
+,%s
+,%s
+,'ready'
+,0
+,CURRENT_TIMESTAMP()
+,'0'
+,CURRENT_TIMESTAMP()
+,'system'
+,CURRENT_TIMESTAMP()
+,'system'
+);
\ No newline at end of file
@@ -0,0 +1,30 @@
+SELECT
+	MENTION_JOB.id_job AS JOB_ID
+	, MENTION_JOB.id_status AS STATUS_ID
+	, MENTION_JOB.id_user AS USER_ID
+	, MENTION_JOB.cm_payload AS PAYLOAD
+	, MENTION_JOB.nu_attempt AS ATTEMPT
+	, MENTION_JOB.ts_accepted AS ACCEPTED_AT
+FROM
+	AIB_T_MENTION_JOB MENTION_JOB
+WHERE
+	MENTION_JOB.flg_delete = '0'
+	AND (
+		(MENTION_JOB.nm_state = 'ready' AND MENTION_JOB.ts_available <= CURRENT_TIMESTAMP())
+		OR (MENTION_JOB.nm_state = 'running' AND MENTION_JOB.ts_lease < CURRENT_TIMESTAMP())
+	)
+	AND NOT EXISTS (
+		SELECT
+			1
+		FROM
+			AIB_T_MENTION_JOB PRIOR_JOB
+		WHERE
+			PRIOR_JOB.id_user = MENTION_JOB.id_user
+			AND PRIOR_JOB.id_job < MENTION_JOB.id_job
+			AND PRIOR_JOB.nm_state IN ('ready', 'running')
+			AND PRIOR_JOB.flg_delete = '0'
+	)
+ORDER BY
+	MENTION_JOB.id_job
+LIMIT 1
+FOR UPDATE SKIP LOCKED;
\ No newline at end of file
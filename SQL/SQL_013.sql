@@ -0,0 +1,11 @@
+UPDATE
+AIB_T_MENTION_JOB
+SET
+nm_state = 'running'
+, id_worker = %s
+, ts_lease = CURRENT_TIMESTAMP() + INTERVAL %s SECOND
+, nu_attempt = nu_attempt + 1
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system'
+WHERE
+id_job = %s;
\ No newline at end of file
@@ -0,0 +1,10 @@
+UPDATE
+AIB_T_MENTION_JOB
+SET
+ts_lease = CURRENT_TIMESTAMP() + INTERVAL %s SECOND
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system'
+WHERE
+id_job = %s
+AND id_worker = %s
+AND nm_state = 'running';
\ No newline at end of file
@@ -0,0 +1,13 @@
+UPDATE
+AIB_T_MENTION_JOB
+SET
+nm_state = %s
+, ts_available = CURRENT_TIMESTAMP() + INTERVAL %s SECOND
+, ts_lease = NULL
+, cm_error = %s
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system'
+WHERE
+id_job = %s
+AND id_worker = %s
+AND nm_state = 'running';
\ No newline at end of file
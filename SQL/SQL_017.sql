@@ -0,0 +1,6 @@
+DELETE FROM
+AIB_T_MENTION_JOB
+WHERE
+nm_state IN ('done', 'failed')
+AND ts_update < CURRENT_TIMESTAMP() - INTERVAL %s DAY
+LIMIT 1000;
\ No newline at end of file
@@ -0,0 +1,10 @@
+SELECT
+	MENTION_JOB.nm_state AS STATE
+	, COUNT(*) AS JOB_COUNT
+FROM
+	AIB_T_MENTION_JOB MENTION_JOB
+WHERE
+	MENTION_JOB.nm_state IN ('ready', 'running')
+	AND MENTION_JOB.flg_delete = '0'
+GROUP BY
+	MENTION_JOB.nm_state;
\ No newline at end of file
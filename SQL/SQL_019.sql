@@ -0,0 +1,23 @@
+INSERT IGNORE INTO
+AIB_T_COST_BUDGET
+(
+dt_cost
+,su_cost
+,su_reserved
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+SELECT
+	%s
+	, IFNULL(SUM(COST_DAILY.su_cost), 0)
+	, 0
+	, CURRENT_TIMESTAMP()
+	, 'system'
+	, CURRENT_TIMESTAMP()
+	, 'system'
+FROM
+	AIB_T_COST_DAILY COST_DAILY
+WHERE
+	COST_DAILY.dt_cost = %s;
\ No newline at end of file
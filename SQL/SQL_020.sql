@@ -0,0 +1,7 @@
+SELECT
+	COST_BUDGET.su_cost AS API_COST
+	, COST_BUDGET.su_reserved AS RESERVED_COST
+FROM
+	AIB_T_COST_BUDGET COST_BUDGET
+WHERE
+	COST_BUDGET.dt_cost = %s;
\ No newline at end of file
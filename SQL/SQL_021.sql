@@ -0,0 +1,9 @@
+UPDATE
+AIB_T_COST_BUDGET
+SET
+su_reserved = su_reserved + %s
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system'
+WHERE
+dt_cost = %s
+AND su_cost + su_reserved + %s <= %s;
\ No newline at end of file
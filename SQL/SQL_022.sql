@@ -0,0 +1,9 @@
+UPDATE
+AIB_T_COST_BUDGET
+SET
+su_reserved = GREATEST(su_reserved - %s, 0)
+, su_cost = su_cost + %s
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system'
+WHERE
+dt_cost = %s;
\ No newline at end of file
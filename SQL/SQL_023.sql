@@ -0,0 +1,7 @@
+SELECT
+	RATE_BUCKET.su_tokens AS TOKENS
+	, RATE_BUCKET.ts_refill AS REFILLED_AT
+FROM
+	AIB_T_RATE_BUCKET RATE_BUCKET
+WHERE
+	RATE_BUCKET.id_user = %s;
\ No newline at end of file
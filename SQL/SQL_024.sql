@@ -0,0 +1,26 @@
+INSERT INTO
+AIB_T_RATE_BUCKET
+(
+id_user
+,su_tokens
+,ts_refill
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(
+%s
+,%s
+,%s
+,CURRENT_TIMESTAMP()
+,'system'
+,CURRENT_TIMESTAMP()
+,'system'
+)
+ON DUPLICATE KEY UPDATE
+su_tokens = VALUES(su_tokens)
+, ts_refill = VALUES(ts_refill)
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
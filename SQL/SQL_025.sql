@@ -0,0 +1,6 @@
+SELECT
+	INTAKE_STATE.id_last_notification AS LAST_NOTIFICATION_ID
+FROM
+	AIB_T_INTAKE_STATE INTAKE_STATE
+WHERE
+	INTAKE_STATE.nm_stream = %s;
\ No newline at end of file
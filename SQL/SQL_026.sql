@@ -0,0 +1,23 @@
+INSERT INTO
+AIB_T_INTAKE_STATE
+(
+nm_stream
+,id_last_notification
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(
+%s
+,%s
+,CURRENT_TIMESTAMP()
+,'system'
+,CURRENT_TIMESTAMP()
+,'system'
+)
+ON DUPLICATE KEY UPDATE
+id_last_notification = VALUES(id_last_notification)
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
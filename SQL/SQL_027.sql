@@ -0,0 +1,23 @@
+SELECT DISTINCT
+	PARENT.id_thread AS ID_THREAD
+	, REPLY_SENTENSE.ts_question AS TS_QUESTION
+	, REPLY_SENTENSE.cm_question AS QUESTION
+	, REPLY_SENTENSE.cm_answer AS ANSWER
+FROM
+	AIB_T_CONVERSATION_LINK PARENT
+	INNER JOIN AIB_T_CONVERSATION_LINK CONVERSATION_LINK
+		ON CONVERSATION_LINK.id_thread = PARENT.id_thread
+		AND CONVERSATION_LINK.nm_acct = PARENT.nm_acct
+	INNER JOIN AIB_T_REPLY_SENTENSE REPLY_SENTENSE
+		ON REPLY_SENTENSE.id_user = CONVERSATION_LINK.id_user
+		AND REPLY_SENTENSE.ts_question = CONVERSATION_LINK.ts_question
+WHERE
+	PARENT.id_status = %s
+	AND PARENT.nm_acct = %s
+	AND REPLY_SENTENSE.ts_question < %s
+	AND REPLY_SENTENSE.ts_question >= %s - INTERVAL %s HOUR
+	AND REPLY_SENTENSE.cm_answer IS NOT NULL
+	AND REPLY_SENTENSE.flg_delete = '0'
+ORDER BY
+	REPLY_SENTENSE.ts_question DESC
+LIMIT %s;
\ No newline at end of file
@@ -0,0 +1,36 @@
+INSERT INTO
+AIB_T_COST_DAILY
+(
+dt_cost
+,nm_ai_model
+,id_user
+,su_cost
+,nu_input_tokens
+,nu_output_tokens
+,nu_answer
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(
+%s
+,%s
+,%s
+,%s
+,%s
+,%s
+,%s
+,CURRENT_TIMESTAMP()
+,'system'
+,CURRENT_TIMESTAMP()
+,'system'
+)
+ON DUPLICATE KEY UPDATE
+su_cost = su_cost + VALUES(su_cost)
+, nu_input_tokens = nu_input_tokens + VALUES(nu_input_tokens)
+, nu_output_tokens = nu_output_tokens + VALUES(nu_output_tokens)
+, nu_answer = nu_answer + VALUES(nu_answer)
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
@@ -0,0 +1,10 @@
+SELECT
+	PARTITIONS.PARTITION_NAME AS PARTITION_NAME
+FROM
+	information_schema.PARTITIONS PARTITIONS
+WHERE
+	PARTITIONS.TABLE_SCHEMA = DATABASE()
+	AND PARTITIONS.TABLE_NAME = 'AIB_T_REPLY_SENTENSE'
+	AND PARTITIONS.PARTITION_NAME IS NOT NULL
+ORDER BY
+	PARTITIONS.PARTITION_ORDINAL_POSITION;
\ No newline at end of file
@@ -0,0 +1,4 @@
+SELECT
+	MIN(REPLY_SENTENSE.ts_question) AS OLDEST_QUESTION_TIME
+FROM
+	AIB_T_REPLY_SENTENSE REPLY_SENTENSE;
\ No newline at end of file
@@ -0,0 +1 @@
+CALL AIB_P_DROP_REPLY_PARTITION(%s, %s);
\ No newline at end of file
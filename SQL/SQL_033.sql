@@ -0,0 +1,25 @@
+INSERT INTO
+AIB_T_REJECTION_DAILY
+(
+dt_reject
+,nm_reason
+,nu_count
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(
+%s
+,%s
+,%s
+,CURRENT_TIMESTAMP()
+,'system'
+,CURRENT_TIMESTAMP()
+,'system'
+)
+ON DUPLICATE KEY UPDATE
+nu_count = nu_count + VALUES(nu_count)
+, ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
@@ -0,0 +1,17 @@
+SELECT
+	COST_DAILY.dt_cost AS DT_COST
+	, COST_DAILY.nm_ai_model AS NM_AI_MODEL
+	, COST_DAILY.id_user AS ID_USER
+	, COST_DAILY.nu_answer AS NU_ANSWER
+	, COST_DAILY.nu_input_tokens AS NU_INPUT_TOKENS
+	, COST_DAILY.nu_output_tokens AS NU_OUTPUT_TOKENS
+	, COST_DAILY.su_cost AS SU_COST
+FROM
+	AIB_T_COST_DAILY COST_DAILY
+WHERE
+	COST_DAILY.dt_cost >= %s
+	AND COST_DAILY.dt_cost <= %s
+ORDER BY
+	COST_DAILY.dt_cost
+	, COST_DAILY.nm_ai_model
+	, COST_DAILY.id_user;
\ No newline at end of file
@@ -0,0 +1,16 @@
+SELECT
+	DATE(REPLY_SENTENSE.ts_question) AS DT_QUESTION
+	, COUNT(*) AS NU_ANSWER
+	, AVG(TIMESTAMPDIFF(SECOND, REPLY_SENTENSE.ts_question, REPLY_SENTENSE.ts_answer)) AS SU_LATENCY_AVG
+	, MAX(TIMESTAMPDIFF(SECOND, REPLY_SENTENSE.ts_question, REPLY_SENTENSE.ts_answer)) AS SU_LATENCY_MAX
+FROM
+	AIB_T_REPLY_SENTENSE REPLY_SENTENSE
+WHERE
+	REPLY_SENTENSE.ts_question >= %s
+	AND REPLY_SENTENSE.ts_question < %s + INTERVAL 1 DAY
+	AND REPLY_SENTENSE.ts_answer IS NOT NULL
+	AND REPLY_SENTENSE.flg_delete = '0'
+GROUP BY
+	DATE(REPLY_SENTENSE.ts_question)
+ORDER BY
+	DT_QUESTION;
\ No newline at end of file
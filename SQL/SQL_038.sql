@@ -0,0 +1,15 @@
+SELECT
+	REPLY_SENTENSE.ts_question AS TS_QUESTION
+	, REPLY_SENTENSE.id_user AS ID_USER
+	, REPLY_SENTENSE.ts_answer AS TS_ANSWER
+	, TIMESTAMPDIFF(SECOND, REPLY_SENTENSE.ts_question, REPLY_SENTENSE.ts_answer) AS SU_LATENCY
+	, REPLY_SENTENSE.su_cost AS SU_COST
+FROM
+	AIB_T_REPLY_SENTENSE REPLY_SENTENSE
+WHERE
+	REPLY_SENTENSE.ts_question >= %s
+	AND REPLY_SENTENSE.ts_question < %s + INTERVAL 1 DAY
+	AND REPLY_SENTENSE.ts_answer IS NOT NULL
+	AND REPLY_SENTENSE.flg_delete = '0'
+ORDER BY
+	REPLY_SENTENSE.ts_question;
\ No newline at end of file
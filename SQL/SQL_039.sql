@@ -0,0 +1,12 @@
+SELECT
+	REJECTION_DAILY.dt_reject AS DT_REJECT
+	, REJECTION_DAILY.nm_reason AS NM_REASON
+	, REJECTION_DAILY.nu_count AS NU_COUNT
+FROM
+	AIB_T_REJECTION_DAILY REJECTION_DAILY
+WHERE
+	REJECTION_DAILY.dt_reject >= %s
+	AND REJECTION_DAILY.dt_reject <= %s
+ORDER BY
+	REJECTION_DAILY.dt_reject
+	, REJECTION_DAILY.nm_reason;
\ No newline at end of file
@@ -0,0 +1,28 @@
+INSERT INTO
+AIB_T_CONVERSATION_LINK
+(
+id_status
+,id_thread
+,nm_acct
+,id_user
+,ts_question
+,ts_update
+,nm_update
+,ts_regist
+,nm_regist
+)
+values
+(
+%s
+,%s
+,%s
+,%s
+,%s
+,CURRENT_TIMESTAMP()
+,'system'
+,CURRENT_TIMESTAMP()
+,'system'
+)
+ON DUPLICATE KEY UPDATE
+ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
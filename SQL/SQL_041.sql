@@ -0,0 +1,4 @@
+DELETE FROM
+	AIB_T_CONVERSATION_LINK
+WHERE
+	ts_question < %s - INTERVAL %s HOUR;
\ No newline at end of file
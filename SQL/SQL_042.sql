@@ -1,10 +1,8 @@
 INSERT INTO
-AIB_T_REPLY_SENTENSE
+AIB_T_INTAKE_PROCESSED
 (
-id_user
-,ts_question
-,cm_question
-,flg_delete
+nm_stream
+,id_status
 ,ts_update
 ,nm_update
 ,ts_regist
@@ -14,10 +12,11 @@ values
 (
 %s
 ,%s
-,%s
-,'0'
 ,CURRENT_TIMESTAMP()
 ,'system'
 ,CURRENT_TIMESTAMP()
 ,'system'
-);
\ No newline at end of file
+)
+ON DUPLICATE KEY UPDATE
+ts_update = CURRENT_TIMESTAMP()
+, nm_update = 'system';
\ No newline at end of file
@@ -0,0 +1,7 @@
+SELECT
+	INTAKE_PROCESSED.id_status AS STATUS_ID
+FROM
+	AIB_T_INTAKE_PROCESSED INTAKE_PROCESSED
+WHERE
+	INTAKE_PROCESSED.nm_stream = %s
+	AND INTAKE_PROCESSED.id_status = %s;
\ No newline at end of file
@@ -0,0 +1,4 @@
+DELETE FROM
+	AIB_T_INTAKE_PROCESSED
+WHERE
+	ts_regist < CURRENT_TIMESTAMP() - INTERVAL %s DAY;
\ No newline at end of file
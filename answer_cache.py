@@ -0,0 +1,159 @@
+"""answer_cache.py
+    回答キャッシュ
+    同一の質問に対する回答を保持し、OpenAI APIの呼び出しを省略する。
+"""
+import collections
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+
+
+class AnswerCache:
+    """回答キャッシュ
+        メモリ上のLRU+TTLキャッシュと、任意でDB上のキャッシュを持つ。
+        プロセス内で1インスタンスを生成し、GenerateTootsで共有する。
+    """
+    def __init__(self, context, db_manager, logger):
+        """コンストラクタ
+            キャッシュキーには再読込後の設定値を用いるため、設定はcontextから都度参照する。
+            Args:
+                context:ApplicationContextインスタンス
+                db_manager:DatabaseManagerインスタンス
+                logger:ロガーインスタンス
+        """
+        self.context = context
+        self.db_manager = db_manager
+        self.logger = logger
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.configure(context.config)
+        # 統計情報
+        self.__memory_hit_cnt = 0
+        self.__persistent_hit_cnt = 0
+        self.__miss_cnt = 0
+        self.__saved_cost = 0.0
+
+    def configure(self, config):
+        """設定変更
+            設定の再読込時に呼び出す。件数の上限を下げた場合は古いものから破棄し、有効期限は以降の登録から反映する。
+            Args:
+                config:外部設定ファイル保持データクラス
+        """
+        with self.__lock:
+            self.max_size = int(config.answer_cache_size)
+            self.ttl = int(config.answer_cache_ttl)
+            self.persistent = config.answer_cache_persistent
+            while len(self.__entries) > max(self.max_size, 0):
+                self.__entries.popitem(last=False)
+
+    @property
+    def enabled(self):
+        """キャッシュ有効判定
+        """
+        return self.max_size > 0
+
+    def make_key(self, content):
+        """キャッシュキー生成
+            正規化した質問文、モデル、temperature、プロンプトからキーを生成する。
+            Args:
+                content:質問文
+            Return:
+                キャッシュキー
+        """
+        normalized = unicodedata.normalize("NFKC", str(content)).lower()
+        normalized = re.sub(r"\s+", " ", normalized).strip()
+        # 末尾の句読点、疑問符の違いは同一の質問とみなす
+        normalized = normalized.rstrip("。.!?！？ ")
+        config = self.context.config
+        source = "\0".join([normalized, config.chatgpt_model, str(config.temperature), config.role_system_content])
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """キャッシュ取得
+            メモリ上にない場合はDB上のキャッシュを参照する。
+            Args:
+                key:キャッシュキー
+            Return:
+                回答文。キャッシュにない場合None
+        """
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                answer, cost, expire_at = entry
+                if expire_at > now:
+                    self.__entries.move_to_end(key)
+                    self.__memory_hit_cnt += 1
+                    self.__saved_cost += cost
+                    return answer
+                del self.__entries[key]
+
+        if self.persistent:
+            row = self.__get_persistent(key)
+            if row is not None:
+                self.__put_memory(key, row.ANSWER, float(row.COST or 0), now)
+                with self.__lock:
+                    self.__persistent_hit_cnt += 1
+                    self.__saved_cost += float(row.COST or 0)
+                return row.ANSWER
+
+        with self.__lock:
+            self.__miss_cnt += 1
+        return None
+
+    def put(self, key, answer, cost):
+        """キャッシュ登録
+            Args:
+                key:キャッシュキー
+                answer:回答文
+                cost:回答生成に要したコスト
+        """
+        self.__put_memory(key, answer, float(cost), time.monotonic())
+        if self.persistent:
+            try:
+                self.db_manager.exec_query("SQL_007.sql", key, self.context.config.chatgpt_model, answer, float(cost), self.ttl)
+            except Exception as e:
+                self.logger.error("回答キャッシュのDB登録に失敗しました。" + str(e))
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                ヒット数、ミス数、削減コスト等の統計情報
+        """
+        with self.__lock:
+            return {
+                "size": len(self.__entries),
+                "memory_hit_count": self.__memory_hit_cnt,
+                "persistent_hit_count": self.__persistent_hit_cnt,
+                "miss_count": self.__miss_cnt,
+                "saved_cost": self.__saved_cost,
+            }
+
+    def __put_memory(self, key, answer, cost, now):
+        """メモリキャッシュ登録
+            Args:
+                key:キャッシュキー
+                answer:回答文
+                cost:回答生成に要したコスト
+                now:現在時刻(time.monotonic)
+        """
+        with self.__lock:
+            self.__entries[key] = (answer, cost, now + self.ttl)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def __get_persistent(self, key):
+        """DBキャッシュ取得
+            Args:
+                key:キャッシュキー
+            Return:
+                Row。キャッシュにない、または取得に失敗した場合None
+        """
+        try:
+            return self.db_manager.fetch_one("SQL_006.sql", key)
+        except Exception as e:
+            self.logger.error("回答キャッシュのDB参照に失敗しました。" + str(e))
+            return None
@@ -0,0 +1,213 @@
+"""application_context.py
+    プロセス内で共有するインスタンスの生成、保持を行う。
+    設定ファイル、ロガー、トークナイザ、APIクライアント、DB関連のインスタンスを起動時に1回だけ生成する。
+"""
+import signal
+import threading
+
+from mastodon import Mastodon
+import openai
+import tiktoken
+
+from answer_cache import AnswerCache
+from canned_response import CannedResponder
+from config_file_setting import SetConfigFileData
+from conversation_cache import ConversationCache
+from cost_ledger import CostLedger
+from database_manager import DatabaseManager
+from job_queue import JobQueue
+from logger_utils import Logger
+from mention_validator import ServerFilter
+from metrics import MetricsRegistry, MetricsServer
+from rate_limiter import RateLimiter
+from reply_writer import ReplyWriter
+from single_flight import SingleFlight
+from sql_catalog import SqlCatalogError
+from token_budget import TokenBudget
+from toot_sender import TootSender
+
+
+# 実行形態
+ROLE_STANDALONE = "standalone"  # 1プロセスで受信から返信までを行う
+ROLE_INGEST = "ingest"          # 受信した通知をジョブテーブルへ登録する
+ROLE_WORKER = "worker"          # ジョブテーブルの通知に返信する。複数プロセスで実行する
+ROLE_MAINTENANCE = "maintenance"  # DBの保守処理を行う
+
+
+class ApplicationContext:
+    """アプリケーションコンテキスト
+        各処理へコンストラクタ経由で渡し、共有インスタンスを参照させる。
+        受信プロセス、保守処理では、返信に用いるインスタンスは生成しない(None)。
+    """
+    def __init__(self, role=ROLE_STANDALONE):
+        """コンストラクタ
+            Args:
+                role:実行形態(ROLE_STANDALONE/ROLE_INGEST/ROLE_WORKER/ROLE_MAINTENANCE)
+        """
+        self.role = role
+        # 各インスタンス化
+        self.config = SetConfigFileData().set_config_datas()
+        self.logger = Logger(self.config)
+        # 処理段階ごとの計測値は各処理で共有する
+        self.metrics = MetricsRegistry()
+        # 許可・拒否サーバーは起動時、再読込時にホスト名の集合とする
+        self.server_filter = ServerFilter(self.config)
+        openai.api_key = self.config.api_key
+        # Stream受信、バックフィル、インスタンス情報の取得はレート制限の解除までクライアント内で待機する
+        self.mastodon = self.__create_mastodon("wait")
+        # 返信の投稿用。レート制限はTootSenderで管理し、クライアント内で待機しない
+        self.post_mastodon = None
+        self.__reload_lock = threading.Lock()
+
+        # コネクションプールはStream、GenerateTootsで共有する
+        try:
+            self.db_manager = DatabaseManager(self.config, self.logger, self.metrics)
+        except SqlCatalogError as e:
+            # SQLファイル不備は起動時に検知して終了する
+            self.logger.critical("SQLファイル読込エラー。" + str(e))
+            exit()
+        # 複数プロセス構成では、通知をジョブテーブル経由で受け渡す
+        self.job_queue = JobQueue(self) if role in (ROLE_INGEST, ROLE_WORKER) else None
+
+        self.encoder = None
+        self.reply_writer = None
+        self.cost_ledger = None
+        self.rate_limiter = None
+        self.answer_cache = None
+        self.single_flight = None
+        self.canned_responder = None
+        self.conversations = None
+        self.token_budget = None
+        self.toot_sender = None
+        if role in (ROLE_STANDALONE, ROLE_WORKER):
+            self.__init_reply_components(shared = role == ROLE_WORKER)
+            self.metrics.register_gauge("reply_writer", self.reply_writer.stats)
+            self.metrics.register_gauge("answer_cache", self.answer_cache.stats)
+            self.metrics.register_gauge("single_flight", self.single_flight.stats)
+            self.metrics.register_gauge("conversations", self.conversations.stats)
+            self.metrics.register_gauge("cost_today", self.cost_ledger.current)
+            self.metrics.register_gauge("toot_sender", self.toot_sender.stats)
+
+        self.metrics.register_gauge("db_pool", self.db_manager.pool_stats)
+        self.metrics.register_gauge("logger", self.logger.stats)
+        self.metrics_server = MetricsServer(self.metrics, self.config, self.logger)
+
+    def __init_reply_components(self, shared):
+        """返信処理用インスタンス生成
+            Args:
+                shared:複数のワーカープロセスでコスト予算、投稿間隔を共有する場合True
+        """
+        self.encoder = tiktoken.get_encoding('cl100k_base')
+        self.post_mastodon = self.__create_mastodon("throw")
+        # 質問・回答はメモリ上に溜め、まとめてDBへ登録する
+        self.reply_writer = ReplyWriter(self.db_manager,
+                                        self.config.write_batch_size,
+                                        self.config.write_flush_interval,
+                                        self.logger)
+        self.reply_writer.start()
+        try:
+            # 実行日のAPIコストは起動時にDBから集計し、以降はメモリ上で管理する
+            self.cost_ledger = CostLedger(self.db_manager, self.config.cost_reconcile_interval, self.logger,
+                                          pending_cost = self.reply_writer.pending_cost,
+                                          shared = shared)
+        except Exception as e:
+            self.logger.critical("APIコスト集計の初期化エラー。" + str(e))
+            exit()
+        self.rate_limiter = RateLimiter(self.db_manager,
+                                        self.config.receive_interval,
+                                        burst = self.config.rate_limit_burst,
+                                        refill_interval = self.config.rate_limit_refill_interval,
+                                        max_users = self.config.rate_limit_max_users,
+                                        shared = shared)
+        self.answer_cache = AnswerCache(self, self.db_manager, self.logger)
+        # 同じ質問の同時呼び出しは1回のAPI呼び出しにまとめる
+        self.single_flight = SingleFlight()
+        try:
+            # 定型文のルールは起動時に読み込み、以降はファイル更新時に再読込する
+            self.canned_responder = CannedResponder(self.config, self.logger)
+        except Exception as e:
+            self.logger.critical("定型文のルールファイル読込エラー。" + str(e))
+            exit()
+        # スレッド内の会話の文脈はメモリ上に保持し、キャッシュにない場合のみDBから取得する
+        self.conversations = ConversationCache(self)
+        # システムプロンプトのトークン数、トークン単価は初回のみ算出、取得する
+        self.token_budget = TokenBudget(self)
+        # 返信は送信スレッドが投稿する。前回未送信の返信は起動時に再送する
+        # (複数のワーカーが同じ返信を再送しても、冪等キーにより二重には投稿されない)
+        self.toot_sender = TootSender(self)
+        self.toot_sender.start()
+
+    def __create_mastodon(self, ratelimit_method):
+        """Mastodonクライアント生成
+            Args:
+                ratelimit_method:レート制限時の動作(wait/throw/pace)
+            Returns:
+                Mastodonインスタンス
+        """
+        return Mastodon(client_id = self.config.client_id,
+                        client_secret = self.config.client_secret,
+                        access_token = self.config.access_token,
+                        api_base_url = self.config.api_base_url,
+                        ratelimit_method = ratelimit_method)
+
+    def reload(self):
+        """設定再読込
+            Config.iniを読み込み直し、設定値と許可・拒否サーバーの判定を差し替える。
+            生成時に設定値を保持する投稿間隔制御、回答キャッシュ、APIコスト集計は設定を変更する。
+            DB接続先、コネクションプール、ログ出力先、メトリクス出力先、ワーカー数・送信スレッド数・処理待ち上限、
+            質問・回答の一括登録の件数・間隔の変更は再起動後に反映する。
+            Returns:
+                True:再読込成功
+                False:再読込失敗(設定値は変更しない)
+        """
+        if not self.__reload_lock.acquire(blocking=False):
+            # 再読込中のシグナルは無視する
+            return False
+        try:
+            config = SetConfigFileData().load_config_datas()
+            server_filter = ServerFilter(config)
+        except Exception as e:
+            self.logger.error("設定の再読込に失敗しました。" + str(e))
+            return False
+        else:
+            self.config = config
+            self.server_filter = server_filter
+            openai.api_key = config.api_key
+            if self.rate_limiter is not None:
+                self.rate_limiter.configure(config.receive_interval,
+                                            burst = config.rate_limit_burst,
+                                            refill_interval = config.rate_limit_refill_interval,
+                                            max_users = config.rate_limit_max_users)
+            if self.answer_cache is not None:
+                self.answer_cache.configure(config)
+            if self.cost_ledger is not None:
+                self.cost_ledger.configure(config.cost_reconcile_interval)
+            self.logger.info("設定を再読込しました。")
+            return True
+        finally:
+            self.__reload_lock.release()
+
+    def install_reload_signal(self):
+        """再読込シグナル登録
+            SIGHUP受信時に設定を再読込する。メインスレッドから呼び出す。
+        """
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.reload())
+
+    def start_metrics(self):
+        """計測値の出力開始
+            HTTPエンドポイント、サマリファイルの出力を開始する。
+        """
+        self.metrics_server.start()
+
+    def close(self):
+        """終了処理
+            未送信の返信、未登録の質問・回答をDBへ登録してから切断する。
+        """
+        self.metrics_server.stop()
+        if self.toot_sender is not None:
+            self.toot_sender.close(self.config.timeout_interval)
+        if self.reply_writer is not None:
+            self.reply_writer.close(self.config.write_flush_interval)
+        self.db_manager.close()
+        self.logger.close()
@@ -0,0 +1,13 @@
+"""async_entry_point.py
+    botプログラムのメインエントリポイント(asyncio版)
+"""
+from application_context import ApplicationContext
+from async_mastodon_service import AsyncMastodonService
+
+
+# インスタンス化
+context = ApplicationContext()
+mstdnSv = AsyncMastodonService(context)
+
+# 処理開始
+mstdnSv.start_stream()
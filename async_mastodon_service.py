@@ -0,0 +1,285 @@
+"""async_mastodon_service.py
+    Mastodonに関連する処理(asyncio版)
+    ストリーミングの受信、OpenAI APIの呼び出しを1つのイベントループ上で行う。返信の投稿は送信スレッドが行う。
+"""
+import asyncio
+import concurrent.futures
+import json
+import random
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from generate_toots import GenerateToots
+from logger_utils import bind_context
+from mastodon_service import Stream, StreamService
+from toot_chunker import split_toot
+
+
+# ストリーミング再接続時の待機秒数(初回、上限)
+RECONNECT_WAIT_MIN = 1.0
+RECONNECT_WAIT_MAX = 60.0
+
+
+class AsyncMastodonService(StreamService):
+    """AsyncMastodonService
+        MastodonServiceと共通の初期設定を行い、asyncioでストリーミングを処理する。ワーカースレッドは生成しない。
+        返信要件チェック、DB処理はコネクションプールと同数のスレッドを持つexecutor上で行う。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        super().__init__(context)
+        self.logger_instance = context.logger
+        self.stream = Stream(context, None)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.config.pool_size,
+                                                              thread_name_prefix="db")
+        self.session = None
+        self.__in_flight = None
+        self.__tasks = set()
+
+    @property
+    def config(self):
+        """外部設定ファイル保持データクラス
+            SIGHUPによる再読込を反映するため、contextから都度参照する。
+        """
+        return self.context.config
+
+    def start_stream(self):
+        """Stream開始
+            イベントループを起動し、Streamを開始する。
+        """
+        self.logger_instance.info("非同期Streamの起動")
+        self.context.install_reload_signal()
+        self.context.start_metrics()
+        try:
+            asyncio.run(self.__run())
+        except KeyboardInterrupt:
+            self.logger_instance.info("非同期Streamの停止")
+        finally:
+            self.executor.shutdown(wait=True)
+            self.context.close()
+
+    async def __run(self):
+        """Stream処理
+            切断時は待機時間を延ばしながら再接続する。
+            接続のたびに、停止中・切断中の通知を取得する。
+        """
+        self.__in_flight = asyncio.Semaphore(self.config.async_max_in_flight)
+        headers = {"Authorization": "Bearer " + self.config.access_token}
+        wait = RECONNECT_WAIT_MIN
+
+        async with aiohttp.ClientSession(headers=headers) as session:
+            self.session = session
+            try:
+                while True:
+                    try:
+                        self.intake.hold_checkpoint()
+                        await self.__consume_stream()
+                        wait = RECONNECT_WAIT_MIN
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        self.logger_instance.warning("Streamが切断されました。" + str(e))
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        # 想定外のエラーでもサービスは停止せず、再接続する
+                        self.logger_instance.error("Stream受信で、エラーが発生しました。" + str(e))
+
+                    await asyncio.sleep(wait * random.uniform(0.5, 1.5))
+                    wait = min(wait * 2, RECONNECT_WAIT_MAX)
+            finally:
+                # 処理中の返信を取り消す
+                for task in self.__tasks:
+                    task.cancel()
+                await asyncio.gather(*self.__tasks, return_exceptions=True)
+
+    async def __consume_stream(self):
+        """Stream受信
+            Server-Sent Eventsを1イベントずつ読み込み、通知を処理する。
+        """
+        url = await self.__streaming_base_url() + "/api/v1/streaming/user"
+        # ハートビートが途絶えた場合は切断とみなす
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.config.stream_silence_timeout)
+
+        async with self.session.get(url, timeout=timeout) as resp:
+            resp.raise_for_status()
+            self.logger_instance.info("StreamListnerの起動")
+            # 接続後に取得し、接続までの間の通知を取りこぼさない
+            task = asyncio.create_task(self.__backfill())
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+            event = None
+            data = []
+            async for raw in resp.content:
+                self.intake.touch()
+                line = raw.decode("utf-8").rstrip("\r\n")
+                if line.startswith(":"):
+                    # ハートビート
+                    continue
+                if line == "":
+                    if event == "notification" and data:
+                        await self.__on_stream_event(data)
+                    event = None
+                    data = []
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:"):].lstrip())
+
+    async def __streaming_base_url(self):
+        """ストリーミングAPIのURL取得
+            Mastodon.pyと同様に、インスタンス情報(/api/v1/instance)のstreaming_apiがAPIのURLと異なる場合はそちらに接続する。
+            Return:
+                ストリーミングAPIのベースURL
+        """
+        loop = asyncio.get_running_loop()
+        instance = await loop.run_in_executor(self.executor, self.context.mastodon.instance)
+        streaming_api = (instance.get("urls") or {}).get("streaming_api")
+        if not streaming_api or streaming_api == self.config.api_base_url:
+            return self.config.api_base_url.rstrip('/')
+
+        parse = urlsplit(streaming_api)
+        if parse.scheme == "wss":
+            return "https://" + parse.netloc
+        if parse.scheme == "ws":
+            return "http://" + parse.netloc
+        raise ValueError("ストリーミングAPIのURLが不正です。" + str(streaming_api))
+
+    async def __on_stream_event(self, data):
+        """Streamイベント処理
+            不正なイベント、処理中のエラーはイベント単位で読み捨て、受信を継続する。
+            Args:
+                data:イベントのdata行のリスト
+        """
+        try:
+            notif = json.loads("\n".join(data))
+        except ValueError as e:
+            self.logger_instance.error("不正な通知を受信しました。" + str(e))
+            return
+        try:
+            await self.__on_stream_notification(notif)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger_instance.error("通知の処理で、エラーが発生しました。" + str(e))
+
+    async def __backfill(self):
+        """バックフィル
+            停止中・切断中のmentionを取得し、Streamで受信した通知と同様に処理する。
+            取得に失敗した場合は、待機時間を延ばしながら記録済みの通知IDから再取得する。
+        """
+        loop = asyncio.get_running_loop()
+
+        def handler(notif):
+            asyncio.run_coroutine_threadsafe(self.__on_notification(notif), loop).result()
+
+        wait = RECONNECT_WAIT_MIN
+        while True:
+            try:
+                await loop.run_in_executor(self.executor, bind_context(self.intake.backfill), handler)
+                return
+            except Exception as e:
+                self.logger_instance.error("未処理のmentionの取得に失敗しました。" + str(e))
+            await asyncio.sleep(wait * random.uniform(0.5, 1.5))
+            wait = min(wait * 2, RECONNECT_WAIT_MAX)
+
+    async def __on_stream_notification(self, notif):
+        """Stream受信処理
+            バックフィルで処理済みのmentionは処理しない。
+            Args:
+                notif:通知
+        """
+        if notif.get('type') == 'mention':
+            loop = asyncio.get_running_loop()
+            if not await loop.run_in_executor(self.executor, self.intake.accept, notif):
+                return
+        await self.__on_notification(notif)
+
+    async def __on_notification(self, notif):
+        """通知受信処理
+            同時処理数の上限に達している場合は、空きが出るまで受信を待機する。
+            Args:
+                notif:通知
+        """
+        try:
+            if notif['type'] == 'mention':
+                self.logger_instance.info("mentionの検知")
+                self.context.metrics.inc("mentions_total")
+                notifi_entity, visibility_status = self.stream.parse_notification(notif)
+
+                await self.__in_flight.acquire()
+                task = asyncio.create_task(self.__process_mention(notif, notifi_entity, visibility_status))
+                self.__tasks.add(task)
+                task.add_done_callback(self.__tasks.discard)
+
+        except Exception as e:
+            self.logger_instance.critical("通知の受信に関して、エラーが発生しました。" + str(e))
+            # 処理できない通知は再取得しない
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.intake.complete, notif)
+
+    async def __process_mention(self, notif, notifi_entity, visibility_status):
+        """返信処理
+            Args:
+                notif:通知
+                notifi_entity:受信した通知内容
+                visibility_status:botの返信時visibility
+        """
+        completed = True
+        try:
+            # 以降のログに通知のstatus IDを付与する
+            with self.logger_instance.correlation(notifi_entity.noti['id']), self.context.metrics.timer("stage_seconds", stage="mention"):
+                loop = asyncio.get_running_loop()
+                accepted = await loop.run_in_executor(self.executor, bind_context(self.stream.accept_mention), notifi_entity, visibility_status)
+                if accepted is None:
+                    return
+                content, reply_record = accepted
+
+                # 回答文生成
+                generateToots = GenerateToots(self.context)
+                if self.config.stream_response:
+                    # 生成文を受信しながら返信する
+                    acct = notifi_entity.noti['account']['acct']
+                    toot_sender = self.context.toot_sender
+                    reply = toot_sender.open(notifi_entity.noti, acct, visibility_status, track_first=True)
+
+                    async def post(line):
+                        toot_sender.append(reply, line)
+
+                    try:
+                        await generateToots.process_stream_async(content, reply_record, acct, post, self.executor)
+                    finally:
+                        toot_sender.finish(reply)
+                else:
+                    res = await generateToots.process_async(content, reply_record, self.executor)
+
+                    await self.__do_toot(res, notifi_entity, visibility_status)
+
+        except asyncio.CancelledError:
+            # 停止時に取り消した通知は、次回のバックフィルで再取得する
+            completed = False
+            raise
+
+        except Exception as e:
+            self.logger_instance.critical("返信処理に関して、エラーが発生しました。" + str(e))
+
+        finally:
+            self.__in_flight.release()
+            if completed:
+                # 処理済みのmentionの記録はDBへの登録を伴うため、executor上で行う
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.intake.complete, notif)
+
+    async def __do_toot(self, response, notifi_entity, visibility_param):
+        """トゥート処理
+            投稿は送信スレッドが行うため、送信キューへの追加のみ行う。
+            Args:
+                response:生成文
+                notifi_entity:通知情報保持データエンティティ
+                visibility_param:返信時のvisibility
+        """
+        acct = notifi_entity.noti['account']['acct']
+
+        self.logger_instance.info("トゥート")
+        self.context.toot_sender.send(notifi_entity.noti, acct, split_toot(response, acct), visibility_param)
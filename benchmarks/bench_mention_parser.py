@@ -0,0 +1,93 @@
+"""bench_mention_parser.py
+    リプライ本文解析のマイクロベンチマーク
+    BeautifulSoupで2回解析する従来の処理と、mention_parserの1回走査の処理を比較する。
+    リポジトリ直下で python -m benchmarks.bench_mention_parser として実行する。
+"""
+import argparse
+import timeit
+
+from bs4 import BeautifulSoup
+
+from benchmarks.mention_payloads import PAYLOADS
+from mention_parser import parse_mention_content
+
+
+def legacy_edit_content(content_raw):
+    """従来の質問文編集処理(Stream.__edit_content相当)
+        Args:
+            content_raw:タグを含んだリプライ文
+        Returns:
+            編集済質問文
+    """
+    content_raw = str(content_raw).replace("<br>", " ")
+    content_raw = str(content_raw).replace("</br>", " ")
+    content_raw = str(content_raw).replace("<br />", " ")
+
+    html_data = BeautifulSoup(content_raw, "html.parser")
+
+    content = ""
+    if not html_data.find("span", class_='h-card'):
+        if html_data.find("a").next_sibling != None:
+            content = html_data.find("a").next_sibling
+    else:
+        if html_data.find("span").next_sibling != None:
+            content = html_data.find("span").next_sibling
+    return content
+
+
+def legacy_check_include_url(content_raw):
+    """従来のURLチェック処理(Stream.__check_include_url相当)
+        Args:
+            content_raw:HTML情報を含んだ通知情報
+        Returns:
+            True:URLあり
+            False:URLなし
+    """
+    content_raw = str(content_raw).replace("<br>", " ")
+    content_raw = str(content_raw).replace("</br>", " ")
+    content_raw = str(content_raw).replace("<br />", " ")
+
+    html_data = BeautifulSoup(content_raw, "html.parser")
+    return len(html_data.find_all("a")) > 1
+
+
+def run_legacy():
+    """従来処理で全件解析
+    """
+    for payload in PAYLOADS:
+        legacy_edit_content(payload)
+        legacy_check_include_url(payload)
+
+
+def run_single_pass():
+    """mention_parserで全件解析
+    """
+    for payload in PAYLOADS:
+        parse_mention_content(payload)
+
+
+def main():
+    """ベンチマーク実行
+    """
+    arg_parser = argparse.ArgumentParser(description="リプライ本文解析のベンチマーク")
+    arg_parser.add_argument("--number", type=int, default=200, help="1計測あたりの繰り返し回数")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    args = arg_parser.parse_args()
+
+    count = len(PAYLOADS) * args.number
+    results = {}
+    for name, func in (("BeautifulSoup x2", run_legacy), ("mention_parser", run_single_pass)):
+        best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+        results[name] = best
+        print("{nm:<18} {us:8.1f} us/mention".format(nm=name, us=best / count * 1000000))
+
+    print("speedup: {sp:.1f}x".format(sp=results["BeautifulSoup x2"] / results["mention_parser"]))
+
+    # 解析結果の差異確認
+    for payload in PAYLOADS:
+        parsed = parse_mention_content(payload)
+        print("{url:<5} {cn} {txt!r}".format(url=str(legacy_check_include_url(payload)), cn=parsed.cn_link, txt=parsed.text[:40]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""bench_replay.py
+    リプライ処理のリプレイベンチマーク
+    Mastodon、OpenAI API、MySQLの代替実装を用いて、Stream.on_notificationへ通知を指定レートで投入し、
+    スループット、返信までの処理時間、1通知あたりのSQL実行回数を計測する。
+    リポジトリ直下で python -m benchmarks.bench_replay として実行する。
+"""
+import argparse
+import configparser
+import copy
+import json
+import os
+import time
+
+import tiktoken
+
+from answer_cache import AnswerCache
+from canned_response import CannedResponder
+from benchmarks.mention_payloads import MASTODON_PAYLOADS, MISSKEY_PAYLOADS
+from benchmarks.replay_fakes import FakeChatCompletion, FakeDatabaseManager, FakeMastodon, FakeOpenAI
+from config_file_setting import SetConfigFileData
+from conversation_cache import ConversationCache
+from cost_ledger import CostLedger
+import generate_toots
+from logger_utils import Logger
+from mastodon_service import Stream
+from mention_validator import ServerFilter
+from metrics import MetricsRegistry
+from rate_limiter import RateLimiter
+from reply_writer import ReplyWriter
+from single_flight import SingleFlight
+from sql_catalog import SqlCatalog
+from token_budget import TokenBudget
+from toot_sender import TootSender
+from worker_pool import WorkerPool
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ReplayContext:
+    """ApplicationContextの代替
+        外部サービスのクライアントのみ代替実装とし、それ以外は本番と同じクラスを用いる。
+    """
+    def __init__(self, config, mastodon, db_manager):
+        """コンストラクタ
+            Args:
+                config:外部設定ファイル保持データクラス
+                mastodon:FakeMastodonインスタンス
+                db_manager:FakeDatabaseManagerインスタンス
+        """
+        self.config = config
+        self.logger = Logger(config)
+        self.metrics = MetricsRegistry()
+        self.encoder = tiktoken.get_encoding('cl100k_base')
+        self.server_filter = ServerFilter(config)
+        self.mastodon = mastodon
+        self.post_mastodon = mastodon
+        self.db_manager = db_manager
+        self.reply_writer = ReplyWriter(db_manager, config.write_batch_size, config.write_flush_interval, self.logger)
+        self.reply_writer.start()
+        self.cost_ledger = CostLedger(db_manager, config.cost_reconcile_interval, self.logger,
+                                      pending_cost = self.reply_writer.pending_cost)
+        self.rate_limiter = RateLimiter(db_manager,
+                                        config.receive_interval,
+                                        burst = config.rate_limit_burst,
+                                        refill_interval = config.rate_limit_refill_interval,
+                                        max_users = config.rate_limit_max_users)
+        self.answer_cache = AnswerCache(self, db_manager, self.logger)
+        self.single_flight = SingleFlight()
+        self.canned_responder = CannedResponder(config, self.logger)
+        self.conversations = ConversationCache(self)
+        self.token_budget = TokenBudget(self)
+        self.toot_sender = TootSender(self)
+        self.toot_sender.start()
+
+    def close(self):
+        """終了処理
+        """
+        self.toot_sender.close(self.config.timeout_interval)
+        self.reply_writer.close(self.config.write_flush_interval)
+        self.logger.close()
+
+
+def load_config(args):
+    """ベンチマーク用設定
+        Config_example.iniを読み込み、ベンチマーク用の値で上書きする。
+        Args:
+            args:コマンドライン引数
+        Return:
+            ConfigFileEntity
+    """
+    parser = configparser.ConfigParser()
+    parser.read(os.path.join(ROOT_DIR, 'Config_example.ini'), 'UTF-8')
+    overrides = {
+        'LogSetting': {'file_nm_base': 'bench', 'log_level': args.log_level,
+                       'metrics_port': '0', 'metrics_summary_interval': '0'},
+        'DBSetting': {'sql_auto_reload': 'False'},
+        'BotSetting': {'account_id': 'nandemo',
+                       'permission_server': 'https://mstdn.example,https://misskey.example',
+                       'worker_count': str(args.workers),
+                       'post_workers': str(args.post_workers),
+                       'queue_size': str(args.queue_size),
+                       'cost_limit': '1000'},
+        'chatGPTSetting': {'chatgpt_model': 'gpt-3.5-turbo',
+                           'temperature': '0.7',
+                           'role_system_content': 'あなたはなんでもおしえる君です。関西弁で答えてください。',
+                           'answer_cache_size': str(args.answer_cache_size),
+                           'coalesce_requests': str(not args.no_coalesce),
+                           'answer_cache_persistent': 'False',
+                           'stream_response': str(args.stream)},
+    }
+    for section, values in overrides.items():
+        for key, value in values.items():
+            parser[section][key] = value
+
+    loader = SetConfigFileData()
+    loader.config = parser
+    return loader.load_config_datas()
+
+
+def synthetic_notifications(count, users):
+    """合成通知生成
+        mention_payloadsの本文をMastodon、Misskeyのアカウントから交互に受信した形式にする。
+        Args:
+            count:通知数
+            users:送信元アカウント数
+        Return:
+            通知のリスト
+    """
+    payloads = [("https://mstdn.example", html) for html in MASTODON_PAYLOADS] + \
+               [("https://misskey.example", html) for html in MISSKEY_PAYLOADS]
+    notifications = []
+    for num in range(count):
+        server, html = payloads[num % len(payloads)]
+        username = "user{n}".format(n=num % users)
+        notifications.append({
+            'type': 'mention',
+            'status': {
+                'id': str(num),
+                'content': html,
+                'visibility': 'public',
+                'mentions': [{'acct': 'nandemo'}] * max(1, html.count('u-url mention')),
+                'account': {'username': username, 'acct': username},
+                'uri': server + "/users/" + username + "/statuses/" + str(num),
+            },
+        })
+    return notifications
+
+
+def recorded_notifications(path, count):
+    """記録済み通知読込
+        1行1通知(Mastodon APIの通知のJSON)のファイルを読み込む。status IDは投入順の連番に置き換える。
+        Args:
+            path:ファイルパス
+            count:通知数。ファイルの件数を超える場合は繰り返す
+        Return:
+            通知のリスト
+    """
+    with open(path, encoding='utf-8') as f:
+        recorded = [json.loads(line) for line in f if line.strip()]
+    recorded = [notif for notif in recorded if notif.get('type') == 'mention']
+    if not recorded:
+        raise ValueError("mentionの通知がありません。" + path)
+
+    notifications = []
+    for num in range(count):
+        notif = copy.deepcopy(recorded[num % len(recorded)])
+        notif['status']['id'] = str(num)
+        notifications.append(notif)
+    return notifications
+
+
+def percentile(values, q):
+    """パーセンタイル
+        Args:
+            values:昇順の計測値
+            q:0～100
+        Return:
+            計測値。計測値がない場合None
+    """
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def run(args):
+    """ベンチマーク実行
+        Args:
+            args:コマンドライン引数
+        Return:
+            計測結果
+    """
+    config = load_config(args)
+    mastodon = FakeMastodon(args.post_latency, args.post_rate_limit, args.post_rate_window)
+    catalog = SqlCatalog(config)
+    db_manager = FakeDatabaseManager(catalog, query_latency=args.db_latency)
+    llm = FakeChatCompletion(args.llm_latency, args.llm_sigma, args.llm_error_rate, args.answer_length, args.seed)
+    generate_toots.openai = FakeOpenAI(llm)
+
+    context = ReplayContext(config, mastodon, db_manager)
+    worker_pool = WorkerPool(config.worker_count, config.queue_size, context.logger)
+    stream = Stream(context, worker_pool)
+
+    if args.input:
+        notifications = recorded_notifications(args.input, args.count)
+    else:
+        notifications = synthetic_notifications(args.count, args.users or args.count)
+
+    # 起動時の読込(コスト集計、トークン単価)は計測対象外とする
+    db_manager.query_cnt.clear()
+    worker_pool.start()
+
+    submitted = {}
+    started = time.perf_counter()
+    for num, notif in enumerate(notifications):
+        if args.rate > 0:
+            wait = started + num / args.rate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        submitted[str(notif['status']['id'])] = time.perf_counter()
+        stream.on_notification(notif)
+
+    # 処理待ち、処理中の通知がなくなるまで待機
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline:
+        stats = worker_pool.stats()
+        if stats["depth"] == 0 and stats["running"] == 0 and context.toot_sender.stats()["active_count"] == 0:
+            break
+        time.sleep(0.01)
+    worker_pool.shutdown(config.timeout_interval)
+    context.close()
+
+    latencies = []
+    finished = started
+    for status_id, replies in mastodon.replies.items():
+        replied_at = max(at for at, _ in replies)
+        latencies.append(replied_at - submitted[status_id])
+        finished = max(finished, replied_at)
+    latencies.sort()
+    elapsed = finished - started
+    query_total = sum(db_manager.query_cnt.values())
+
+    summary = context.metrics.summary()
+    return {
+        "mentions": len(notifications),
+        "replied": len(latencies),
+        "dropped": len(notifications) - len(latencies),
+        "elapsed": elapsed,
+        "mentions_per_sec": len(latencies) / elapsed if elapsed > 0 else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "db_queries_per_mention": query_total / len(notifications) if notifications else None,
+        "db_queries": dict(sorted(db_manager.query_cnt.items())),
+        "llm_calls": llm.call_cnt,
+        "llm_errors": llm.error_cnt,
+        "counters": summary["counters"],
+        "timings": summary["timings"],
+    }
+
+
+def main():
+    """ベンチマーク実行
+    """
+    arg_parser = argparse.ArgumentParser(description="リプライ処理のリプレイベンチマーク")
+    arg_parser.add_argument("--count", type=int, default=500, help="投入する通知数")
+    arg_parser.add_argument("--rate", type=float, default=0.0, help="1秒あたりの投入数。0の場合は待機せずに投入する")
+    arg_parser.add_argument("--users", type=int, default=None, help="送信元アカウント数。未指定時は通知ごとに別のアカウントとする")
+    arg_parser.add_argument("--input", help="記録済み通知(1行1通知のJSON)のファイル")
+    arg_parser.add_argument("--workers", type=int, default=4, help="ワーカースレッド数")
+    arg_parser.add_argument("--queue-size", type=int, default=1000, help="処理待ちの通知数の上限")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.8, help="OpenAI APIの応答時間の中央値(秒)")
+    arg_parser.add_argument("--llm-sigma", type=float, default=0.5, help="OpenAI APIの応答時間のばらつき")
+    arg_parser.add_argument("--llm-error-rate", type=float, default=0.01, help="OpenAI APIのエラー発生割合")
+    arg_parser.add_argument("--answer-length", type=int, default=300, help="回答文の文字数")
+    arg_parser.add_argument("--no-coalesce", action="store_true", help="同じ質問の同時呼び出しを集約しない")
+    arg_parser.add_argument("--answer-cache-size", type=int, default=0, help="回答キャッシュの保持件数")
+    arg_parser.add_argument("--stream", action="store_true", help="生成文をストリーミングで受信し、区切れた分から返信する")
+    arg_parser.add_argument("--post-latency", type=float, default=0.05, help="1投稿あたりの処理時間(秒)")
+    arg_parser.add_argument("--post-workers", type=int, default=4, help="返信の送信スレッド数")
+    arg_parser.add_argument("--post-rate-limit", type=int, default=10000, help="投稿のレート制限の上限回数")
+    arg_parser.add_argument("--post-rate-window", type=float, default=300.0, help="投稿のレート制限のリセット間隔(秒)")
+    arg_parser.add_argument("--db-latency", type=float, default=0.002, help="1SQLあたりの処理時間(秒)")
+    arg_parser.add_argument("--drain-timeout", type=float, default=300.0, help="処理完了の待機上限(秒)")
+    arg_parser.add_argument("--log-level", default="INFO", help="ログレベル")
+    arg_parser.add_argument("--seed", type=int, default=None, help="乱数のシード")
+    arg_parser.add_argument("--json", action="store_true", help="計測結果をJSONで出力する")
+    args = arg_parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    def ms(value):
+        return "-" if value is None else "{v:.1f}ms".format(v=value * 1000)
+
+    print("mentions         {mn} (replied {rp}, dropped {dr})".format(mn=result["mentions"], rp=result["replied"], dr=result["dropped"]))
+    print("throughput       {tp:.1f} mentions/sec".format(tp=result["mentions_per_sec"] or 0.0))
+    print("latency          p50 {p50}  p95 {p95}  p99 {p99}".format(p50=ms(result["latency_p50"]),
+                                                                   p95=ms(result["latency_p95"]),
+                                                                   p99=ms(result["latency_p99"])))
+    print("db queries       {qp:.2f} /mention {qs}".format(qp=result["db_queries_per_mention"] or 0.0, qs=result["db_queries"]))
+    print("llm              {cl} calls, {er} errors".format(cl=result["llm_calls"], er=result["llm_errors"]))
+    for name, value in result["counters"].items():
+        print("  {nm:<40} {val}".format(nm=name, val=value))
+    for name, timing in result["timings"].items():
+        print("  {nm:<40} n={cn:<6} p50 {p50}  p95 {p95}".format(nm=name, cn=timing["count"], p50=ms(timing["p50"]), p95=ms(timing["p95"])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""mention_payloads.py
+    ベンチマーク用のリプライ本文(HTML)
+    Mastodon、Misskeyから受信する通知のstatus.contentの形式に合わせている。
+"""
+
+MASTODON_PAYLOADS = [
+    # 1行の質問
+    '<p><span class="h-card" translate="no"><a href="https://mstdn.example/@nandemo" class="u-url mention">@<span>nandemo</span></a></span> おすすめの本は?</p>',
+    # 改行を含む質問
+    '<p><span class="h-card" translate="no"><a href="https://mstdn.example/@nandemo" class="u-url mention">@<span>nandemo</span></a></span> 明日の予定を立てたい<br />朝は何時に起きるのがいい?<br>理由も教えて</p>',
+    # 段落を含む質問
+    '<p><span class="h-card" translate="no"><a href="https://mstdn.example/@nandemo" class="u-url mention">@<span>nandemo</span></a></span> 質問です。</p><p>Pythonでリストを逆順にする方法は?</p>',
+    # URLを含む質問
+    '<p><span class="h-card" translate="no"><a href="https://mstdn.example/@nandemo" class="u-url mention">@<span>nandemo</span></a></span> この記事を要約して <a href="https://news.example/articles/12345" target="_blank" rel="nofollow noopener noreferrer" translate="no"><span class="invisible">https://</span><span class="ellipsis">news.example/articles/1</span><span class="invisible">2345</span></a></p>',
+    # ハッシュタグを含む質問
+    '<p><span class="h-card" translate="no"><a href="https://mstdn.example/@nandemo" class="u-url mention">@<span>nandemo</span></a></span> <a href="https://mstdn.example/tags/%E3%81%8A%E3%81%BF%E3%81%8F%E3%81%98" class="mention hashtag" rel="tag">#<span>おみくじ</span></a> 今日の運勢は?</p>',
+    # 複数アカウントへのメンション
+    '<p><span class="h-card" translate="no"><a href="https://mstdn.example/@nandemo" class="u-url mention">@<span>nandemo</span></a></span> <span class="h-card" translate="no"><a href="https://other.example/@friend" class="u-url mention">@<span>friend</span></a></span> 2人に質問です &amp; よろしく</p>',
+    # おみくじ
+    '<p><span class="h-card" translate="no"><a href="https://mstdn.example/@nandemo" class="u-url mention">@<span>nandemo</span></a></span> おみくじ</p>',
+    # 未入力
+    '<p><span class="h-card" translate="no"><a href="https://mstdn.example/@nandemo" class="u-url mention">@<span>nandemo</span></a></span></p>',
+]
+
+MISSKEY_PAYLOADS = [
+    # 1行の質問
+    '<p><a href="https://mstdn.example/@nandemo" class="u-url mention">@nandemo@mstdn.example</a> おすすめの映画を教えて</p>',
+    # 改行を含む質問
+    '<p><a href="https://mstdn.example/@nandemo" class="u-url mention">@nandemo@mstdn.example</a> 夕飯のメニューを考えて<br>材料は鶏肉と玉ねぎ<br>30分以内で作りたい</p>',
+    # 装飾を含む質問
+    '<p><a href="https://mstdn.example/@nandemo" class="u-url mention">@nandemo@mstdn.example</a> <b>太字</b>と<i>斜体</i>の違いは?</p>',
+    # URLを含む質問
+    '<p><a href="https://mstdn.example/@nandemo" class="u-url mention">@nandemo@mstdn.example</a> <a href="https://misskey.example/notes/9abc">https://misskey.example/notes/9abc</a> これ何?</p>',
+    # 長文の質問
+    '<p><a href="https://mstdn.example/@nandemo" class="u-url mention">@nandemo@mstdn.example</a> ' + 'とても長い質問文です。' * 40 + '</p>',
+]
+
+PAYLOADS = MASTODON_PAYLOADS + MISSKEY_PAYLOADS
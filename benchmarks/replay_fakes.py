@@ -0,0 +1,404 @@
+"""replay_fakes.py
+    リプレイベンチマーク用の代替実装
+    Mastodon、OpenAI API、MySQLの代わりに、メモリ上で動作するクライアントを提供する。
+"""
+import collections
+import contextlib
+import datetime
+import random
+import threading
+import time
+
+from database_manager import row_class
+
+
+class FakeMastodon:
+    """Mastodonクライアントの代替
+        status_reply、status_postの呼び出しを記録する。
+        レート制限の応答ヘッダ相当の値(ratelimit_remaining、ratelimit_reset)は、rate_limit回/rate_window秒で更新する。
+    """
+    def __init__(self, post_latency=0.0, rate_limit=300, rate_window=300.0):
+        """コンストラクタ
+            Args:
+                post_latency:1投稿あたりの待機秒数
+                rate_limit:レート制限の上限回数
+                rate_window:レート制限のリセット間隔(秒)
+        """
+        self.post_latency = float(post_latency)
+        self.rate_window = float(rate_window)
+        self.ratelimit_limit = int(rate_limit)
+        self.ratelimit_remaining = int(rate_limit)
+        self.ratelimit_reset = time.time() + self.rate_window
+        self.__lock = threading.Lock()
+        # 返信先status ID -> 投稿時刻(time.perf_counter)のリスト
+        self.replies = collections.defaultdict(list)
+        # 投稿したstatus ID -> スレッドの起点の通知のstatus ID
+        self.__thread_root = {}
+        self.__posted_cnt = 0
+        self.posts = []
+
+    def status_reply(self, to_status, status, *args, **kwargs):
+        """返信
+            返信への返信(スレッド)は、スレッドの起点の通知のstatus IDで記録する。
+            Args:
+                to_status:返信先status
+                status:本文
+            Return:
+                投稿したstatus
+        """
+        return self.status_post(status, in_reply_to_id=to_status['id'])
+
+    def status_post(self, status, in_reply_to_id=None, *args, **kwargs):
+        """投稿
+            Args:
+                status:本文
+                in_reply_to_id:返信先status ID
+            Return:
+                投稿したstatus
+        """
+        if self.post_latency > 0:
+            time.sleep(self.post_latency)
+        with self.__lock:
+            now = time.time()
+            if now >= self.ratelimit_reset:
+                self.ratelimit_remaining = self.ratelimit_limit
+                self.ratelimit_reset = now + self.rate_window
+            self.ratelimit_remaining = max(0, self.ratelimit_remaining - 1)
+
+            self.__posted_cnt += 1
+            posted_id = "post-" + str(self.__posted_cnt)
+            if in_reply_to_id is None:
+                self.posts.append((time.perf_counter(), status))
+            else:
+                root_id = self.__thread_root.get(str(in_reply_to_id), str(in_reply_to_id))
+                self.replies[root_id].append((time.perf_counter(), status))
+                self.__thread_root[posted_id] = root_id
+        return {'id': posted_id, 'content': status}
+
+    def replied_ids(self):
+        """返信済みのstatus ID
+            Return:
+                status IDの集合
+        """
+        with self.__lock:
+            return set(self.replies)
+
+
+class FakeCompletion(dict):
+    """ChatCompletionのレスポンスの代替
+        openaiのOpenAIObjectと同様に、属性とキーの両方で参照できる。
+    """
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakeChatCompletion:
+    """ChatCompletionの代替
+        応答時間は対数正規分布、エラーは指定した割合で発生させる。
+        stream=Trueの場合は、応答時間のうちFIRST_TOKEN_RATIOの経過後から残りの時間をかけて、回答文を分割して返す。
+    """
+    # ストリーミング時の最初の断片までの時間の割合
+    FIRST_TOKEN_RATIO = 0.2
+    # ストリーミング時の1断片の文字数
+    STREAM_PIECE_LENGTH = 5
+
+    def __init__(self, latency=0.8, sigma=0.5, error_rate=0.0, answer_length=300, seed=None):
+        """コンストラクタ
+            Args:
+                latency:応答時間の中央値(秒)
+                sigma:応答時間のばらつき(対数正規分布のσ)
+                error_rate:エラーの発生割合
+                answer_length:回答文の文字数
+                seed:乱数のシード
+        """
+        self.latency = float(latency)
+        self.sigma = float(sigma)
+        self.error_rate = float(error_rate)
+        self.answer_length = int(answer_length)
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.call_cnt = 0
+        self.error_cnt = 0
+
+    def create(self, **params):
+        """同期呼び出し
+            Args:
+                params:リクエストパラメータ
+            Return:
+                FakeCompletion
+        """
+        delay, failed = self.__draw()
+        if params.get("stream"):
+            return self.__stream(params, failed, delay)
+        time.sleep(delay)
+        return self.__response(params, failed)
+
+    async def acreate(self, **params):
+        """非同期呼び出し
+            Args:
+                params:リクエストパラメータ
+            Return:
+                FakeCompletion
+        """
+        import asyncio
+
+        delay, failed = self.__draw()
+        if params.get("stream"):
+            return self.__astream(params, failed, delay)
+        await asyncio.sleep(delay)
+        return self.__response(params, failed)
+
+    def __stream(self, params, failed, delay):
+        """ストリーミングレスポンス生成
+            Args:
+                params:リクエストパラメータ
+                failed:エラーを発生させる場合True
+                delay:応答時間
+            Return:
+                断片のイテレータ
+        """
+        pieces = self.__pieces(params)
+        time.sleep(delay * self.FIRST_TOKEN_RATIO)
+        if failed:
+            raise RuntimeError("fake OpenAI API error")
+        interval = delay * (1 - self.FIRST_TOKEN_RATIO) / max(1, len(pieces))
+        for piece in pieces:
+            yield piece
+            time.sleep(interval)
+
+    async def __astream(self, params, failed, delay):
+        """ストリーミングレスポンス生成(非同期)
+            Args:
+                params:リクエストパラメータ
+                failed:エラーを発生させる場合True
+                delay:応答時間
+            Return:
+                断片の非同期イテレータ
+        """
+        import asyncio
+
+        pieces = self.__pieces(params)
+        await asyncio.sleep(delay * self.FIRST_TOKEN_RATIO)
+        if failed:
+            raise RuntimeError("fake OpenAI API error")
+        interval = delay * (1 - self.FIRST_TOKEN_RATIO) / max(1, len(pieces))
+        for piece in pieces:
+            yield piece
+            await asyncio.sleep(interval)
+
+    def __pieces(self, params):
+        """ストリーミングの断片生成
+            Args:
+                params:リクエストパラメータ
+            Return:
+                FakeCompletionのリスト
+        """
+        answer = self.__answer(params)
+        return [FakeCompletion(choices=[FakeCompletion(delta=FakeCompletion(content=answer[i:i + self.STREAM_PIECE_LENGTH]))])
+                for i in range(0, len(answer), self.STREAM_PIECE_LENGTH)]
+
+    def __answer(self, params):
+        """回答文生成
+            Args:
+                params:リクエストパラメータ
+            Return:
+                回答文
+        """
+        length = min(self.answer_length, int(params.get("max_tokens") or self.answer_length))
+        return ("なんでもおしえるで。" * (length // 10 + 1))[:length]
+
+    def __draw(self):
+        """応答時間、エラー有無の抽選
+            Return:
+                待機秒数, エラー有無
+        """
+        with self.__lock:
+            self.call_cnt += 1
+            delay = self.__random.lognormvariate(0.0, self.sigma) * self.latency if self.latency > 0 else 0.0
+            failed = self.__random.random() < self.error_rate
+            if failed:
+                self.error_cnt += 1
+        return delay, failed
+
+    def __response(self, params, failed):
+        """レスポンス生成
+            Args:
+                params:リクエストパラメータ
+                failed:エラーを発生させる場合True
+            Return:
+                FakeCompletion
+        """
+        if failed:
+            raise RuntimeError("fake OpenAI API error")
+
+        answer = self.__answer(params)
+        length = len(answer)
+        prompt_chars = sum(len(message["content"]) for message in params["messages"])
+        return FakeCompletion(
+            choices=[FakeCompletion(message=FakeCompletion(role="assistant", content=answer))],
+            usage=FakeCompletion(prompt_tokens=prompt_chars, completion_tokens=length, total_tokens=prompt_chars + length),
+        )
+
+
+class FakeOpenAI:
+    """openaiモジュールの代替
+        generate_toots.openaiを差し替えて用いる。
+    """
+    def __init__(self, chat_completion):
+        """コンストラクタ
+            Args:
+                chat_completion:FakeChatCompletionインスタンス
+        """
+        self.ChatCompletion = chat_completion
+        self.api_key = None
+
+
+class FakeDatabaseManager:
+    """DatabaseManagerの代替
+        AIB_T_REPLY_SENTENSE、AIB_M_TOKEN_COEF、AIB_T_ANSWER_CACHE、AIB_T_COST_DAILYをメモリ上に保持し(AIB_T_OUTBOUND_REPLYは保持しない)、
+        SQLファイルごとの実行回数を記録する。パラメータ数は本番と同じSqlCatalogで検証する。
+    """
+    def __init__(self, catalog, input_cost=0.0015, output_cost=0.002, query_latency=0.0):
+        """コンストラクタ
+            Args:
+                catalog:SqlCatalogインスタンス
+                input_cost:入力1000トークンあたりの単価
+                output_cost:出力1000トークンあたりの単価
+                query_latency:1SQLあたりの待機秒数
+        """
+        self.catalog = catalog
+        self.query_latency = float(query_latency)
+        self.prices = (input_cost, output_cost)
+        self.replies = {}
+        self.answer_cache = {}
+        self.cost_daily = {}
+        self.rejection_daily = {}
+        self.query_cnt = collections.Counter()
+        # トランザクション中も同じスレッドからSQLを実行できるようにする
+        self.__lock = threading.RLock()
+
+    @contextlib.contextmanager
+    def session(self):
+        """セッション取得
+        """
+        yield self
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """トランザクション取得
+        """
+        with self.__lock:
+            yield self
+
+    def fetch_one(self, sqlfile, *args, as_tuple=False):
+        """SELECT実行メソッド(1行取得)
+        """
+        columns, values = self.__run(sqlfile, args)
+        if values is None:
+            return None
+        return tuple(values) if as_tuple else row_class(columns)(values)
+
+    def fetch_scalar(self, sqlfile, *args):
+        """SELECT実行メソッド(単一値取得)
+        """
+        row = self.fetch_one(sqlfile, *args, as_tuple=True)
+        return None if row is None else row[0]
+
+    def fetch_iter(self, sqlfile, *args, as_tuple=False, batch_size=None):
+        """SELECT実行メソッド(逐次取得)
+        """
+        row = self.fetch_one(sqlfile, *args, as_tuple=as_tuple)
+        if row is not None:
+            yield row
+
+    def exec_query(self, sqlfile, *args):
+        """INSERT/UPDATE/DELETE実行メソッド
+        """
+        return self.__run(sqlfile, args)[1]
+
+    def exec_many(self, sqlfile, rows):
+        """一括INSERT実行メソッド
+        """
+        return sum(self.__run(sqlfile, row, count=(i == 0))[1] for i, row in enumerate(rows))
+
+    def pool_stats(self):
+        """コネクションプール統計情報取得
+        """
+        return {"query_count": sum(self.query_cnt.values())}
+
+    def close(self):
+        """終了処理
+        """
+
+    def __run(self, sqlfile, args, count=True):
+        """SQL実行
+            Args:
+                sqlfile:SQLファイル名
+                args:SQLパラメータ
+                count:実行回数に数える場合True
+            Return:
+                列名, 結果(SELECTの場合は1行分の値、更新系の場合は処理件数)
+        """
+        self.catalog.get(sqlfile).bind(args)
+        if count and self.query_latency > 0:
+            time.sleep(self.query_latency)
+
+        with self.__lock:
+            if count:
+                self.query_cnt[sqlfile] += 1
+
+            if sqlfile == "SQL_001.sql":
+                total = sum(row[0] for key, row in self.cost_daily.items() if key[0] == args[0])
+                return ("API_COST",), (total,)
+
+            if sqlfile == "SQL_002.sql":
+                times = [ts for (id_user, ts) in self.replies if id_user == args[0]]
+                return ("RECENT_POST_TIME",), (max(times) if times else None,)
+
+            if sqlfile == "SQL_004.sql":
+                return ("INPUT_COST", "OUTPUT_COST"), self.prices
+
+            if sqlfile == "SQL_006.sql":
+                entry = self.answer_cache.get(args[0])
+                if entry is None or entry[2] <= datetime.datetime.now():
+                    return ("ANSWER", "COST"), None
+                return ("ANSWER", "COST"), entry[:2]
+
+            if sqlfile == "SQL_007.sql":
+                key, _, answer, cost, ttl = args
+                self.answer_cache[key] = (answer, cost, datetime.datetime.now() + datetime.timedelta(seconds=int(ttl)))
+                return None, 1
+
+            if sqlfile == "SQL_009.sql":
+                return None, 1
+
+            if sqlfile == "SQL_010.sql":
+                return ("REPLY_KEY",), None
+
+            if sqlfile == "SQL_028.sql":
+                current = self.cost_daily.setdefault(tuple(args[:3]), [0.0, 0, 0, 0])
+                for index, value in enumerate(args[3:]):
+                    current[index] += value
+                return None, 1
+
+            if sqlfile == "SQL_033.sql":
+                key = (args[0], args[1])
+                self.rejection_daily[key] = self.rejection_daily.get(key, 0) + args[2]
+                return None, 1
+
+            if sqlfile == "SQL_008.sql":
+                key = (args[0], args[1])
+                current = self.replies.get(key)
+                if current is None:
+                    self.replies[key] = list(args)
+                    return None, 1
+                for index in (3, 4, 5):
+                    if args[index] is not None:
+                        current[index] = args[index]
+                current[7] = args[7]
+                return None, 2
+
+        raise ValueError("代替DBが未対応のSQLファイルです。" + sqlfile)
@@ -0,0 +1,320 @@
+"""canned_response.py
+    定型文の返信
+    キーワードと回答文の組(ルール)を起動時にメモリ上へ読み込み、質問文を1回走査して該当するルールを判定する。
+    該当した場合はDB、OpenAI APIを呼び出さずに、ルールの回答文から抽選した文を返信する。
+"""
+import bisect
+import configparser
+import dataclasses
+import datetime
+import itertools
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from typing import List
+
+
+JST = datetime.timezone(datetime.timedelta(hours=9), 'JST')
+
+# ルールファイルの更新確認間隔(秒)
+RELOAD_CHECK_INTERVAL = 1.0
+
+# 回答文の重み指定(「重み|回答文」)
+WEIGHT_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\|(.*)$")
+# 回答文の置換変数
+TEMPLATE_PATTERN = re.compile(r"\{(acct|date|time|weekday)\}")
+
+WEEKDAYS = "月火水木金土日"
+
+
+class CannedResponseError(Exception):
+    """定型文ルールエラー
+        ルールファイルの欠落、内容不正時に送出する。
+    """
+
+
+@dataclasses.dataclass
+class CannedRule:
+    """データエンティティ
+        定型文ルール保持用エンティティクラス
+    """
+    name: str
+    keywords: List[str]
+    # 回答文のテンプレート
+    responses: List[str]
+    # 重みの累積値。responsesと同じ順序
+    cum_weights: List[float]
+    # 質問文がこの文字数を超える場合は該当としない。0の場合は制限なし
+    max_length: int = 0
+
+    def choose(self, rand):
+        """回答文抽選
+            Args:
+                rand:random.Randomインスタンス
+            Return:
+                回答文のテンプレート
+        """
+        return self.responses[bisect.bisect_right(self.cum_weights, rand.random() * self.cum_weights[-1])]
+
+
+class KeywordMatcher:
+    """キーワード照合
+        Aho-Corasick法のオートマトンを構築し、質問文を1回走査して全キーワードを照合する。
+    """
+    def __init__(self, keywords):
+        """コンストラクタ
+            Args:
+                keywords:(キーワード, ルール番号)のリスト
+        """
+        # 状態ごとの遷移、失敗時の遷移先、該当するルール番号
+        self.__goto = [{}]
+        self.__fail = [0]
+        self.__output = [set()]
+
+        for keyword, rule_no in keywords:
+            state = 0
+            for char in keyword:
+                next_state = self.__goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.__goto)
+                    self.__goto[state][char] = next_state
+                    self.__goto.append({})
+                    self.__fail.append(0)
+                    self.__output.append(set())
+                state = next_state
+            self.__output[state].add(rule_no)
+
+        # 幅優先で失敗時の遷移先を設定する
+        queue = list(self.__goto[0].values())
+        for state in queue:
+            for char, next_state in self.__goto[state].items():
+                queue.append(next_state)
+                fail = self.__fail[state]
+                while fail and char not in self.__goto[fail]:
+                    fail = self.__fail[fail]
+                self.__fail[next_state] = self.__goto[fail].get(char, 0)
+                self.__output[next_state] |= self.__output[self.__fail[next_state]]
+
+    def search(self, text):
+        """照合
+            Args:
+                text:質問文(正規化済み)
+            Return:
+                該当したルール番号の集合
+        """
+        matched = set()
+        state = 0
+        for char in text:
+            while state and char not in self.__goto[state]:
+                state = self.__fail[state]
+            state = self.__goto[state].get(char, 0)
+            if self.__output[state]:
+                matched |= self.__output[state]
+        return matched
+
+
+class CannedResponder:
+    """定型文の返信
+        プロセス内で1インスタンスを生成し、Streamで共有する。
+        ルールファイル、回答文ファイルの更新日時が変わった場合は再読込する。再読込に失敗した場合は読込済みのルールを使い続ける。
+    """
+    def __init__(self, config, logger=None, seed=None):
+        """コンストラクタ
+            Args:
+                config:外部設定ファイル保持データクラス
+                logger:ロガーインスタンス
+                seed:抽選の乱数のシード
+        """
+        self.base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.path = self.__resolve(config.canned_response_path)
+        self.logger = logger
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__rules = []
+        self.__matcher = KeywordMatcher([])
+        # 読み込んだファイル -> 更新日時
+        self.__mtimes = {}
+        self.__checked_at = time.monotonic()
+        self.load()
+
+    def load(self):
+        """ルールファイル読込
+            ルールファイルがない場合は、定型文の返信を行わない。
+        """
+        if not os.path.isfile(self.path):
+            if self.logger is not None:
+                self.logger.warning("定型文のルールファイルが存在しません。" + self.path)
+            rules, mtimes = [], {self.path: None}
+        else:
+            rules, mtimes = self.__read_rules()
+
+        matcher = KeywordMatcher([(keyword, rule_no) for rule_no, rule in enumerate(rules) for keyword in rule.keywords])
+        with self.__lock:
+            self.__rules = rules
+            self.__matcher = matcher
+            self.__mtimes = mtimes
+
+    def match(self, content, acct):
+        """定型文判定
+            複数のルールに該当した場合は、ルールファイルで先に定義したルールを優先する。
+            Args:
+                content:質問文
+                acct:返信先アカウント
+            Return:
+                ルール名, 返信文。該当しない場合None
+        """
+        self.__reload_if_modified()
+
+        with self.__lock:
+            rules = self.__rules
+            matcher = self.__matcher
+        if not rules:
+            return None
+
+        text = normalize(content)
+        for rule_no in sorted(matcher.search(text)):
+            rule = rules[rule_no]
+            if rule.max_length and len(text.strip()) > rule.max_length:
+                continue
+            with self.__lock:
+                template = rule.choose(self.__random)
+            return rule.name, render(template, acct)
+        return None
+
+    def rule_names(self):
+        """読込済みルール名一覧
+            Return:
+                ルール名のリスト
+        """
+        with self.__lock:
+            return [rule.name for rule in self.__rules]
+
+    def __reload_if_modified(self):
+        """更新日時による再読込
+            RELOAD_CHECK_INTERVAL秒に1回、読み込んだファイルの更新日時を確認する。
+        """
+        now = time.monotonic()
+        with self.__lock:
+            if now - self.__checked_at < RELOAD_CHECK_INTERVAL:
+                return
+            self.__checked_at = now
+            mtimes = dict(self.__mtimes)
+
+        if all(_getmtime(path) == mtime for path, mtime in mtimes.items()):
+            return
+        try:
+            self.load()
+            if self.logger is not None:
+                self.logger.info("定型文のルールファイルを再読込しました。")
+        except (OSError, configparser.Error, CannedResponseError) as e:
+            if self.logger is not None:
+                self.logger.error("定型文のルールファイルの再読込に失敗しました。" + str(e))
+            # 同じ内容で再読込を繰り返さないよう、更新日時は記録する
+            with self.__lock:
+                self.__mtimes = {path: _getmtime(path) for path in mtimes}
+
+    def __read_rules(self):
+        """ルール読込
+            Return:
+                CannedRuleのリスト, 読み込んだファイルと更新日時
+        """
+        mtimes = {self.path: _getmtime(self.path)}
+        parser = configparser.ConfigParser(interpolation=None)
+        with open(self.path, encoding='utf-8') as f:
+            parser.read_file(f)
+
+        rules = []
+        for name in parser.sections():
+            section = parser[name]
+            keywords = [normalize(keyword).strip() for keyword in section.get('keywords', '').split(',')]
+            keywords = [keyword for keyword in keywords if keyword]
+            if not keywords:
+                raise CannedResponseError("キーワードが未設定です。" + name)
+
+            lines = [line for line in section.get('responses', '').splitlines() if line.strip()]
+            if section.get('responses_file'):
+                path = self.__resolve(section['responses_file'])
+                mtimes[path] = _getmtime(path)
+                with open(path, encoding='utf-8') as f:
+                    lines += [line.rstrip('\r\n') for line in f if line.strip()]
+            if not lines:
+                raise CannedResponseError("回答文が未設定です。" + name)
+
+            responses, weights = zip(*(_parse_response(line) for line in lines))
+            if sum(weights) <= 0:
+                raise CannedResponseError("回答文の重みが不正です。" + name)
+            rules.append(CannedRule(name=name,
+                                    keywords=keywords,
+                                    responses=list(responses),
+                                    cum_weights=list(itertools.accumulate(weights)),
+                                    max_length=section.getint('max_length', 0)))
+        return rules, mtimes
+
+    def __resolve(self, path):
+        """パス解決
+            相対パスはbotの配置ディレクトリを起点とする。
+            Args:
+                path:ファイルパス
+            Return:
+                絶対パス
+        """
+        return path if os.path.isabs(path) else os.path.join(self.base_dir, path)
+
+
+def normalize(text):
+    """照合用の正規化
+        全角英数字、半角カナの表記揺れと大文字小文字を吸収する。
+        Args:
+            text:文字列
+        Return:
+            正規化した文字列
+    """
+    return unicodedata.normalize('NFKC', str(text)).casefold()
+
+
+def render(template, acct):
+    """回答文編集
+        {acct}、{date}、{time}、{weekday}を置換し、\nを改行にする。それ以外の{}はそのまま返信する。
+        Args:
+            template:回答文のテンプレート
+            acct:返信先アカウント
+        Return:
+            返信文
+    """
+    now = datetime.datetime.now(JST)
+    values = {
+        "acct": str(acct),
+        "date": "{y}年{m}月{d}日".format(y=now.year, m=now.month, d=now.day),
+        "time": now.strftime("%H:%M"),
+        "weekday": WEEKDAYS[now.weekday()],
+    }
+    return TEMPLATE_PATTERN.sub(lambda match: values[match.group(1)], template).replace('\\n', '\n')
+
+
+def _parse_response(line):
+    """回答文の解析
+        Args:
+            line:「重み|回答文」または「回答文」
+        Return:
+            回答文, 重み
+    """
+    match = WEIGHT_PATTERN.match(line.strip())
+    if match is None:
+        return line.strip(), 1.0
+    return match.group(2).strip(), float(match.group(1))
+
+
+def _getmtime(path):
+    """更新日時取得
+        Args:
+            path:ファイルパス
+        Return:
+            更新日時。ファイルがない場合None
+    """
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
@@ -6,7 +6,7 @@ import configparser
 import dataclasses
 import decimal
 import os
-from typing import List
+from typing import List, Optional
 
 
 @dataclasses.dataclass
@@ -16,10 +16,24 @@ class ConfigFileEntity:
     """
     file_nm_base: str
     file_save_dir: str
+    log_level: str
+    log_format: str
+    log_backup_count: int
+    metrics_host: str
+    metrics_port: int
+    metrics_summary_interval: float
     dbname :str
     user : str
     password : str
     sql_file_dir : str
+    sql_auto_reload : bool
+    pool_size : int
+    pool_timeout : float
+    write_batch_size : int
+    write_flush_interval : float
+    history_months_ahead : int
+    history_retention_months : int
+    history_archive : bool
     account_id: str
     client_id: str
     client_secret: str
@@ -30,14 +44,45 @@ class ConfigFileEntity:
     visibility_private: str
     visibility_direct: str
     receive_interval : int
+    rate_limit_burst : int
+    rate_limit_refill_interval : Optional[float]
+    rate_limit_max_users : int
     timeout_interval : int
-    cost_limit : decimal
+    stream_silence_timeout : int
+    backfill_max_pages : int
+    worker_count : int
+    queue_size : int
+    async_max_in_flight : int
+    post_workers : int
+    post_max_retries : int
+    post_retry_wait : float
+    post_rate_reserve : int
+    job_lease_seconds : int
+    job_max_attempts : int
+    job_retry_wait : float
+    job_poll_interval : float
+    job_retention_days : int
+    cost_limit : decimal.Decimal
+    cost_reconcile_interval : int
     permission_server : List[str]
+    block_server : List[str]
     api_key: str
     chatgpt_model: str
     temperature: float
     role_system_content: str
-    lottery_path: str
+    answer_cache_size: int
+    answer_cache_ttl: int
+    answer_cache_persistent: bool
+    max_answer_tokens: int
+    stream_response: bool
+    stream_chunk_length: int
+    coalesce_requests: bool
+    min_answer_tokens: int
+    conversation_mode: bool
+    conversation_max_tokens: int
+    conversation_max_turns: int
+    conversation_cache_size: int
+    canned_response_path: str
 
 class SetConfigFileData:
     """外部設定ファイル設定
@@ -55,37 +100,96 @@ class SetConfigFileData:
             外部設定ファイルを読み込み、設定する。
         """
         try:
-            # 内容設定
-            return ConfigFileEntity(
-                                    file_nm_base = str(self.config['LogSetting']['file_nm_base']),
-                                    file_save_dir = str(self.config['LogSetting']['file_save_dir']),
-                                    dbname = str(self.config['DBSetting']['dbname']),
-                                    user = str(self.config['DBSetting']['user']),
-                                    password = str(self.config['DBSetting']['password']),
-                                    sql_file_dir = str(self.config['DBSetting']['sql_file_dir']),
-                                    account_id = str(self.config['BotSetting']['account_id']),
-                                    client_id = str(self.config['BotSetting']['client_id']),
-                                    client_secret = str(self.config['BotSetting']['client_secret']),
-                                    access_token = str(self.config['BotSetting']['access_token']),
-                                    api_base_url = str(self.config['BotSetting']['api_base_url']),
-                                    visibility_public = str(self.config['BotSetting']['visibility_public']),
-                                    visibility_unlisted = str(self.config['BotSetting']['visibility_unlisted']),
-                                    visibility_private = str(self.config['BotSetting']['visibility_private']),
-                                    visibility_direct = str(self.config['BotSetting']['visibility_direct']),
-                                    receive_interval = str(self.config['BotSetting']['receive_interval']),
-                                    timeout_interval = str(self.config['BotSetting']['timeout_interval']),
-                                    cost_limit = str(self.config['BotSetting']['cost_limit']),
-                                    permission_server = str(self.config['BotSetting']['permission_server']).split(","),
-                                    api_key = str(self.config['chatGPTSetting']['api_key']),
-                                    chatgpt_model = str(self.config['chatGPTSetting']['chatgpt_model']),
-                                    temperature = str(self.config['chatGPTSetting']['temperature']),
-                                    role_system_content = str(self.config['chatGPTSetting']['role_system_content']),
-                                    lottery_path = str(self.config['EasterEgg']['lottery_path']),
-                                    )
+            return self.load_config_datas()
 
         except Exception as e:
             print("Configファイル設定エラー" + str(e))
             exit()
+
+    def load_config_datas(self):
+        """外部設定ファイル変換
+            設定値を型変換してエンティティに設定する。設定値が不正な場合は例外を送出する。
+            Return:
+                ConfigFileEntity
+        """
+        log_setting = self.config['LogSetting']
+        db_setting = self.config['DBSetting']
+        bot_setting = self.config['BotSetting']
+        gpt_setting = self.config['chatGPTSetting']
+        refill_interval = bot_setting.get('rate_limit_refill_interval', '').strip()
+
+        # 内容設定
+        return ConfigFileEntity(
+                                file_nm_base = str(log_setting['file_nm_base']),
+                                file_save_dir = str(log_setting['file_save_dir']),
+                                log_level = log_setting.get('log_level', 'DEBUG').strip().upper(),
+                                log_format = log_setting.get('log_format', 'text').strip().lower(),
+                                log_backup_count = log_setting.getint('log_backup_count', 0),
+                                metrics_host = log_setting.get('metrics_host', '127.0.0.1').strip(),
+                                metrics_port = log_setting.getint('metrics_port', 0),
+                                metrics_summary_interval = log_setting.getfloat('metrics_summary_interval', 300.0),
+                                dbname = str(db_setting['dbname']),
+                                user = str(db_setting['user']),
+                                password = str(db_setting['password']),
+                                sql_file_dir = str(db_setting['sql_file_dir']),
+                                sql_auto_reload = db_setting.getboolean('sql_auto_reload', False),
+                                pool_size = db_setting.getint('pool_size', 5),
+                                pool_timeout = db_setting.getfloat('pool_timeout', 10.0),
+                                write_batch_size = db_setting.getint('write_batch_size', 50),
+                                write_flush_interval = db_setting.getfloat('write_flush_interval', 5.0),
+                                history_months_ahead = db_setting.getint('history_months_ahead', 3),
+                                history_retention_months = db_setting.getint('history_retention_months', 0),
+                                history_archive = db_setting.getboolean('history_archive', True),
+                                account_id = str(bot_setting['account_id']),
+                                client_id = str(bot_setting['client_id']),
+                                client_secret = str(bot_setting['client_secret']),
+                                access_token = str(bot_setting['access_token']),
+                                api_base_url = str(bot_setting['api_base_url']),
+                                visibility_public = str(bot_setting['visibility_public']),
+                                visibility_unlisted = str(bot_setting['visibility_unlisted']),
+                                visibility_private = str(bot_setting['visibility_private']),
+                                visibility_direct = str(bot_setting['visibility_direct']),
+                                receive_interval = bot_setting.getint('receive_interval'),
+                                rate_limit_burst = bot_setting.getint('rate_limit_burst', 1),
+                                rate_limit_refill_interval = float(refill_interval) if refill_interval else None,
+                                rate_limit_max_users = bot_setting.getint('rate_limit_max_users', 10000),
+                                timeout_interval = bot_setting.getint('timeout_interval'),
+                                stream_silence_timeout = bot_setting.getint('stream_silence_timeout', 60),
+                                backfill_max_pages = bot_setting.getint('backfill_max_pages', 25),
+                                worker_count = bot_setting.getint('worker_count', 4),
+                                queue_size = bot_setting.getint('queue_size', 100),
+                                async_max_in_flight = bot_setting.getint('async_max_in_flight', 200),
+                                post_workers = bot_setting.getint('post_workers', 4),
+                                post_max_retries = bot_setting.getint('post_max_retries', 5),
+                                post_retry_wait = bot_setting.getfloat('post_retry_wait', 2.0),
+                                post_rate_reserve = bot_setting.getint('post_rate_reserve', 10),
+                                job_lease_seconds = bot_setting.getint('job_lease_seconds', 120),
+                                job_max_attempts = bot_setting.getint('job_max_attempts', 3),
+                                job_retry_wait = bot_setting.getfloat('job_retry_wait', 10.0),
+                                job_poll_interval = bot_setting.getfloat('job_poll_interval', 1.0),
+                                job_retention_days = bot_setting.getint('job_retention_days', 7),
+                                cost_limit = decimal.Decimal(bot_setting['cost_limit']),
+                                cost_reconcile_interval = bot_setting.getint('cost_reconcile_interval', 300),
+                                permission_server = [server.strip() for server in str(bot_setting['permission_server']).split(",") if server.strip()],
+                                block_server = [server.strip() for server in str(bot_setting.get('block_server', '')).split(",") if server.strip()],
+                                api_key = str(gpt_setting['api_key']),
+                                chatgpt_model = str(gpt_setting['chatgpt_model']),
+                                temperature = gpt_setting.getfloat('temperature'),
+                                role_system_content = str(gpt_setting['role_system_content']),
+                                answer_cache_size = gpt_setting.getint('answer_cache_size', 1000),
+                                answer_cache_ttl = gpt_setting.getint('answer_cache_ttl', 86400),
+                                answer_cache_persistent = gpt_setting.getboolean('answer_cache_persistent', False),
+                                max_answer_tokens = gpt_setting.getint('max_answer_tokens', 1000),
+                                stream_response = gpt_setting.getboolean('stream_response', False),
+                                stream_chunk_length = gpt_setting.getint('stream_chunk_length', 140),
+                                coalesce_requests = gpt_setting.getboolean('coalesce_requests', True),
+                                min_answer_tokens = gpt_setting.getint('min_answer_tokens', 50),
+                                conversation_mode = gpt_setting.getboolean('conversation_mode', False),
+                                conversation_max_tokens = gpt_setting.getint('conversation_max_tokens', 1000),
+                                conversation_max_turns = gpt_setting.getint('conversation_max_turns', 10),
+                                conversation_cache_size = gpt_setting.getint('conversation_cache_size', 1000),
+                                canned_response_path = self.config['EasterEgg'].get('canned_response_path', 'canned_responses.ini'),
+                                )
     
     def __read_config_file(self):
         """外部設定ファイル読み込み
@@ -0,0 +1,319 @@
+"""conversation_cache.py
+    会話の文脈キャッシュ
+    スレッドごとに直近の質問・回答をメモリ上に保持し、続けて返信された質問に会話の文脈を付けてAPIへ渡す。
+    スレッドの判定は通知のin_reply_to_idと、botが投稿したstatus IDの対応で行い、Mastodon APIは呼び出さない。
+    スレッドは質問者のacct(サーバーを含む)ごととし、他のアカウントの質問・回答は文脈に含めない。
+"""
+import collections
+import dataclasses
+import threading
+from typing import List
+
+
+# 1スレッドあたりのstatus IDの対応の保持件数(質問と、分割した返信の投稿)
+LINKS_PER_THREAD = 8
+# キャッシュにないスレッドの文脈をDBから取得する期間(時間)。投稿の対応(AIB_T_CONVERSATION_LINK)もこの期間保持する
+FALLBACK_HOURS = 24
+# 要約に含める質問1件あたりの最大文字数
+SUMMARY_QUESTION_LENGTH = 50
+# チャット形式のメッセージ1件あたりの付加トークン数
+TOKENS_PER_MESSAGE = 4
+
+
+@dataclasses.dataclass
+class Turn:
+    """データエンティティ
+        会話の1往復(質問・回答)保持用エンティティクラス
+    """
+    question: str
+    answer: str
+    # 質問・回答のメッセージのトークン数
+    tokens: int
+
+
+@dataclasses.dataclass
+class ConversationWindow:
+    """データエンティティ
+        APIへ渡す会話の文脈保持用エンティティクラス
+    """
+    messages: List[dict]
+    tokens: int
+
+
+class ConversationCache:
+    """会話の文脈キャッシュ
+        プロセス内で1インスタンスを生成し、Stream、GenerateToots、TootSenderで共有する。
+        スレッドはLRUでconversation_cache_size件まで、1スレッドあたりconversation_max_turns往復まで保持する。
+        botが投稿した返信とスレッドの対応はDB(AIB_T_CONVERSATION_LINK)にも登録し、再起動後等は返信先の投稿からスレッドを判定する。
+        APIへ渡す文脈はconversation_max_tokens以内とし、収まらない古い往復は質問のみの要約に置き換える。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.db_manager = context.db_manager
+        self.logger = context.logger
+        self.metrics = context.metrics
+        self.encoder = context.encoder
+        # スレッドキー -> 直近の往復(Turnのdeque)
+        self.__threads = collections.OrderedDict()
+        # スレッドキー -> 質問者のacct
+        self.__owners = {}
+        # 質問のstatus ID -> (質問者のacct, 質問の主キー)
+        self.__questions = collections.OrderedDict()
+        # status ID -> スレッドキー
+        self.__links = collections.OrderedDict()
+        # 質問の主キー -> 回答待ちの質問のスレッドキー
+        self.__pending = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        # 統計情報
+        self.__hit_cnt = 0
+        self.__fallback_cnt = 0
+        self.__new_cnt = 0
+        self.__trimmed_cnt = 0
+
+    @property
+    def config(self):
+        """外部設定ファイル保持データクラス
+            SIGHUPによる再読込を反映するため、contextから都度参照する。
+        """
+        return self.context.config
+
+    @property
+    def enabled(self):
+        """会話モード有効判定
+        """
+        return self.config.conversation_mode and self.config.conversation_max_tokens > 0
+
+    def begin(self, status, reply_record):
+        """質問受付
+            質問のスレッドを判定し、回答待ちとして登録する。
+            返信先がキャッシュにない場合は、返信先の投稿のスレッドの直近の質問・回答をDBから取得して文脈とする。
+            返信先が他のアカウントのスレッドの場合は、新しいスレッドとする。
+            Args:
+                status:質問のstatus
+                reply_record:登録した質問(ReplyRecord)
+        """
+        if not self.enabled:
+            return
+
+        status_id = str(status['id'])
+        parent_id = status.get('in_reply_to_id')
+        acct = str(status['account']['acct'])
+        with self.__lock:
+            thread_key = self.__links.get(str(parent_id)) if parent_id is not None else None
+            if thread_key is not None and thread_key in self.__threads and self.__owners.get(thread_key) == acct:
+                self.__threads.move_to_end(thread_key)
+                self.__hit_cnt += 1
+                source = "cache"
+            else:
+                thread_key = status_id
+                source = "none"
+
+        turns = []
+        if source == "none" and parent_id is not None:
+            # 再起動後、他のワーカーが回答したスレッド等
+            loaded = self.__load_turns(str(parent_id), acct, reply_record)
+            if loaded is not None:
+                thread_key, turns = loaded
+                source = "db"
+                with self.__lock:
+                    self.__fallback_cnt += 1
+        self.metrics.inc("conversation_context_total", source=source)
+
+        with self.__lock:
+            if source != "cache":
+                self.__new_cnt += 1
+                self.__threads[thread_key] = collections.deque(turns, maxlen=max(1, self.config.conversation_max_turns))
+                self.__owners[thread_key] = acct
+                self.__evict()
+            self.__put_link(status_id, thread_key)
+            self.__questions[status_id] = (acct, reply_record.key)
+            self.__pending[reply_record.key] = thread_key
+            while len(self.__pending) > self.config.conversation_cache_size:
+                # 回答できなかった質問は古いものから破棄する
+                self.__pending.popitem(last=False)
+            while len(self.__questions) > self.config.conversation_cache_size:
+                self.__questions.popitem(last=False)
+
+    def history(self, reply_record):
+        """文脈取得
+            Args:
+                reply_record:beginで登録した質問(ReplyRecord)
+            Return:
+                ConversationWindow。文脈がない場合None
+        """
+        if not self.enabled:
+            return None
+
+        with self.__lock:
+            thread_key = self.__pending.get(reply_record.key)
+            turns = list(self.__threads.get(thread_key, ()))
+        if not turns:
+            return None
+
+        # 新しい往復から順に、トークン数の上限まで含める
+        budget = self.config.conversation_max_tokens
+        kept = []
+        used = 0
+        for turn in reversed(turns):
+            if used + turn.tokens > budget:
+                break
+            kept.append(turn)
+            used += turn.tokens
+        kept.reverse()
+
+        messages = []
+        for turn in kept:
+            messages.append({"role": "user", "content": turn.question})
+            messages.append({"role": "assistant", "content": turn.answer})
+
+        dropped = turns[:len(turns) - len(kept)]
+        if dropped:
+            with self.__lock:
+                self.__trimmed_cnt += 1
+            summary = self.__summarize(dropped, budget - used)
+            if summary is not None:
+                messages.insert(0, summary.messages[0])
+                used += summary.tokens
+        if not messages:
+            return None
+        return ConversationWindow(messages=messages, tokens=used)
+
+    def complete(self, reply_record, answer):
+        """回答登録
+            回答待ちの質問と回答を、スレッドの直近の往復に追加する。
+            Args:
+                reply_record:beginで登録した質問(ReplyRecord)
+                answer:回答文
+        """
+        if not self.enabled:
+            return
+
+        with self.__lock:
+            thread_key = self.__pending.pop(reply_record.key, None)
+        if thread_key is None:
+            return
+
+        turn = self.__make_turn(reply_record.cm_question, answer)
+        with self.__lock:
+            turns = self.__threads.get(thread_key)
+            if turns is not None:
+                turns.append(turn)
+                self.__threads.move_to_end(thread_key)
+
+    def link(self, status_id, posted_id):
+        """投稿の対応登録
+            botが投稿した返信を、返信先の質問と同じスレッドとする。
+            Args:
+                status_id:返信先の質問のstatus ID
+                posted_id:投稿した返信のstatus ID
+        """
+        if not self.enabled:
+            return
+
+        with self.__lock:
+            thread_key = self.__links.get(str(status_id))
+            question = self.__questions.get(str(status_id))
+            if thread_key is not None:
+                self.__put_link(str(posted_id), thread_key)
+        if thread_key is None or question is None:
+            return
+
+        acct, (id_user, ts_question) = question
+        try:
+            self.db_manager.exec_query("SQL_040.sql", str(posted_id), thread_key, acct, id_user, ts_question)
+        except Exception as e:
+            # 再起動後はこの返信へ続けた質問の文脈を取得できない
+            self.logger.error("会話のスレッドの登録に失敗しました。" + str(e))
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                保持スレッド数、文脈の取得元別件数
+        """
+        with self.__lock:
+            return {
+                "thread_count": len(self.__threads),
+                "pending_count": len(self.__pending),
+                "hit_count": self.__hit_cnt,
+                "fallback_count": self.__fallback_cnt,
+                "new_count": self.__new_cnt,
+                "trimmed_count": self.__trimmed_cnt,
+            }
+
+    def __load_turns(self, parent_id, acct, reply_record):
+        """直近の往復のDB取得
+            返信先の投稿が同じacctのスレッドのものである場合のみ取得する。
+            Args:
+                parent_id:返信先のstatus ID
+                acct:質問者のacct
+                reply_record:登録した質問(ReplyRecord)
+            Return:
+                スレッドキー, Turnのリスト(古い順)。返信先のスレッドがない場合None
+        """
+        try:
+            rows = list(self.db_manager.fetch_iter("SQL_027.sql", parent_id, acct, reply_record.ts_question,
+                                                   reply_record.ts_question, FALLBACK_HOURS,
+                                                   max(1, self.config.conversation_max_turns)))
+        except Exception as e:
+            # 文脈なしで回答する
+            self.logger.error("会話の文脈の取得に失敗しました。" + str(e))
+            return None
+        if not rows:
+            return None
+        return str(rows[0].ID_THREAD), [self.__make_turn(row.QUESTION, row.ANSWER) for row in reversed(rows)]
+
+    def __make_turn(self, question, answer):
+        """往復生成
+            Args:
+                question:質問文
+                answer:回答文
+            Return:
+                Turn
+        """
+        question = str(question)
+        answer = str(answer)
+        tokens = (len(self.encoder.encode(question)) + len(self.encoder.encode(answer))
+                  + TOKENS_PER_MESSAGE * 2)
+        return Turn(question=question, answer=answer, tokens=tokens)
+
+    def __summarize(self, turns, budget):
+        """要約
+            文脈に収まらない古い往復を、質問のみを並べた1件のメッセージにまとめる。
+            APIは呼び出さず、収まらない場合は古い質問から省く。
+            Args:
+                turns:要約する往復(古い順)
+                budget:要約に使えるトークン数
+            Return:
+                ConversationWindow。収まらない場合None
+        """
+        questions = [turn.question[:SUMMARY_QUESTION_LENGTH] for turn in turns]
+        while questions:
+            content = "これまでの質問:" + " / ".join(questions)
+            tokens = len(self.encoder.encode(content)) + TOKENS_PER_MESSAGE
+            if tokens <= budget:
+                return ConversationWindow(messages=[{"role": "system", "content": content}], tokens=tokens)
+            questions.pop(0)
+        return None
+
+    def __put_link(self, status_id, thread_key):
+        """status IDの対応登録(__lock取得済みで呼び出す)
+            Args:
+                status_id:status ID
+                thread_key:スレッドキー
+        """
+        self.__links[status_id] = thread_key
+        self.__links.move_to_end(status_id)
+        while len(self.__links) > self.config.conversation_cache_size * LINKS_PER_THREAD:
+            self.__links.popitem(last=False)
+
+    def __evict(self):
+        """スレッドの破棄(__lock取得済みで呼び出す)
+            保持件数を超えた場合、最も古く参照されたスレッドから破棄する。
+        """
+        while len(self.__threads) > max(1, self.config.conversation_cache_size):
+            thread_key, _ = self.__threads.popitem(last=False)
+            self.__owners.pop(thread_key, None)
@@ -0,0 +1,260 @@
+"""cost_ledger.py
+    実行日のAPIコスト集計
+    起動時、日付変更時にDBから集計値を読み込み、以降はメモリ上で加算する。
+    API呼び出し前に見積もりコストを予約し、呼び出し中の分も含めて上限を超えないようにする。
+"""
+import dataclasses
+import datetime
+import threading
+import time
+
+
+JST = datetime.timezone(datetime.timedelta(hours=9), 'JST')
+
+
+def today_jst():
+    """現在日付(JST)
+        日次集計、パーティション等の日付はホスト、DBのタイムゾーンによらずJSTで判定する。
+        Return:
+            日付
+    """
+    return datetime.datetime.now(JST).date()
+
+
+def now_jst():
+    """現在日時(JST)
+        質問・回答日時等、DBに登録する日時はホストのタイムゾーンによらずJSTとする。タイムゾーン情報は持たない。
+        Return:
+            日時
+    """
+    return datetime.datetime.now(JST).replace(tzinfo=None)
+
+
+@dataclasses.dataclass
+class CostReservation:
+    """データエンティティ
+        コスト予約保持用エンティティクラス
+    """
+    amount: float
+    # 予約した日付(JST)。日付をまたいで解放した場合も予約した日の予約額から差し引く
+    date: datetime.date
+
+
+class CostLedger:
+    """APIコスト集計
+        プロセス内で1インスタンスを生成し、Stream、GenerateTootsで共有する。
+        sharedの場合は、複数のワーカープロセスで共有する日次のコスト予算(AIB_T_COST_BUDGET)で予約、集計を行う。
+    """
+    def __init__(self, db_manager, reconcile_interval, logger=None, pending_cost=None, shared=False):
+        """コンストラクタ
+            Args:
+                db_manager:DatabaseManagerインスタンス
+                reconcile_interval:DBとの突き合わせ間隔(秒)
+                logger:ロガーインスタンス
+                pending_cost:DBへ未登録のコスト合計を返す関数
+                shared:複数プロセスでコスト予算を共有する場合True
+        """
+        self.db_manager = db_manager
+        # 共有時の予算はコスト確定時に加算するため、未登録分は考慮しない
+        self.pending_cost = None if shared else pending_cost
+        self.reconcile_interval = float(reconcile_interval)
+        self.logger = logger
+        self.shared = shared
+        self.__lock = threading.Lock()
+        self.__total = 0.0
+        self.__added = 0.0
+        # 自プロセスの予約額、共有時は全プロセスの予約額(突き合わせ時点)
+        self.__reserved = 0.0
+        self.__shared_reserved = 0.0
+        self.__date = self.__today()
+        # 共有時の予算行を登録済みの日付
+        self.__budget_date = None
+        self.__reconciled_at = 0.0
+        self.__reconciling = False
+        self.__seeded = False
+        self.reconcile()
+
+    def configure(self, reconcile_interval):
+        """設定変更
+            設定の再読込時に呼び出す。
+            Args:
+                reconcile_interval:DBとの突き合わせ間隔(秒)
+        """
+        self.reconcile_interval = float(reconcile_interval)
+
+    def add(self, cost):
+        """コスト加算
+            DB登録済みのコストを加算する。
+            Args:
+                cost:コスト
+        """
+        self.__rollover_if_needed()
+        with self.__lock:
+            self.__total += float(cost)
+            self.__added += float(cost)
+
+    def today(self):
+        """集計日付(JST)
+            日次集計(AIB_T_COST_DAILY、AIB_T_REJECTION_DAILY)へ加算する日付とする。
+            Return:
+                日付
+        """
+        self.__rollover_if_needed()
+        return self.__date
+
+    def current(self):
+        """実行日のAPIコスト取得
+            突き合わせ間隔を経過している場合はDBの集計値で補正する。
+            Return:
+                APIコスト
+        """
+        self.__rollover_if_needed()
+        if time.monotonic() - self.__reconciled_at >= self.reconcile_interval:
+            self.reconcile()
+        return self.__total
+
+    def available(self, cost_limit):
+        """残りコスト取得
+            Args:
+                cost_limit:1日あたりのコスト上限
+            Return:
+                上限までの残りコスト(予約中の分を除く)
+        """
+        current = self.current()
+        with self.__lock:
+            reserved = max(self.__reserved, self.__shared_reserved)
+        return float(cost_limit) - current - reserved
+
+    def reserve(self, amount, cost_limit):
+        """コスト予約
+            予約額を含めて上限を超えない場合のみ予約する。共有時はDB上で判定と予約を1回の更新で行う。
+            Args:
+                amount:予約額(見積もりコスト)
+                cost_limit:1日あたりのコスト上限
+            Return:
+                CostReservation。上限を超える場合None
+        """
+        self.__rollover_if_needed()
+        amount = float(amount)
+        if not self.shared:
+            current = self.current()
+            with self.__lock:
+                if current + self.__reserved + amount > float(cost_limit):
+                    return None
+                self.__reserved += amount
+                return CostReservation(amount=amount, date=self.__date)
+
+        date = self.__date
+        if not self.db_manager.exec_query("SQL_021.sql", amount, date, amount, float(cost_limit)):
+            # 他プロセスの予約、加算を取り込み、次回の見積もりに反映する
+            self.reconcile()
+            return None
+        with self.__lock:
+            self.__reserved += amount
+        return CostReservation(amount=amount, date=date)
+
+    def release(self, reservation, spent=0.0):
+        """コスト予約の解放
+            共有時は確定したコストを予算へ加算する。呼び出し元ごとの登録はaddで行う。
+            Args:
+                reservation:CostReservation
+                spent:確定したコスト。API呼び出しに失敗した場合0
+        """
+        if self.shared:
+            self.db_manager.exec_query("SQL_022.sql", reservation.amount, float(spent), reservation.date)
+        with self.__lock:
+            if reservation.date == self.__date:
+                self.__reserved = max(self.__reserved - reservation.amount, 0.0)
+
+    def is_over_limit(self, cost_limit):
+        """コスト上限チェック
+            Args:
+                cost_limit:1日あたりのコスト上限
+            Return:
+                True:上限超過
+                False:上限以内
+        """
+        return self.current() > float(cost_limit)
+
+    def reconcile(self):
+        """DB突き合わせ
+            DBから実行日のAPIコストを集計し直す。集計中に加算されたコストは引き継ぐ。
+        """
+        with self.__lock:
+            if self.__reconciling:
+                return
+            self.__reconciling = True
+            added_before = self.__added
+            date = self.__date
+
+        try:
+            # 未登録分は集計前に取得する(集計中に登録された分は二重に数え、少なく見積もらない)
+            pending = float(self.pending_cost()) if self.pending_cost is not None else 0.0
+            if self.shared:
+                db_total, shared_reserved = self.__read_budget(date)
+            else:
+                db_total, shared_reserved = self.db_manager.fetch_scalar("SQL_001.sql", date), 0.0
+        except Exception as e:
+            with self.__lock:
+                self.__reconciling = False
+                if not self.__seeded:
+                    # 起動時の読込失敗は呼び出し元に通知する
+                    raise
+                # 次回の確認時に再試行する
+                self.__reconciled_at = time.monotonic()
+            if self.logger is not None:
+                self.logger.error("APIコストの突き合わせに失敗しました。" + str(e))
+            return
+
+        with self.__lock:
+            self.__reconciling = False
+            if self.__date != date:
+                # 集計中に日付が変わった場合は結果を破棄し、次回の確認時に集計し直す
+                self.__reconciled_at = 0.0
+                return
+            self.__total = float(db_total or 0) + pending + (self.__added - added_before)
+            self.__shared_reserved = float(shared_reserved or 0)
+            self.__reconciled_at = time.monotonic()
+            self.__seeded = True
+
+    def __read_budget(self, date):
+        """共有予算の読込
+            日付ごとの予算行がない場合は、日次集計(AIB_T_COST_DAILY)の値で登録する。
+            Args:
+                date:日付(JST)
+            Return:
+                確定コスト, 全プロセスの予約額
+        """
+        if self.__budget_date != date:
+            self.db_manager.exec_query("SQL_019.sql", date, date)
+            self.__budget_date = date
+        row = self.db_manager.fetch_one("SQL_020.sql", date, as_tuple=True)
+        if row is None:
+            return 0.0, 0.0
+        return row
+
+    def __rollover_if_needed(self):
+        """日付変更処理
+            JSTで日付が変わった場合、DBから集計し直す。
+        """
+        today = self.__today()
+        if self.__date == today:
+            return
+
+        with self.__lock:
+            if self.__date == today:
+                return
+            # 前日分の加算は持ち越さない
+            self.__date = today
+            self.__total = 0.0
+            self.__added = 0.0
+            self.__reserved = 0.0
+            self.__shared_reserved = 0.0
+        self.reconcile()
+
+    def __today(self):
+        """現在日付(JST)
+            Return:
+                日付
+        """
+        return today_jst()
@@ -1,58 +1,579 @@
 """database_manager.py
     DB接続
-    クエリ実行処理を記載
+    コネクションプールの管理、クエリ実行処理を記載
 """
-import os
+import contextlib
+import functools
+import keyword
+import threading
+import time
 
 import MySQLdb
-import pandas as pd
+import MySQLdb.cursors
 
+from sql_catalog import SqlCatalog
 
-class DatabaseManager:
-    """データベースマネージャ
-        DB接続、クエリ実行を行うクラス
+
+# 接続断とみなすMySQLエラーコード(2006:MySQL server has gone away, 2013:Lost connection)
+RECONNECT_ERROR_CODES = (2006, 2013)
+
+# fetch_iterでサーバから一度に受け取る行数
+FETCH_BATCH_SIZE = 1000
+
+
+class Row:
+    """行データ
+        SELECT結果の1行を保持する。列名での属性参照、列名・列番号での添字参照ができる。
+        列の組み合わせごとに__slots__を持つサブクラスを生成して使用する。
     """
-    def __init__(self, conf, sqlfile):
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __init__(self, values):
+        """コンストラクタ
+            Args:
+                values:列値のタプル
+        """
+        for field, value in zip(self._fields, values):
+            setattr(self, field, value)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return getattr(self, self._fields[key])
+        return getattr(self, self._fields[self._index[key]])
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return "Row(" + ", ".join(name + "=" + repr(value) for name, value in zip(self._index, self)) + ")"
+
+    def as_tuple(self):
+        """タプル変換
+            Return:
+                列値のタプル
+        """
+        return tuple(self)
+
+
+@functools.lru_cache(maxsize=64)
+def row_class(columns):
+    """行クラス生成
+        列名の組み合わせに対応するRowのサブクラスを返す。
+        Args:
+            columns:列名のタプル
+        Return:
+            Rowのサブクラス
+    """
+    fields = tuple(name if name.isidentifier() and not keyword.iskeyword(name) and not name.startswith("_")
+                   else "_" + str(i) for i, name in enumerate(columns))
+    return type("Row", (Row,), {"__slots__": fields,
+                                "_fields": fields,
+                                "_index": {name: i for i, name in enumerate(columns)}})
+
+
+def _make_row(description, as_tuple):
+    """行変換関数取得
+        Args:
+            description:カーソルの列情報
+            as_tuple:タプルのまま返す場合True
+        Return:
+            行変換関数
+    """
+    if as_tuple:
+        return tuple
+    return row_class(tuple(column[0] for column in description))
+
+
+class ConnectionPool:
+    """コネクションプール
+        MySQLコネクションを上限数まで保持し、スレッド間で使い回す。
+    """
+    def __init__(self, conf):
         """コンストラクタ
             Args:
                 conf:外部設定ファイル
+        """
+        self.conf = conf
+        self.max_size = int(conf.pool_size)
+        self.timeout = float(conf.pool_timeout)
+        self.__idle = []
+        self.__size = 0
+        self.__cond = threading.Condition()
+        # 統計情報
+        self.__checkout_cnt = 0
+        self.__wait_cnt = 0
+        self.__wait_time_total = 0.0
+        self.__wait_time_max = 0.0
+        self.__reconnect_cnt = 0
+
+    def acquire(self):
+        """コネクション取得
+            空きコネクションを払い出す。上限に達している場合はpool_timeout秒まで待機する。
+            Return:
+                コネクション
+        """
+        started = time.monotonic()
+        waited = False
+        with self.__cond:
+            while not self.__idle and self.__size >= self.max_size:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise TimeoutError("コネクションプールの取得待ちがタイムアウトしました。")
+                self.__cond.wait(remaining)
+
+            if self.__idle:
+                connection = self.__idle.pop()
+            else:
+                connection = None
+                self.__size += 1
+
+            wait_time = time.monotonic() - started
+            self.__checkout_cnt += 1
+            if waited:
+                self.__wait_cnt += 1
+            self.__wait_time_total += wait_time
+            self.__wait_time_max = max(self.__wait_time_max, wait_time)
+
+        try:
+            if connection is None:
+                return self.__connect()
+            # 払い出し前のヘルスチェック
+            return self.__health_check(connection)
+        except Exception:
+            self.__discard_slot()
+            raise
+
+    def release(self, connection, broken=False):
+        """コネクション返却
+            Args:
+                connection:コネクション
+                broken:接続断等で再利用できない場合True
+        """
+        if broken:
+            self.__close(connection)
+            self.__discard_slot()
+            return
+
+        try:
+            # 未確定のトランザクションを残さない
+            connection.rollback()
+        except MySQLdb.Error:
+            self.__close(connection)
+            self.__discard_slot()
+            return
+
+        with self.__cond:
+            self.__idle.append(connection)
+            self.__cond.notify()
+
+    def reconnect(self, connection):
+        """再接続
+            接続断となったコネクションを破棄し、新しいコネクションに差し替える。
+            Args:
+                connection:接続断となったコネクション
+            Return:
+                新しいコネクション
+        """
+        self.__close(connection)
+        with self.__cond:
+            self.__reconnect_cnt += 1
+        return self.__connect()
+
+    def close_all(self):
+        """全コネクション切断
+            待機中のコネクションをすべて切断する。
+        """
+        with self.__cond:
+            idle, self.__idle = self.__idle, []
+            self.__size -= len(idle)
+            self.__cond.notify_all()
+        for connection in idle:
+            self.__close(connection)
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                プールサイズ、待機時間等の統計情報
+        """
+        with self.__cond:
+            return {
+                "max_size": self.max_size,
+                "size": self.__size,
+                "idle": len(self.__idle),
+                "in_use": self.__size - len(self.__idle),
+                "checkout_count": self.__checkout_cnt,
+                "wait_count": self.__wait_cnt,
+                "wait_time_total": self.__wait_time_total,
+                "wait_time_max": self.__wait_time_max,
+                "wait_time_avg": self.__wait_time_total / self.__checkout_cnt if self.__checkout_cnt else 0.0,
+                "reconnect_count": self.__reconnect_cnt,
+            }
+
+    def __connect(self):
+        """新規接続
+            Return:
+                コネクション
+        """
+        return MySQLdb.connect(host="localhost",port=3306,
+                               user=self.conf.user,
+                               passwd=self.conf.password,
+                               db=self.conf.dbname,
+                               charset="utf8"
+                               )
+
+    def __health_check(self, connection):
+        """ヘルスチェック
+            pingに失敗した場合は再接続したコネクションを返す。
+            Args:
+                connection:コネクション
+            Return:
+                利用可能なコネクション
+        """
+        try:
+            connection.ping()
+            return connection
+        except MySQLdb.Error:
+            self.__close(connection)
+            with self.__cond:
+                self.__reconnect_cnt += 1
+            return self.__connect()
+
+    def __discard_slot(self):
+        """プール枠の解放
+        """
+        with self.__cond:
+            self.__size -= 1
+            self.__cond.notify()
+
+    def __close(self, connection):
+        """コネクション切断
+            Args:
+                connection:コネクション
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+class DatabaseSession:
+    """DBセッション
+        プールから払い出した1コネクション上で複数のSQLを実行する。
+    """
+    def __init__(self, pool, catalog, connection, autocommit=True, metrics=None):
+        """コンストラクタ
+            Args:
+                pool:コネクションプール
+                catalog:SQLカタログ
+                connection:コネクション
+                autocommit:SQL毎にコミットする場合True
+                metrics:MetricsRegistryインスタンス
+        """
+        self.pool = pool
+        self.metrics = metrics
+        self.catalog = catalog
+        self.connection = connection
+        self.autocommit = autocommit
+        self.broken = False
+        self.__executed = False
+
+    def fetch_one(self, sqlfile, *args, as_tuple=False):
+        """SELECT実行メソッド(1行取得)
+            Args:
                 sqlfile:実行SQLクエリファイル
+                args:SQLパラメータ
+                as_tuple:Rowではなくタプルで返す場合True
+            Return:
+                先頭行。該当行がない場合None
         """
-        self.connection = MySQLdb.connect(host="localhost",port=3306,
-                                          user=conf.user,
-                                          passwd=conf.password,
-                                          db=conf.dbname,
-                                          charset="utf8"
-                                          )
-        self.cursor = self.connection.cursor()
-        with open(os.path.dirname(os.path.abspath(__file__)) + conf.sql_file_dir + '/' +  sqlfile, "r") as file:
-            self.sql_query = file.read()
+        statement = self.catalog.get(sqlfile)
+        params = statement.bind(args)
+
+        def run():
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute(statement.query, params)
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                return _make_row(cursor.description, as_tuple)(row)
+            finally:
+                cursor.close()
 
-    def exec_select(self, *args):
-        """SELECT実行メソッド
+        return self.__execute(statement.name, run)
+
+    def fetch_scalar(self, sqlfile, *args):
+        """SELECT実行メソッド(単一値取得)
             Args:
+                sqlfile:実行SQLクエリファイル
                 args:SQLパラメータ
             Return:
-                実行結果
+                先頭行の先頭列。該当行がない場合None
         """
+        row = self.fetch_one(sqlfile, *args, as_tuple=True)
+        return None if row is None else row[0]
+
+    def fetch_iter(self, sqlfile, *args, as_tuple=False, batch_size=FETCH_BATCH_SIZE):
+        """SELECT実行メソッド(逐次取得)
+            サーバサイドカーソルを用い、結果を全件メモリに載せずに1行ずつ返す。
+            読み切るまで同一セッションで他のSQLは実行できない。
+            Args:
+                sqlfile:実行SQLクエリファイル
+                args:SQLパラメータ
+                as_tuple:Rowではなくタプルで返す場合True
+                batch_size:一度に受け取る行数
+            Return:
+                行のイテレータ
+        """
+        statement = self.catalog.get(sqlfile)
+        params = statement.bind(args)
+
+        def run():
+            cursor = self.connection.cursor(MySQLdb.cursors.SSCursor)
+            try:
+                cursor.execute(statement.query, params)
+            except Exception:
+                cursor.close()
+                raise
+            return cursor
+
+        cursor = self.__execute(statement.name, run)
         try:
-            df = pd.read_sql_query(self.sql_query, self.connection, params=(args))
-            return df
+            make_row = _make_row(cursor.description, as_tuple)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield make_row(row)
         finally:
-            self.cursor.close()
-            self.connection.close()
+            cursor.close()
 
-    def exec_query(self, *args):
+    def exec_query(self, sqlfile, *args):
         """INSERT/UPDATE/DELETE実行メソッド
             Args:
+                sqlfile:実行SQLクエリファイル
                 args:SQLパラメータ
             Return:
                 処理件数
         """
+        statement = self.catalog.get(sqlfile)
+        params = statement.bind(args)
+
+        def run():
+            cursor = self.connection.cursor()
+            try:
+                affected_rows = cursor.execute(statement.query, params)
+                if self.autocommit:
+                    self.connection.commit()
+                return affected_rows
+            finally:
+                cursor.close()
+
+        return self.__execute(statement.name, run)
+
+    def exec_many(self, sqlfile, rows):
+        """一括INSERT実行メソッド
+            INSERT文のVALUESが全てプレースホルダの場合、複数行を1文にまとめて実行する。
+            Args:
+                sqlfile:実行SQLクエリファイル
+                rows:行ごとのSQLパラメータのリスト
+            Return:
+                処理件数
+        """
+        statement = self.catalog.get(sqlfile)
+        params = [statement.bind(row) for row in rows]
+        if not params:
+            return 0
+
+        def run():
+            cursor = self.connection.cursor()
+            try:
+                affected_rows = cursor.executemany(statement.query, params)
+                if self.autocommit:
+                    self.connection.commit()
+                return affected_rows
+            finally:
+                cursor.close()
+
+        return self.__execute(statement.name, run)
+
+    def __execute(self, name, func):
+        """SQL実行
+            SQLファイルごとに処理時間を計測する。
+            Args:
+                name:SQLファイル名
+                func:実行処理
+            Return:
+                実行結果
+        """
+        if self.metrics is None:
+            return self.__execute_with_retry(func)
+
+        try:
+            with self.metrics.timer("sql_seconds", statement=name):
+                return self.__execute_with_retry(func)
+        except Exception:
+            self.metrics.inc("sql_errors_total", statement=name)
+            raise
+
+    def __execute_with_retry(self, func):
+        """SQL実行(再接続)
+            接続断を検知した場合、トランザクション外であれば再接続して1回だけ再実行する。
+            Args:
+                func:実行処理
+            Return:
+                実行結果
+        """
+        try:
+            result = func()
+            self.__executed = True
+            return result
+        except MySQLdb.OperationalError as e:
+            if e.args and e.args[0] in RECONNECT_ERROR_CODES:
+                if self.autocommit or not self.__executed:
+                    try:
+                        self.connection = self.pool.reconnect(self.connection)
+                    except Exception:
+                        self.broken = True
+                        raise
+                    result = func()
+                    self.__executed = True
+                    return result
+                # トランザクション途中の接続断は再実行できない
+                self.broken = True
+            raise
+
+
+class DatabaseManager:
+    """データベースマネージャ
+        コネクションプール、SQLカタログを保持し、クエリ実行を行うクラス
+        プロセス内で1インスタンスを生成し、各処理で共有する。
+    """
+    def __init__(self, conf, logger=None, metrics=None):
+        """コンストラクタ
+            SQLファイルの欠落、内容不正がある場合はSqlCatalogErrorを送出する。
+            Args:
+                conf:外部設定ファイル
+                logger:ロガーインスタンス
+                metrics:MetricsRegistryインスタンス
+        """
+        self.metrics = metrics
+        self.catalog = SqlCatalog(conf, logger)
+        self.pool = ConnectionPool(conf)
+
+    @contextlib.contextmanager
+    def session(self):
+        """セッション取得
+            1回のチェックアウトで複数のSQLを実行する。SQL毎にコミットを行う。
+        """
+        connection = self.pool.acquire()
+        session = DatabaseSession(self.pool, self.catalog, connection, metrics=self.metrics)
+        try:
+            yield session
+        except MySQLdb.OperationalError as e:
+            if e.args and e.args[0] in RECONNECT_ERROR_CODES:
+                session.broken = True
+            raise
+        finally:
+            self.pool.release(session.connection, broken=session.broken)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """トランザクション取得
+            1トランザクション内で複数のSQLを実行する。正常終了時にコミット、例外発生時にロールバックする。
+        """
+        connection = self.pool.acquire()
+        session = DatabaseSession(self.pool, self.catalog, connection, autocommit=False, metrics=self.metrics)
         try:
-            affected_rows = self.cursor.execute(self.sql_query, args)
-            self.connection.commit()
-            return affected_rows
+            yield session
+            session.connection.commit()
+        except Exception as e:
+            if isinstance(e, MySQLdb.OperationalError) and e.args and e.args[0] in RECONNECT_ERROR_CODES:
+                session.broken = True
+            else:
+                try:
+                    session.connection.rollback()
+                except MySQLdb.Error:
+                    session.broken = True
+            raise
         finally:
-            self.cursor.close()
-            self.connection.close()
\ No newline at end of file
+            self.pool.release(session.connection, broken=session.broken)
+
+    def fetch_one(self, sqlfile, *args, as_tuple=False):
+        """SELECT実行メソッド(1行取得)
+            Args:
+                sqlfile:実行SQLクエリファイル
+                args:SQLパラメータ
+                as_tuple:Rowではなくタプルで返す場合True
+            Return:
+                先頭行。該当行がない場合None
+        """
+        with self.session() as session:
+            return session.fetch_one(sqlfile, *args, as_tuple=as_tuple)
+
+    def fetch_scalar(self, sqlfile, *args):
+        """SELECT実行メソッド(単一値取得)
+            Args:
+                sqlfile:実行SQLクエリファイル
+                args:SQLパラメータ
+            Return:
+                先頭行の先頭列。該当行がない場合None
+        """
+        with self.session() as session:
+            return session.fetch_scalar(sqlfile, *args)
+
+    def fetch_iter(self, sqlfile, *args, as_tuple=False, batch_size=FETCH_BATCH_SIZE):
+        """SELECT実行メソッド(逐次取得)
+            読み切るか、イテレータをcloseするまでコネクションを占有する。
+            Args:
+                sqlfile:実行SQLクエリファイル
+                args:SQLパラメータ
+                as_tuple:Rowではなくタプルで返す場合True
+                batch_size:一度に受け取る行数
+            Return:
+                行のイテレータ
+        """
+        with self.session() as session:
+            yield from session.fetch_iter(sqlfile, *args, as_tuple=as_tuple, batch_size=batch_size)
+
+    def exec_query(self, sqlfile, *args):
+        """INSERT/UPDATE/DELETE実行メソッド
+            Args:
+                sqlfile:実行SQLクエリファイル
+                args:SQLパラメータ
+            Return:
+                処理件数
+        """
+        with self.session() as session:
+            return session.exec_query(sqlfile, *args)
+
+    def exec_many(self, sqlfile, rows):
+        """一括INSERT実行メソッド
+            Args:
+                sqlfile:実行SQLクエリファイル
+                rows:行ごとのSQLパラメータのリスト
+            Return:
+                処理件数
+        """
+        with self.session() as session:
+            return session.exec_many(sqlfile, rows)
+
+    def pool_stats(self):
+        """コネクションプール統計情報取得
+            Return:
+                統計情報
+        """
+        return self.pool.stats()
+
+    def close(self):
+        """終了処理
+            プール内のコネクションを切断する。
+        """
+        self.pool.close_all()
@@ -2,95 +2,623 @@
     OpenAI APIを用いて、質問に対する返答を生成する。
 """
 import asyncio
+import concurrent.futures
+import time
 
 import openai
-import tiktoken
 
-from logger_utils import Logger
-from config_file_setting import SetConfigFileData
-from database_manager import DatabaseManager
+from logger_utils import bind_context
+from token_budget import ANSWER_MAX_LENGTH
+from toot_chunker import TootChunker
 
 
 class GenerateToots:
     """GenerateToots
         APIに質問文を投げかけて、トゥートの生成を行う。
+        同じ質問のAPI呼び出しが実行中の場合は、その結果を待って回答する。コストは回答した人数で按分する。
+        会話の文脈を付けた質問は、回答キャッシュの参照・登録、呼び出しの集約を行わない。
     """
-    def __init__(self):
-        # 各インスタンス化
-        self.config_instance = SetConfigFileData()
-        self.config = self.config_instance.set_config_datas()
-        self.logger_instance = Logger(self.config)
-        openai.api_key = str(self.config.api_key)
-
-    async def process_wait(self, content, id):
+    # 残りコスト不足時の返答
+    OVER_BUDGET_MESSAGE = "今日はもうちょっと疲れたから、質問に答えるのはしんどいわ。でもおみくじやったらできるで。「おみくじ」って話しかけてや。"
+    # 規定時間以内に応答しない場合の返答
+    TIMEOUT_MESSAGE = "タイムアウトエラー。しばらく経ってから再度投稿してください。"
+    # ストリーミング中に規定時間を超えた場合の返答
+    STREAM_TIMEOUT_MESSAGE = "時間切れのため、回答を途中で打ち切りました。"
+
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        # 設定、ロガー等はプロセス内で共有するインスタンスを用いる
+        self.context = context
+        self.config = context.config
+        self.logger_instance = context.logger
+        self.encoder = context.encoder
+        self.cost_ledger = context.cost_ledger
+        self.answer_cache = context.answer_cache
+        self.token_budget = context.token_budget
+        self.reply_writer = context.reply_writer
+        self.single_flight = context.single_flight
+        self.conversations = context.conversations
+        self.metrics = context.metrics
+
+    async def process_wait(self, content, reply_record):
         """タイムアウトエラー処理
             規定時間以内に応答しない場合、タイムアウトエラーとする。
             Args:
                 content:リプライ
-                id:アカウントID
+                reply_record:登録した質問(ReplyRecord)
         """        
         try:
             loop = asyncio.get_event_loop()
-            result = await asyncio.wait_for(loop.run_in_executor(None, self.__gen_msg, content, id), timeout=int(self.config.timeout_interval))
+            result = await asyncio.wait_for(loop.run_in_executor(None, bind_context(self.__gen_msg), content, reply_record), timeout=self.config.timeout_interval)
             return result
 
         except asyncio.TimeoutError:
             # Timeoutが発生したとき
             self.logger_instance.critical("タイムアウトエラー")
-            return "タイムアウトエラー。しばらく経ってから再度投稿してください。"
+            self.metrics.inc("llm_requests_total", result="timeout")
+            return self.TIMEOUT_MESSAGE
         
-    def __gen_msg(self, content, id):
+    def __gen_msg(self, content, reply_record):
         """レスポンス生成
             OpenAI APIを用いて、返答生成
             Args:
                 content:リプライ
-                id:アカウントID
+                reply_record:登録した質問(ReplyRecord)
+            Returns:
+                response:返答
+        """
+        try:
+            # 会話の文脈取得
+            history = self.conversations.history(reply_record)
+
+            # 回答キャッシュ参照
+            response = self.__answer_from_cache(content, reply_record, history)
+            if response is not None:
+                return response
+
+            # 同じ質問の呼び出しが実行中の場合は、その結果を待つ
+            flight, leader = self.__join(content, history)
+            if not leader:
+                return self.__register_shared(reply_record, flight, self.__wait_shared(reply_record, flight))
+
+            plan = None
+            try:
+                # トークン見積もり
+                plan = self.__plan_tokens(content, history)
+                if plan is None:
+                    result = None
+                else:
+                    # OpenAIインスタンス化
+                    self.logger_instance.info("OpenAIインスタンス化")
+                    with self.metrics.timer("stage_seconds", stage="llm"):
+                        openAiInstance = openai.ChatCompletion.create(**self.__request_params(content, plan, history))
+                    result = self.__receive_msg(content, openAiInstance, plan, history is None)
+            except BaseException as e:
+                self.token_budget.release(plan)
+                self.__resolve(flight, error=e)
+                raise
+            self.__resolve(flight, result)
+            return self.__register_shared(reply_record, flight, result)
+
+        except (concurrent.futures.TimeoutError, asyncio.TimeoutError):
+            # 実行中の同じ質問の結果を待ちきれなかったとき
+            self.logger_instance.critical("タイムアウトエラー")
+            self.metrics.inc("llm_requests_total", result="timeout")
+            return self.TIMEOUT_MESSAGE
+
+        except Exception as e:
+            self.logger_instance.critical("文書生成に関してエラーが発生しました。" + str(e))
+            self.metrics.inc("llm_requests_total", result="error")
+            return "chatGPTでエラーが発生しました。"
+
+    async def process_async(self, content, reply_record, executor):
+        """レスポンス生成(非同期)
+            OpenAI APIを非同期で呼び出し、規定時間以内に応答しない場合はリクエストを取り消す。
+            DB更新はexecutor上で行う。
+            Args:
+                content:リプライ
+                reply_record:登録した質問(ReplyRecord)
+                executor:DB処理用のexecutor
             Returns:
                 response:返答
         """
         try:
-            # OpenAIインスタンス化
-            self.logger_instance.info("OpenAIインスタンス化")
-            openAiInstance = openai.ChatCompletion.create(
-                model=self.config.chatgpt_model,
-                temperature=float(self.config.temperature),
-                messages=[{"role": "system", "content": self.config.role_system_content},
-                          {"role": "user","content": content}]
-            )
+            loop = asyncio.get_running_loop()
+            # 会話の文脈取得
+            history = self.conversations.history(reply_record)
 
-            # 質問文のトークン数を取得
-            enc = tiktoken.get_encoding('cl100k_base')
-            input_tokens = len(enc.encode(content))
+            # 回答キャッシュ参照
+            response = await loop.run_in_executor(executor, bind_context(self.__answer_from_cache), content, reply_record, history)
+            if response is not None:
+                return response
 
-            # レスポンス受取、トークン数取得
-            response = openAiInstance.choices[0].message.content
-            output_tokens = len(enc.encode(response))
-            self.logger_instance.info("生成文：" + response)
+            # 同じ質問の呼び出しが実行中の場合は、その結果を待つ
+            flight, leader = self.__join(content, history)
+            if not leader:
+                result = await self.__wait_flight(reply_record, flight)
+                return await loop.run_in_executor(executor, bind_context(self.__register_shared), reply_record, flight, result)
 
-            # 回答文、コスト更新
-            self.__update_answer(id, response, float(input_tokens), float(output_tokens))
+            plan = None
+            try:
+                # トークン見積もり
+                plan = await loop.run_in_executor(executor, bind_context(self.__plan_tokens), content, history)
+                if plan is None:
+                    result = None
+                else:
+                    self.logger_instance.info("OpenAIインスタンス化")
+                    with self.metrics.timer("stage_seconds", stage="llm"):
+                        openAiInstance = await asyncio.wait_for(openai.ChatCompletion.acreate(**self.__request_params(content, plan, history)),
+                                                                timeout=self.config.timeout_interval)
+                    result = await loop.run_in_executor(executor, bind_context(self.__receive_msg), content, openAiInstance, plan, history is None)
+            except BaseException as e:
+                self.token_budget.release(plan)
+                self.__resolve(flight, error=e)
+                raise
+            self.__resolve(flight, result)
+            return await loop.run_in_executor(executor, bind_context(self.__register_shared), reply_record, flight, result)
 
-            return str(response)
+        except asyncio.TimeoutError:
+            # Timeoutが発生したとき
+            self.logger_instance.critical("タイムアウトエラー")
+            self.metrics.inc("llm_requests_total", result="timeout")
+            return self.TIMEOUT_MESSAGE
 
         except Exception as e:
             self.logger_instance.critical("文書生成に関してエラーが発生しました。" + str(e))
+            self.metrics.inc("llm_requests_total", result="error")
             return "chatGPTでエラーが発生しました。"
+
+    def process_stream(self, content, reply_record, acct, post):
+        """レスポンス生成(ストリーミング)
+            生成文をストリーミングで受信し、文末で区切れた分から順に返信する。
+            規定時間を超えた場合は、受信済みの分を返信して打ち切る。
+            同じ質問の呼び出しが実行中の場合は、その結果をまとめて返信する。
+            Args:
+                content:リプライ
+                reply_record:登録した質問(ReplyRecord)
+                acct:返信先アカウント
+                post:返信処理。返信文を受け取る関数
+        """
+        chunker = TootChunker(acct, self.config.stream_chunk_length)
+        parts = []
+        try:
+            # 会話の文脈取得
+            history = self.conversations.history(reply_record)
+
+            # 回答キャッシュ参照
+            response = self.__answer_from_cache(content, reply_record, history)
+            if response is not None:
+                self.__post_all(chunker, response, post)
+                return
+
+            # 同じ質問の呼び出しが実行中の場合は、その結果を待つ
+            flight, leader = self.__join(content, history)
+            if not leader:
+                try:
+                    result = self.__wait_shared(reply_record, flight)
+                except (concurrent.futures.TimeoutError, asyncio.TimeoutError):
+                    self.logger_instance.critical("タイムアウトエラー")
+                    self.metrics.inc("llm_requests_total", result="timeout")
+                    self.__post_all(chunker, self.TIMEOUT_MESSAGE, post)
+                    return
+                self.__post_all(chunker, self.__register_shared(reply_record, flight, result), post)
+                return
+
+            plan = None
+            try:
+                # トークン見積もり
+                plan = self.__plan_tokens(content, history)
+                if plan is None:
+                    self.__resolve(flight, None)
+                    self.__post_all(chunker, self.OVER_BUDGET_MESSAGE, post)
+                    return
+
+                self.logger_instance.info("OpenAIインスタンス化(ストリーミング)")
+                deadline = time.monotonic() + self.config.timeout_interval
+                timed_out = False
+                with self.metrics.timer("stage_seconds", stage="llm"):
+                    events = openai.ChatCompletion.create(stream=True,
+                                                          request_timeout=self.config.timeout_interval,
+                                                          **self.__request_params(content, plan, history))
+                    for event in events:
+                        delta = event.choices[0].delta.get("content")
+                        if delta:
+                            parts.append(delta)
+                            for chunk in chunker.feed(delta):
+                                post(chunk)
+                        if time.monotonic() > deadline:
+                            timed_out = True
+                            break
+
+                # ストリーミングではusageが返らないため、トークン数は再計算する
+                result = self.__settle(content, "".join(parts), None, plan, cacheable=not timed_out and history is None)
+            except BaseException as e:
+                self.token_budget.release(plan)
+                self.__resolve(flight, error=e)
+                raise
+            if timed_out:
+                # 途中で打ち切った回答は後続の呼び出し元へ返さず、コストも按分しない
+                self.__resolve(flight, error=asyncio.TimeoutError())
+            else:
+                self.__resolve(flight, result)
+
+            for chunk in chunker.flush():
+                post(chunk)
+            if timed_out:
+                self.logger_instance.critical("タイムアウトエラー")
+                self.metrics.inc("llm_requests_total", result="timeout")
+                post(self.STREAM_TIMEOUT_MESSAGE)
+            self.__register_shared(reply_record, None if timed_out else flight, result)
+
+        except Exception as e:
+            self.logger_instance.critical("文書生成に関してエラーが発生しました。" + str(e))
+            self.metrics.inc("llm_requests_total", result="error")
+            self.__post_error(chunker, post)
+
+    async def process_stream_async(self, content, reply_record, acct, post, executor):
+        """レスポンス生成(ストリーミング、非同期)
+            process_streamの非同期版。DB更新はexecutor上で行う。
+            Args:
+                content:リプライ
+                reply_record:登録した質問(ReplyRecord)
+                acct:返信先アカウント
+                post:返信処理。返信文を受け取るコルーチン関数
+                executor:DB処理用のexecutor
+        """
+        chunker = TootChunker(acct, self.config.stream_chunk_length)
+        parts = []
+        try:
+            loop = asyncio.get_running_loop()
+            # 会話の文脈取得
+            history = self.conversations.history(reply_record)
+
+            # 回答キャッシュ参照
+            response = await loop.run_in_executor(executor, bind_context(self.__answer_from_cache), content, reply_record, history)
+            if response is None:
+                # 同じ質問の呼び出しが実行中の場合は、その結果を待つ
+                flight, leader = self.__join(content, history)
+                if not leader:
+                    try:
+                        result = await self.__wait_flight(reply_record, flight)
+                    except asyncio.TimeoutError:
+                        self.logger_instance.critical("タイムアウトエラー")
+                        self.metrics.inc("llm_requests_total", result="timeout")
+                        response = self.TIMEOUT_MESSAGE
+                    else:
+                        response = await loop.run_in_executor(executor, bind_context(self.__register_shared), reply_record, flight, result)
+            if response is None:
+                # トークン見積もり
+                try:
+                    plan = await loop.run_in_executor(executor, bind_context(self.__plan_tokens), content, history)
+                except BaseException as e:
+                    self.__resolve(flight, error=e)
+                    raise
+                if plan is None:
+                    self.__resolve(flight, None)
+                    response = self.OVER_BUDGET_MESSAGE
+            if response is not None:
+                for chunk in chunker.feed(response) + chunker.flush():
+                    await post(chunk)
+                return
+
+            self.logger_instance.info("OpenAIインスタンス化(ストリーミング)")
+            timed_out = False
+            try:
+                with self.metrics.timer("stage_seconds", stage="llm"):
+                    try:
+                        # 規定時間を超えた場合は受信を取り消す。受信済みの分はpartsに残る
+                        await asyncio.wait_for(self.__consume_stream(content, plan, history, chunker, post, parts),
+                                               timeout=self.config.timeout_interval)
+                    except asyncio.TimeoutError:
+                        timed_out = True
+
+                # ストリーミングではusageが返らないため、トークン数は再計算する
+                result = await loop.run_in_executor(executor, bind_context(self.__settle),
+                                                    content, "".join(parts), None, plan, not timed_out and history is None)
+            except BaseException as e:
+                self.token_budget.release(plan)
+                self.__resolve(flight, error=e)
+                raise
+            if timed_out:
+                # 途中で打ち切った回答は後続の呼び出し元へ返さず、コストも按分しない
+                self.__resolve(flight, error=asyncio.TimeoutError())
+            else:
+                self.__resolve(flight, result)
+
+            for chunk in chunker.flush():
+                await post(chunk)
+            if timed_out:
+                self.logger_instance.critical("タイムアウトエラー")
+                self.metrics.inc("llm_requests_total", result="timeout")
+                await post(self.STREAM_TIMEOUT_MESSAGE)
+            await loop.run_in_executor(executor, bind_context(self.__register_shared),
+                                       reply_record, None if timed_out else flight, result)
+
+        except Exception as e:
+            self.logger_instance.critical("文書生成に関してエラーが発生しました。" + str(e))
+            self.metrics.inc("llm_requests_total", result="error")
+            try:
+                for chunk in chunker.flush():
+                    await post(chunk)
+                await post("chatGPTでエラーが発生しました。")
+            except Exception as post_error:
+                self.logger_instance.critical("エラー時の返信に失敗しました。" + str(post_error))
+
+    def __post_all(self, chunker, response, post):
+        """一括返信
+            Args:
+                chunker:TootChunkerインスタンス
+                response:返答
+                post:返信処理
+        """
+        for chunk in chunker.feed(response) + chunker.flush():
+            post(chunk)
+
+    async def __consume_stream(self, content, plan, history, chunker, post, parts):
+        """ストリーミング受信(非同期)
+            Args:
+                content:リプライ
+                plan:トークン見積もり結果
+                history:会話の文脈(ConversationWindow)。文脈がない場合None
+                chunker:TootChunkerインスタンス
+                post:返信処理。返信文を受け取るコルーチン関数
+                parts:受信した生成文の断片を追加するリスト
+        """
+        events = await openai.ChatCompletion.acreate(stream=True, **self.__request_params(content, plan, history))
+        async for event in events:
+            delta = event.choices[0].delta.get("content")
+            if not delta:
+                continue
+            parts.append(delta)
+            for chunk in chunker.feed(delta):
+                await post(chunk)
+
+    def __post_error(self, chunker, post):
+        """エラー時の返信
+            受信済みの生成文を返信し、エラーを通知する。
+            Args:
+                chunker:TootChunkerインスタンス
+                post:返信処理
+        """
+        try:
+            for chunk in chunker.flush():
+                post(chunk)
+            post("chatGPTでエラーが発生しました。")
+        except Exception as e:
+            self.logger_instance.critical("エラー時の返信に失敗しました。" + str(e))
+
+    def __plan_tokens(self, content, history):
+        """トークン見積もり
+            質問文、会話の文脈のトークン数と実行日の残りコストから、回答の最大トークン数を決め、見積もりコストを予約する。
+            Args:
+                content:リプライ
+                history:会話の文脈(ConversationWindow)。文脈がない場合None
+            Returns:
+                BudgetPlan。残りコストで回答できない場合None
+        """
+        plan = self.token_budget.plan(content, 0 if history is None else history.tokens)
+        if plan is None:
+            self.logger_instance.warning("残りコスト不足のため、APIを呼び出しません。")
+            self.metrics.inc("rejections_total", reason="budget")
+            self.reply_writer.count_rejection("budget", self.cost_ledger.today())
+        else:
+            self.logger_instance.info("入力token見積もり:%d 最大出力token:%d", plan.prompt_tokens, plan.max_tokens)
+        return plan
+
+    def __request_params(self, content, plan, history):
+        """リクエストパラメータ生成
+            会話の文脈は、システムプロンプトと質問文の間に古い順に並べる。
+            Args:
+                content:リプライ
+                plan:トークン見積もり結果
+                history:会話の文脈(ConversationWindow)。文脈がない場合None
+            Returns:
+                ChatCompletionのパラメータ
+        """
+        messages = [{"role": "system", "content": self.config.role_system_content}]
+        if history is not None:
+            messages.extend(history.messages)
+        messages.append({"role": "user","content": content})
+        return {"model": self.config.chatgpt_model,
+                "temperature": self.config.temperature,
+                "max_tokens": plan.max_tokens,
+                "messages": messages}
+
+    def __join(self, content, history):
+        """呼び出し参加
+            Args:
+                content:リプライ
+                history:会話の文脈(ConversationWindow)。文脈がない場合None
+            Returns:
+                Flight, 先頭の呼び出し元の場合True。集約しない場合はNone, True
+        """
+        if not self.config.coalesce_requests or history is not None:
+            return None, True
+        flight, leader = self.single_flight.join(self.answer_cache.make_key(content))
+        if not leader:
+            self.logger_instance.info("実行中の同じ質問の回答を待ちます。")
+            self.metrics.inc("llm_requests_total", result="coalesced")
+        return flight, leader
+
+    def __wait_shared(self, reply_record, flight):
+        """実行中の呼び出しの結果待ち
+            待機を打ち切った場合も、結果が設定された時点で按分したコストを登録する。
+            Args:
+                reply_record:登録した質問(ReplyRecord)
+                flight:Flight
+            Returns:
+                呼び出し結果
+        """
+        try:
+            return flight.future.result(timeout=self.config.timeout_interval)
+        except concurrent.futures.TimeoutError:
+            flight.future.add_done_callback(lambda future: self.__register_late(reply_record, flight, future))
+            raise
+
+    async def __wait_flight(self, reply_record, flight):
+        """実行中の呼び出しの結果待ち(非同期)
+            待機を打ち切っても、実行中の呼び出しは取り消さない。按分したコストは結果が設定された時点で登録する。
+            Args:
+                reply_record:登録した質問(ReplyRecord)
+                flight:Flight
+            Returns:
+                呼び出し結果
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(flight.future)),
+                                          timeout=self.config.timeout_interval)
+        except asyncio.TimeoutError:
+            flight.future.add_done_callback(lambda future: self.__register_late(reply_record, flight, future))
+            raise
+
+    def __register_late(self, reply_record, flight, future):
+        """待機打ち切り後の回答登録(按分)
+            先頭の呼び出し元は結果を受け取った人数で按分したコストのみ登録するため、待ちきれなかった呼び出し元も負担分を登録する。
+            回答文は返信したタイムアウトの案内とし、会話の文脈には加えない。
+            Args:
+                reply_record:登録した質問(ReplyRecord)
+                flight:Flight
+                future:結果が設定されたflight.future
+        """
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            # 呼び出しが失敗した場合、コストは発生していないか先頭の呼び出し元が負担する
+            return
+        _, cost, input_tokens, output_tokens = future.result()
+        share = cost / flight.size
+        try:
+            self.reply_writer.regist_answer(reply_record, self.TIMEOUT_MESSAGE, share, self.config.chatgpt_model,
+                                            self.cost_ledger.today(), input_tokens // flight.size, output_tokens // flight.size)
+            self.cost_ledger.add(share)
+            self.metrics.inc("cost_total", float(share))
+        except Exception as e:
+            self.logger_instance.critical("DB更新に関してエラーが発生しました。" + str(e))
+
+    def __resolve(self, flight, result=None, error=None):
+        """呼び出し結果の設定
+            Args:
+                flight:Flight。集約しない場合None
+                result:呼び出し結果
+                error:例外
+        """
+        if flight is not None:
+            self.single_flight.resolve(flight, result, error)
+
+    def __register_shared(self, reply_record, flight, result):
+        """回答登録(按分)
+            コスト、トークン数は同じ呼び出しの結果を受け取った人数で按分して登録する(トークン数の端数は切り捨て)。
+            Args:
+                reply_record:登録した質問(ReplyRecord)
+                flight:Flight。按分しない場合None
+                result:呼び出し結果(生成文, コスト, 入力トークン, 出力トークン)。残りコスト不足の場合None
+            Returns:
+                response:返答
+        """
+        if result is None:
+            return self.OVER_BUDGET_MESSAGE
+        response, cost, input_tokens, output_tokens = result
+        size = flight.size if flight is not None else 1
+        self.__update_answer(reply_record, response, cost / size, input_tokens // size, output_tokens // size)
+        return str(response)
+
+    def __receive_msg(self, content, openAiInstance, plan, cacheable=True):
+        """レスポンス受取
+            返答を取り出し、コストを算出する。
+            コストはAPIレスポンスのusageより算出し、usageがない場合のみ再計算する。
+            Args:
+                content:リプライ
+                openAiInstance:APIレスポンス
+                plan:トークン見積もり結果
+                cacheable:回答キャッシュへ登録する場合True(会話の文脈を付けた回答はFalse)
+            Returns:
+                生成文, コスト, 入力トークン, 出力トークン
+        """
+        # レスポンス受取
+        response = openAiInstance.choices[0].message.content
+        return self.__settle(content, response, openAiInstance.get("usage"), plan, cacheable)
+
+    def __settle(self, content, response, usage, plan, cacheable=True):
+        """コスト算出
+            生成文のトークン数からコストを算出し、回答キャッシュへ登録する。
+            Args:
+                content:リプライ
+                response:生成文
+                usage:APIレスポンスのusage。ない場合None
+                plan:トークン見積もり結果
+                cacheable:回答キャッシュへ登録する場合True(途中で打ち切った回答、会話の文脈を付けた回答はFalse)
+            Returns:
+                生成文, コスト, 入力トークン, 出力トークン
+        """
+        self.logger_instance.info("生成文：%s", response)
+
+        # トークン数取得
+        if usage is not None:
+            input_tokens = usage["prompt_tokens"]
+            output_tokens = usage["completion_tokens"]
+        else:
+            input_tokens = plan.prompt_tokens
+            output_tokens = len(self.encoder.encode(response))
+        self.logger_instance.info("入力token:%d 出力token:%d", input_tokens, output_tokens)
+        self.metrics.inc("llm_requests_total", result="ok")
+        self.metrics.inc("tokens_total", input_tokens, kind="prompt")
+        self.metrics.inc("tokens_total", output_tokens, kind="completion")
+
+        cost = self.__get_cost(float(input_tokens), float(output_tokens))
+        # 見積もりコストの予約を確定したコストに置き換える
+        self.token_budget.release(plan, cost)
+
+        # 回答キャッシュ登録 後続の同じ質問はキャッシュから回答する
+        if cacheable and self.answer_cache.enabled:
+            self.answer_cache.put(self.answer_cache.make_key(content), str(response), cost)
+
+        return str(response), cost, int(input_tokens), int(output_tokens)
+
+    def __answer_from_cache(self, content, reply_record, history):
+        """回答キャッシュ参照
+            キャッシュにある場合は、コスト0で回答文を登録する。
+            会話の文脈を付けた質問は、文脈により回答が異なるため参照しない。
+            Args:
+                content:リプライ
+                reply_record:登録した質問(ReplyRecord)
+                history:会話の文脈(ConversationWindow)。文脈がない場合None
+            Returns:
+                response:返答。キャッシュにない場合None
+        """
+        if not self.answer_cache.enabled or history is not None:
+            return None
+
+        response = self.answer_cache.get(self.answer_cache.make_key(content))
+        if response is None:
+            return None
+
+        self.logger_instance.info("回答キャッシュ使用：%s", response)
+        self.metrics.inc("llm_requests_total", result="cache_hit")
+        self.__update_answer(reply_record, response, 0.0)
+        return response
     
-    def __update_answer(self, id, content, input_tokens, output_tokens):
+    def __update_answer(self, reply_record, content, cost, input_tokens=0, output_tokens=0):
         """回答内容更登録
+            DBへは書き込みスレッドがまとめて登録する。
             Args:
-                id:アカウントID
+                reply_record:登録した質問(ReplyRecord)
                 content:リプライ
-                input_tokens:入力トークン
-                output_tokens:出力トークン
+                cost:コスト
+                input_tokens:入力トークン数
+                output_tokens:出力トークン数
         """
         try:
             self.logger_instance.info("回答文登録")
-            # DatabaseManagerインスタンス化
-            dbmanager_instance = DatabaseManager(self.config, "SQL_005.sql")
-            # SQL実行
-            cnt = dbmanager_instance.exec_query(content, self.__get_cost(input_tokens, output_tokens), id, id)
-            self.logger_instance.info("{cn}件更新".format(cn=str(cnt)))
+            # 回答文はDBの保存上限の文字数までとする
+            self.reply_writer.regist_answer(reply_record, str(content)[:ANSWER_MAX_LENGTH], cost,
+                                            self.config.chatgpt_model, self.cost_ledger.today(),
+                                            input_tokens, output_tokens)
+            # 次の質問の文脈に加える
+            self.conversations.complete(reply_record, str(content)[:ANSWER_MAX_LENGTH])
+            # 実行日のAPIコストへ加算
+            self.cost_ledger.add(cost)
+            self.metrics.inc("cost_total", float(cost))
         except Exception as e:
             self.logger_instance.critical("DB更新に関してエラーが発生しました。" + str(e))
             raise e
@@ -106,12 +634,8 @@ class GenerateToots:
         """
         try:
             self.logger_instance.info("token算出")
-            # DatabaseManagerインスタンス化
-            dbmanager_instance = DatabaseManager(self.config, "SQL_004.sql")
-            # SQL実行
-            dr = dbmanager_instance.exec_select(self.config.chatgpt_model)
-
-            return input_tokens * (float(dr['INPUT_COST']) / 1000) + output_tokens * (float(dr['OUTPUT_COST']) / 1000)
+            # トークン単価はモデルごとに1回だけDBから取得する
+            return self.token_budget.cost(self.config.chatgpt_model, input_tokens, output_tokens)
         except Exception as e:
             self.logger_instance.critical("コスト計算に関してエラーが発生しました。" + str(e))
             raise e
@@ -0,0 +1,132 @@
+"""history_maintenance.py
+    質問・回答の履歴の保守
+    AIB_T_REPLY_SENTENSEの月別パーティションを先の月まで作成し、保持期間を過ぎた月のパーティションを退避、削除する。
+    コストの集計はAIB_T_COST_DAILYで行うため、パーティションを削除しても集計値は変わらない。
+    あわせて、会話の文脈の取得期間を過ぎた投稿の対応(AIB_T_CONVERSATION_LINK)、保持期間を過ぎた処理済みのmention(AIB_T_INTAKE_PROCESSED)を削除する。
+"""
+import datetime
+import re
+
+from conversation_cache import FALLBACK_HOURS
+from cost_ledger import now_jst, today_jst
+from mention_intake import PROCESSED_RETENTION_DAYS
+
+
+# 月別パーティション名(p+年月)
+PARTITION_PATTERN = re.compile(r"^p(\d{4})(\d{2})$")
+
+
+class HistoryMaintenance:
+    """履歴の保守
+        cron等から1日1回程度実行する。
+        パーティションの追加はpmax(上限なし)を分割して行う。移行直後はpmaxに全ての行があるため、
+        初回は最も古い質問の月から当月まで、月ごとのパーティションを作成する。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.config = context.config
+        self.logger = context.logger
+        self.db_manager = context.db_manager
+
+    def run(self):
+        """保守処理
+            Return:
+                追加したパーティション名のリスト, 削除したパーティション名のリスト
+        """
+        purged = self.db_manager.exec_query("SQL_041.sql", now_jst(), FALLBACK_HOURS)
+        self.logger.info("会話のスレッドの投稿を削除しました。%d件", purged)
+        purged = self.db_manager.exec_query("SQL_044.sql", PROCESSED_RETENTION_DAYS)
+        self.logger.info("処理済みのmentionを削除しました。%d件", purged)
+
+        partitions = [row.PARTITION_NAME for row in self.db_manager.fetch_iter("SQL_029.sql")]
+        if "pmax" not in partitions:
+            self.logger.warning("AIB_T_REPLY_SENTENSEがパーティション化されていません。SQL/DDL/MIGRATION_001.sqlを実行してください。")
+            return [], []
+
+        months = sorted(_parse_month(name) for name in partitions if PARTITION_PATTERN.match(name))
+        added = self.__add_partitions(months)
+        dropped = self.__drop_partitions(months + added)
+        return [_partition_name(month) for month in added], [_partition_name(month) for month in dropped]
+
+    def __add_partitions(self, months):
+        """パーティション追加
+            history_months_ahead月先までのパーティションを作成する。
+            Args:
+                months:作成済みのパーティションの月(昇順)
+            Return:
+                追加したパーティションの月のリスト
+        """
+        this_month = today_jst().replace(day=1)
+        last_month = _add_months(this_month, self.config.history_months_ahead)
+        if months:
+            month = _add_months(months[-1], 1)
+        else:
+            oldest = self.db_manager.fetch_scalar("SQL_030.sql")
+            month = this_month if oldest is None else min(oldest.date().replace(day=1), this_month)
+
+        added = []
+        while month <= last_month:
+            # 上限日は翌月1日(未満)
+            self.db_manager.exec_query("SQL_031.sql", _partition_name(month), _add_months(month, 1))
+            self.logger.info("パーティションを追加しました。%s", _partition_name(month))
+            added.append(month)
+            month = _add_months(month, 1)
+        return added
+
+    def __drop_partitions(self, months):
+        """パーティション削除
+            history_retention_monthsを過ぎた月のパーティションを削除する。history_archiveの場合は退避してから削除する。
+            Args:
+                months:作成済みのパーティションの月
+            Return:
+                削除したパーティションの月のリスト
+        """
+        if self.config.history_retention_months <= 0:
+            return []
+
+        border = _add_months(today_jst().replace(day=1), -self.config.history_retention_months)
+        dropped = []
+        for month in sorted(months):
+            if month >= border:
+                break
+            self.db_manager.exec_query("SQL_032.sql", _partition_name(month), '1' if self.config.history_archive else '0')
+            self.logger.info("パーティションを削除しました。%s", _partition_name(month))
+            dropped.append(month)
+        return dropped
+
+
+def _parse_month(name):
+    """パーティション名の月
+        Args:
+            name:パーティション名
+        Return:
+            月初日
+    """
+    matched = PARTITION_PATTERN.match(name)
+    return datetime.date(int(matched.group(1)), int(matched.group(2)), 1)
+
+
+def _partition_name(month):
+    """月のパーティション名
+        Args:
+            month:月初日
+        Return:
+            パーティション名
+    """
+    return month.strftime("p%Y%m")
+
+
+def _add_months(month, count):
+    """月の加算
+        Args:
+            month:月初日
+            count:加算する月数(負の場合は減算)
+        Return:
+            月初日
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
@@ -0,0 +1,14 @@
+"""ingest_entry_point.py
+    botプログラムのエントリポイント(複数プロセス構成の受信プロセス)
+    mentionをジョブテーブルへ登録する。返信はjob_worker_entry_point.pyのワーカープロセスが行う。
+"""
+from application_context import ApplicationContext, ROLE_INGEST
+from job_service import IngestService
+
+
+# インスタンス化
+context = ApplicationContext(ROLE_INGEST)
+ingestSv = IngestService(context)
+
+# 処理開始
+ingestSv.start_stream()
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""job_queue.py
+    通知のジョブキュー
+    受信プロセスが通知をジョブテーブル(AIB_T_MENTION_JOB)へ登録し、任意のホストのワーカープロセスが取り出して処理する。
+    取り出しはSELECT ... FOR UPDATE SKIP LOCKEDで行い、ワーカー間で同じジョブを取り合わない。
+"""
+import dataclasses
+import datetime
+import json
+import os
+import random
+import socket
+from typing import Optional
+
+
+# ジョブの状態
+STATE_READY = "ready"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+# 再実行までの待機秒数の上限
+RETRY_WAIT_MAX = 600
+# DBに保存するエラー内容の最大文字数(AIB_T_MENTION_JOB.cm_error)
+ERROR_MAX_LENGTH = 500
+
+
+@dataclasses.dataclass
+class MentionJob:
+    """データエンティティ
+        取り出したジョブ保持用エンティティクラス
+    """
+    job_id: int
+    status_id: str
+    user_id: str
+    payload: str
+    # 取り出した回数(今回を含む)
+    attempt: int
+    # 返信要件チェックを通過した日時。未通過の場合None
+    accepted_at: Optional[datetime.datetime] = None
+
+    def notification(self):
+        """通知復元
+            Return:
+                通知
+        """
+        return json.loads(self.payload)
+
+
+class JobQueue:
+    """ジョブキュー
+        プロセス内で1インスタンスを生成し、受信処理、ワーカーで共有する。
+        同一アカウントのジョブは、先に登録されたジョブが終了するまで取り出さない。
+        ワーカーが停止した場合、リース期限を過ぎたジョブは他のワーカーが取り出して再実行する。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.db_manager = context.db_manager
+        self.logger = context.logger
+        self.worker_id = "{host}:{pid}".format(host=socket.gethostname(), pid=os.getpid())
+
+    @property
+    def config(self):
+        """外部設定ファイル保持データクラス
+            SIGHUPによる再読込を反映するため、contextから都度参照する。
+        """
+        return self.context.config
+
+    def enqueue(self, notif):
+        """ジョブ登録
+            同じ通知(status ID)は1回だけ登録する。
+            Args:
+                notif:通知
+            Return:
+                True:登録した
+                False:登録済み
+        """
+        status = notif['status']
+        payload = json.dumps(notif, ensure_ascii=False, default=str)
+        return self.db_manager.exec_query("SQL_011.sql", str(status['id']), str(status['account']['username']), payload) > 0
+
+    def claim(self):
+        """ジョブ取り出し
+            実行可能なジョブを1件取り出し、リース期限を設定する。
+            Return:
+                MentionJob。実行可能なジョブがない場合None
+        """
+        with self.db_manager.transaction() as session:
+            row = session.fetch_one("SQL_012.sql")
+            if row is None:
+                return None
+            session.exec_query("SQL_013.sql", self.worker_id, int(self.config.job_lease_seconds), row.JOB_ID)
+
+        return MentionJob(job_id=row.JOB_ID,
+                          status_id=row.STATUS_ID,
+                          user_id=row.USER_ID,
+                          payload=row.PAYLOAD,
+                          attempt=int(row.ATTEMPT) + 1,
+                          accepted_at=row.ACCEPTED_AT)
+
+    def extend(self, job):
+        """リース延長
+            Args:
+                job:MentionJob
+            Return:
+                True:延長した
+                False:リース期限切れ等で他のワーカーに移っている
+        """
+        return self.db_manager.exec_query("SQL_014.sql", int(self.config.job_lease_seconds), job.job_id, self.worker_id) > 0
+
+    def mark_accepted(self, job, accepted_at):
+        """受付日時登録
+            再実行時は返信要件チェックを省略し、同じ受付日時で質問文を登録する。
+            Args:
+                job:MentionJob
+                accepted_at:受付日時
+        """
+        job.accepted_at = accepted_at
+        self.db_manager.exec_query("SQL_015.sql", accepted_at, job.job_id, self.worker_id)
+
+    def complete(self, job):
+        """ジョブ終了
+            Args:
+                job:MentionJob
+            Return:
+                True:終了した
+                False:リース期限切れ等で他のワーカーに移っている
+        """
+        return self.__finish(job, STATE_DONE, 0, None)
+
+    def retry(self, job, error):
+        """ジョブ再実行
+            再実行回数の上限以内であれば、待機時間をおいて再実行する。上限を超えた場合は失敗とする。
+            Args:
+                job:MentionJob
+                error:発生した例外
+            Return:
+                True:再実行する
+                False:失敗とした
+        """
+        if job.attempt >= self.config.job_max_attempts:
+            self.fail(job, error)
+            return False
+
+        # 再実行のたびに待機時間を倍にし、同時に失敗したジョブの再実行時刻を分散させる
+        wait = min(self.config.job_retry_wait * 2 ** (job.attempt - 1), RETRY_WAIT_MAX)
+        self.__finish(job, STATE_READY, int(wait * random.uniform(0.5, 1.0)) + 1, error)
+        return True
+
+    def fail(self, job, error):
+        """ジョブ失敗
+            Args:
+                job:MentionJob
+                error:発生した例外またはエラー内容
+        """
+        self.__finish(job, STATE_FAILED, 0, error)
+
+    def purge(self):
+        """終了したジョブの削除
+            保持日数を過ぎたジョブを削除する。1回の削除件数には上限がある。
+            Return:
+                削除件数
+        """
+        return self.db_manager.exec_query("SQL_017.sql", int(self.config.job_retention_days))
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                状態別のジョブ件数
+        """
+        counts = {STATE_READY: 0, STATE_RUNNING: 0}
+        for row in self.db_manager.fetch_iter("SQL_018.sql", as_tuple=True):
+            counts[row[0]] = int(row[1])
+        return counts
+
+    def __finish(self, job, state, wait, error):
+        """ジョブ状態更新
+            Args:
+                job:MentionJob
+                state:更新後の状態
+                wait:再実行までの秒数
+                error:発生した例外またはエラー内容
+            Return:
+                True:更新した
+                False:リース期限切れ等で他のワーカーに移っている
+        """
+        message = None if error is None else str(error)[:ERROR_MAX_LENGTH]
+        updated = self.db_manager.exec_query("SQL_016.sql", state, wait, message, job.job_id, self.worker_id) > 0
+        if not updated:
+            self.logger.warning("ジョブのリースが失効していたため、状態を更新しませんでした。job_id:%s", job.job_id)
+        return updated
@@ -0,0 +1,226 @@
+"""job_service.py
+    複数プロセス構成の処理
+    受信プロセスは通知をジョブテーブルへ登録するのみ行い、返信要件チェックから返信までは任意の数のワーカープロセスが行う。
+"""
+import asyncio
+import random
+import threading
+import time
+
+from mastodon import StreamListener
+
+from mastodon_service import Stream
+from mention_intake import MentionIntake
+
+
+# 終了したジョブの削除間隔(秒)
+PURGE_INTERVAL = 3600
+
+
+class IngestService:
+    """IngestService
+        Streamを受信し、mentionをジョブテーブルへ登録する。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.intake = MentionIntake(context)
+        context.metrics.register_gauge("job_queue", context.job_queue.stats)
+        context.metrics.register_gauge("intake", self.intake.stats)
+
+    def start_stream(self):
+        """Stream開始
+            Streamを開始する。切断時は再接続し、停止中・切断中の通知は再接続後に取得する。
+        """
+        self.context.logger.info("StreamListnerの起動(受信プロセス)")
+        self.context.install_reload_signal()
+        self.context.start_metrics()
+        try:
+            self.intake.run(IngestListener(self.context, self.intake).on_notification)
+        finally:
+            self.context.close()
+
+
+class IngestListener(StreamListener):
+    """StreamListenerを継承
+       mentionをジョブテーブルへ登録する
+    """
+    def __init__(self, context, intake):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+                intake:MentionIntakeインスタンス
+        """
+        self.logger = context.logger
+        self.metrics = context.metrics
+        self.job_queue = context.job_queue
+        self.intake = intake
+
+    def on_notification(self, notif):
+        """通知受信処理
+            通知をそのままジョブとして登録する。登録後は以降の処理をワーカープロセスが行うため、処理済みとする。
+            Args:
+                notif:通知
+        """
+        try:
+            if notif['type'] == 'mention':
+                self.logger.info("mentionの検知")
+                self.metrics.inc("mentions_total")
+                with self.metrics.timer("stage_seconds", stage="enqueue"):
+                    if not self.job_queue.enqueue(notif):
+                        self.logger.info("登録済みの通知です。%s", notif['status']['id'])
+                self.intake.complete(notif)
+
+        except Exception as e:
+            self.logger.critical("通知の登録に関して、エラーが発生しました。" + str(e))
+            # 登録できなかった通知は処理中のまま保持し、再処理する
+            self.intake.release(notif)
+
+
+class JobWorkerService:
+    """JobWorkerService
+        ジョブテーブルから通知を取り出し、返信要件チェックから返信までを行う。
+        worker_count個のスレッドがそれぞれジョブを取り出し、リース延長スレッドが処理中のジョブのリースを延長する。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.logger = context.logger
+        self.metrics = context.metrics
+        self.job_queue = context.job_queue
+        self.stream = Stream(context, None)
+        self.__stopping = threading.Event()
+        self.__threads = []
+        # job_id -> 処理中のMentionJob
+        self.__running = {}
+        self.__lock = threading.Lock()
+        self.__purged_at = 0.0
+        context.metrics.register_gauge("job_worker", self.stats)
+
+    @property
+    def config(self):
+        """外部設定ファイル保持データクラス
+            SIGHUPによる再読込を反映するため、contextから都度参照する。
+        """
+        return self.context.config
+
+    def start(self):
+        """ワーカー開始
+            停止(Ctrl+C)されるまで、ジョブの取り出しと処理を繰り返す。
+        """
+        self.logger.info("ジョブワーカーの起動 %s", self.job_queue.worker_id)
+        self.context.install_reload_signal()
+        self.context.start_metrics()
+
+        for num in range(self.config.worker_count):
+            thread = threading.Thread(target=self.__work, name="job-worker-{n}".format(n=num), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+        keeper = threading.Thread(target=self.__keep_leases, name="job-lease", daemon=True)
+        keeper.start()
+
+        try:
+            while not self.__stopping.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            self.logger.info("ジョブワーカーの停止")
+        finally:
+            self.__stopping.set()
+            # 処理中のジョブは完了を待つ。待ちきれなかったジョブはリース期限後に他のワーカーが再実行する
+            for thread in self.__threads:
+                thread.join(self.config.timeout_interval)
+            keeper.join(self.config.timeout_interval)
+            self.context.close()
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                処理中のジョブ件数
+        """
+        with self.__lock:
+            return {"workers": len(self.__threads), "running": len(self.__running)}
+
+    def __work(self):
+        """ワーカー処理
+            ジョブを取り出して処理する。ジョブがない場合はjob_poll_interval秒待機する。
+        """
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        while not self.__stopping.is_set():
+            try:
+                job = self.job_queue.claim()
+            except Exception as e:
+                self.logger.error("ジョブの取り出しに失敗しました。" + str(e))
+                job = None
+
+            if job is None:
+                # 複数ワーカーの問い合わせが重ならないよう、待機時間をずらす
+                self.__stopping.wait(self.config.job_poll_interval * random.uniform(0.5, 1.5))
+                continue
+
+            with self.__lock:
+                self.__running[job.job_id] = job
+            try:
+                self.__run_job(job)
+            finally:
+                with self.__lock:
+                    del self.__running[job.job_id]
+
+    def __run_job(self, job):
+        """ジョブ処理
+            失敗した場合は、再実行回数の上限まで待機時間をおいて再実行する。
+            Args:
+                job:MentionJob
+        """
+        try:
+            if job.attempt > self.config.job_max_attempts:
+                # リース期限切れで再実行回数の上限を超えたジョブ
+                self.logger.error("再実行回数の上限を超えたため、ジョブを破棄します。job_id:%s", job.job_id)
+                self.job_queue.fail(job, "再実行回数の上限超過")
+                self.metrics.inc("jobs_total", result="failed")
+                return
+
+            notifi_entity, visibility_status = self.stream.parse_notification(job.notification())
+            self.stream.process_mention(notifi_entity, visibility_status, job.accepted_at,
+                                        lambda accepted_at: self.job_queue.mark_accepted(job, accepted_at))
+            self.job_queue.complete(job)
+            self.metrics.inc("jobs_total", result="done")
+
+        except Exception as e:
+            self.logger.critical("ジョブ処理で、エラーが発生しました。" + str(e))
+            try:
+                if self.job_queue.retry(job, e):
+                    self.metrics.inc("jobs_total", result="retry")
+                else:
+                    self.metrics.inc("jobs_total", result="failed")
+            except Exception as retry_error:
+                # 状態を更新できなかったジョブは、リース期限後に再実行する
+                self.logger.error("ジョブの状態更新に失敗しました。" + str(retry_error))
+
+    def __keep_leases(self):
+        """リース延長処理
+            リース期限の1/3ごとに、処理中のジョブのリースを延長する。あわせて終了したジョブを定期的に削除する。
+        """
+        while not self.__stopping.wait(max(self.config.job_lease_seconds / 3, 1.0)):
+            with self.__lock:
+                jobs = list(self.__running.values())
+            for job in jobs:
+                try:
+                    if not self.job_queue.extend(job):
+                        self.logger.warning("ジョブのリースが失効しています。job_id:%s", job.job_id)
+                except Exception as e:
+                    self.logger.error("ジョブのリース延長に失敗しました。" + str(e))
+
+            if time.monotonic() - self.__purged_at >= PURGE_INTERVAL:
+                self.__purged_at = time.monotonic()
+                try:
+                    purged = self.job_queue.purge()
+                    if purged:
+                        self.logger.info("終了したジョブを削除しました。%d件", purged)
+                except Exception as e:
+                    self.logger.error("終了したジョブの削除に失敗しました。" + str(e))
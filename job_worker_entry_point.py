@@ -0,0 +1,14 @@
+"""job_worker_entry_point.py
+    botプログラムのエントリポイント(複数プロセス構成のワーカープロセス)
+    任意のホストで任意の数だけ起動し、ジョブテーブルの通知に返信する。
+"""
+from application_context import ApplicationContext, ROLE_WORKER
+from job_service import JobWorkerService
+
+
+# インスタンス化
+context = ApplicationContext(ROLE_WORKER)
+workerSv = JobWorkerService(context)
+
+# 処理開始
+workerSv.start()
\ No newline at end of file
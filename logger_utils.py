@@ -1,15 +1,156 @@
 """logger_utils.py
     ログファイルの命名、出力
     各種ログレベル別出力メソッドの定義
+    ログはキューへ積み、ファイルへの書き込みは専用スレッドで行う。
 """
+import atexit
+import contextlib
+import contextvars
 import datetime
+import functools
+import glob
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import sys
+import time
+
+
+JST = datetime.timezone(datetime.timedelta(hours=9), 'JST')
+
+# 通知ごとの相関ID。ワーカースレッド、asyncioのタスクごとに保持する
+_correlation_id = contextvars.ContextVar("correlation_id", default="")
+
+TEXT_FORMAT = " %(asctime)s - %(levelname)s - %(correlation_tag)s%(message)s "
+
+
+def bind_context(func):
+    """相関ID引継ぎ
+        呼び出し元の相関IDを引き継いで実行する関数を返す。run_in_executorへ渡す関数に用いる。
+        Args:
+            func:実行する関数
+        Return:
+            呼び出し元のコンテキストで実行する関数
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+class _CorrelationFilter(logging.Filter):
+    """相関ID付与
+        ログ出力元のスレッドで、相関IDをログレコードへ設定する。
+    """
+    def filter(self, record):
+        correlation_id = _correlation_id.get()
+        record.correlation_id = correlation_id
+        record.correlation_tag = "[" + correlation_id + "] " if correlation_id else ""
+        return True
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """キュー出力
+        同一プロセス内のキューのため、メッセージの編集は書き込みスレッドで行う。
+    """
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            # ログ出力でbotを止めない
+            self.handleError(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON形式のログ編集
+    """
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, JST).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "correlation_id": getattr(record, "correlation_id", "") or None,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DailyFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """日付別ログファイル出力
+        JSTの0時にファイルを切り替える。ファイル名は{file_nm_base}_YYYYMMDD.logとする。
+    """
+    def __init__(self, file_path, backup_count=0):
+        """コンストラクタ
+            Args:
+                file_path:ファイルパス。{p}に日付を埋め込む
+                backup_count:保持するファイル数。0の場合削除しない
+        """
+        self.file_path = file_path
+        self.io_error_cnt = 0
+        super().__init__(self.__dated_path(), when='midnight', backupCount=backup_count,
+                         encoding='utf-8', delay=True)
+
+    def computeRollover(self, currentTime):
+        """次回切替時刻(JSTの翌日0時)
+        """
+        now = datetime.datetime.fromtimestamp(currentTime, JST)
+        tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), JST)
+        return int(tomorrow.timestamp())
+
+    def doRollover(self):
+        """ファイル切替
+            リネームは行わず、新しい日付のファイルへ出力先を変更する。
+        """
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = self.__dated_path()
+        if self.backupCount > 0:
+            self.__remove_old_files()
+        self.rolloverAt = self.computeRollover(time.time())
+
+    def handleError(self, record):
+        """出力エラー処理
+            書き込みに失敗した場合は標準エラー出力へ1行出力し、処理を継続する。
+        """
+        self.io_error_cnt += 1
+        if self.stream:
+            try:
+                self.stream.close()
+            except Exception:
+                pass
+            # 次回出力時に開き直す
+            self.stream = None
+        try:
+            sys.stderr.write("ログ出力エラー " + str(sys.exc_info()[1]) + "\n")
+        except Exception:
+            pass
+
+    def __dated_path(self):
+        """ファイルパス(JSTの現在日付)
+        """
+        return self.file_path.format(p=datetime.datetime.now(JST).strftime('%Y%m%d'))
+
+    def __remove_old_files(self):
+        """古いログファイル削除
+        """
+        files = sorted(glob.glob(glob.escape(self.file_path).replace('{p}', '[0-9]' * 8)))
+        for path in files[:-self.backupCount]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
 
 class Logger:
     """ログ出力
         ログファイルの生成を行う
+        出力はキューへ積むのみで、ファイルへの書き込みはQueueListenerのスレッドで行う。
     """
     def __init__(self, config):
         """コンストラクタ
@@ -18,94 +159,112 @@ class Logger:
         """
         self.save_dir = config.file_save_dir
         self.log_file_nm_base = config.file_nm_base
-        self.current_date = self.__set_current_date()
         self.file_path = os.path.dirname(os.path.abspath(__file__)) + self.save_dir + '/' +  self.log_file_nm_base + '_{p}' + '.log'
-        self.__set_log_config()
+        self.level = logging.getLevelName(str(config.log_level).upper())
+        if not isinstance(self.level, int):
+            self.level = logging.DEBUG
+
+        self.file_handler = DailyFileHandler(self.file_path, config.log_backup_count)
+        if config.log_format == 'json':
+            self.file_handler.setFormatter(JsonFormatter())
+        else:
+            self.file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
 
-    def debug(self, err_msg):
+        self.queue_handler = _LocalQueueHandler(queue.SimpleQueue())
+        self.queue_handler.addFilter(_CorrelationFilter())
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, self.file_handler)
+
+        # ライブラリのログもあわせて出力する
+        self.logger = logging.getLogger()
+        for handler in list(self.logger.handlers):
+            if isinstance(handler, _LocalQueueHandler):
+                self.logger.removeHandler(handler)
+        self.logger.addHandler(self.queue_handler)
+        self.logger.setLevel(self.level)
+
+        self.listener.start()
+        self.__closed = False
+        atexit.register(self.close)
+
+    def debug(self, err_msg, *args):
         """debugログ
             Args:
-                err_msg:任意の表示メッセージ
+                err_msg:任意の表示メッセージ。%s等で引数を埋め込む
+                args:埋め込む値。出力対象のレベルの場合のみ編集する
         """
-        self.__write_log('debug', err_msg)
+        self.logger.debug(err_msg, *args)
 
-    def info(self, err_msg):
+    def info(self, err_msg, *args):
         """infoログ
             Args:
-                err_msg:任意の表示メッセージ
+                err_msg:任意の表示メッセージ。%s等で引数を埋め込む
+                args:埋め込む値。出力対象のレベルの場合のみ編集する
         """
-        self.__write_log('info', err_msg)
+        self.logger.info(err_msg, *args)
 
-    def warning(self, err_msg):
+    def warning(self, err_msg, *args):
         """warningログ
             Args:
-                err_msg:任意の表示メッセージ
+                err_msg:任意の表示メッセージ。%s等で引数を埋め込む
+                args:埋め込む値。出力対象のレベルの場合のみ編集する
         """
-        self.__write_log('warning', err_msg)
+        self.logger.warning(err_msg, *args)
 
-    def error(self, err_msg):
+    def error(self, err_msg, *args):
         """errorログ
             Args:
-                err_msg:任意の表示メッセージ
+                err_msg:任意の表示メッセージ。%s等で引数を埋め込む
+                args:埋め込む値。出力対象のレベルの場合のみ編集する
         """
-        self.__write_log('error', err_msg)
+        self.logger.error(err_msg, *args)
 
-    def critical(self, err_msg):
+    def critical(self, err_msg, *args):
         """criticalログ
             Args:
-                err_msg:任意の表示メッセージ
-        """
-        self.__write_log('critical', err_msg)
-    
-    def __set_log_config(self):
-        """ログファイル設定
-            ログファイルの設定を行う
-        """
-        logging.basicConfig(filename = self.file_path.format(p=self.current_date),       # ログファイル名 
-                            filemode = 'a',                                              # ファイル書込モード
-                            level    = logging.DEBUG,                                    # ログレベル
-                            format   = " %(asctime)s - %(levelname)s - %(message)s "     # ログ出力フォーマット
-                            )
-
-    def __set_current_date(self):
-        """日付設定
-            現在日付を返す
-        """
-        # 日付設定
-        t_delta = datetime.timedelta(hours=9)
-        JST = datetime.timezone(t_delta, 'JST')
-        now = datetime.datetime.now(JST)
-        return now.strftime('%Y%m%d')
-
-    def __write_log(self, log_level, err_msg):
-        """ログ出力
-            ログファイルの出力を行う
+                err_msg:任意の表示メッセージ。%s等で引数を埋め込む
+                args:埋め込む値。出力対象のレベルの場合のみ編集する
+        """
+        self.logger.critical(err_msg, *args)
+
+    def is_enabled(self, log_level):
+        """出力対象レベル判定
+            Args:
+                log_level:ログレベル(logging.DEBUG等)
+            Return:
+                True:出力対象
+        """
+        return self.logger.isEnabledFor(log_level)
+
+    @contextlib.contextmanager
+    def correlation(self, correlation_id):
+        """相関ID設定
+            ブロック内で出力したログに相関IDを付与する。
             Args:
-                log_level:ログレベル
-                err_msg:エラーメッセージ
+                correlation_id:相関ID(通知のstatus ID等)
         """
+        token = _correlation_id.set(str(correlation_id))
         try:
-            if(os.path.isfile(self.file_path.format(p=self.__set_current_date())) == False):
-                # 日付が異なる場合、新規にログファイルを出力する
-                # fileモードと現在日付を再設定
-                self.current_date = self.__set_current_date()
-                self.__set_log_config()
-
-            if log_level == "debug":
-                logging.debug(err_msg)
-
-            elif log_level == "info":
-                logging.info(err_msg)
-
-            elif log_level == "warning":
-                logging.warning(err_msg)
-
-            elif log_level == "error":
-                logging.error(err_msg)
-
-            elif log_level == "critical":
-                logging.critical(err_msg)
-        
-        except Exception as e:
-            print("ログファイル設定エラー" + str(e))
-            exit()
\ No newline at end of file
+            yield
+        finally:
+            _correlation_id.reset(token)
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                書き込み待ち件数、出力エラー件数
+        """
+        return {
+            "queued_count": self.queue_handler.queue.qsize(),
+            "io_error_count": self.file_handler.io_error_cnt,
+        }
+
+    def close(self):
+        """終了処理
+            書き込み待ちのログを出力してから書き込みスレッドを停止する。
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        self.logger.removeHandler(self.queue_handler)
+        self.listener.stop()
+        self.file_handler.close()
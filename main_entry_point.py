@@ -1,11 +1,13 @@
 """main_entry_point.py
     botプログラムのメインエントリポイント
 """
+from application_context import ApplicationContext
 from mastodon_service import MastodonService
 
 
 # インスタンス化
-mstdnSv = MastodonService()
+context = ApplicationContext()
+mstdnSv = MastodonService(context)
 
 # 処理開始
 mstdnSv.start_stream()
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""maintenance_entry_point.py
+    DB保守処理のエントリポイント
+    cron等から1日1回程度実行し、質問・回答のパーティションの追加、保持期間を過ぎたパーティションの削除を行う。
+"""
+from application_context import ApplicationContext, ROLE_MAINTENANCE
+from history_maintenance import HistoryMaintenance
+
+
+# インスタンス化
+context = ApplicationContext(ROLE_MAINTENANCE)
+maintenance = HistoryMaintenance(context)
+
+# 処理開始
+try:
+    added, dropped = maintenance.run()
+    context.logger.info("保守処理完了 追加:%s 削除:%s", ",".join(added) or "なし", ",".join(dropped) or "なし")
+except Exception as e:
+    context.logger.critical("保守処理で、エラーが発生しました。" + str(e))
+    raise
+finally:
+    context.close()
\ No newline at end of file
@@ -3,17 +3,17 @@
 """
 import asyncio
 import dataclasses
-from datetime import datetime, timedelta
-import random
-import re
 
-from bs4 import BeautifulSoup 
-from mastodon import Mastodon, StreamListener
+from mastodon import StreamListener
 
-from config_file_setting import SetConfigFileData
-from database_manager import DatabaseManager
+from cost_ledger import now_jst
 from generate_toots import GenerateToots
-from logger_utils import Logger
+from mention_intake import MentionIntake
+from mention_parser import parse_mention_content
+from mention_validator import COST_FIELD, COST_LEDGER, COST_SCAN, ValidationPipeline, ValidationRule
+from token_budget import QUESTION_MAX_LENGTH
+from toot_chunker import split_toot
+from worker_pool import WorkerPool
 
 
 @dataclasses.dataclass
@@ -28,89 +28,210 @@ class NotifiEntity:
     uri : str
     content_raw : str
     content : str
+    cn_link : int
 
-class MastodonService:
+class StreamService:
+    """StreamService
+        Stream受信の共通の初期設定を行う。通知の取り込み(MentionIntake)は同期版、asyncio版で共通とする。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.intake = MentionIntake(context)
+        context.metrics.register_gauge("intake", self.intake.stats)
+
+class MastodonService(StreamService):
     """MastodonService
         Mastodonの初期設定を行い、StreamListerを起動する。
+        切断時は再接続し、停止中・切断中の通知は再接続後に取得する。
     """
-    def __init__(self):
+    def __init__(self, context):
         """コンストラクタ
             Args:
-                config:初期設定ファイル
-                logger:ログクラス
+                context:ApplicationContextインスタンス
         """
-        # 各インスタンス化
-        self.config_instance = SetConfigFileData()
-        self.config = self.config_instance.set_config_datas()
-        self.logger_instance = Logger(self.config)
-        self.mastodon = Mastodon(client_id = self.config.client_id,
-                                 client_secret = self.config.client_secret,
-                                 access_token = self.config.access_token,
-                                 api_base_url = self.config.api_base_url )
-        
+        super().__init__(context)
+        self.worker_pool = WorkerPool(context.config.worker_count, context.config.queue_size, context.logger)
+        context.metrics.register_gauge("worker_pool", self.worker_pool.stats)
+
     def start_stream(self):
         """Stream開始
             Streamを開始する。
         """
-        self.logger_instance.info("StreamListnerの起動")    
-        self.mastodon.stream_user(Stream(self.config, self.logger_instance, self.mastodon))
+        self.context.logger.info("StreamListnerの起動")
+        self.context.install_reload_signal()
+        self.context.start_metrics()
+        self.worker_pool.start()
+        try:
+            self.intake.run(Stream(self.context, self.worker_pool, self.intake).on_notification)
+        finally:
+            self.worker_pool.shutdown(self.context.config.timeout_interval)
+            self.context.close()
 
 class Stream(StreamListener):
     """StreamListenerを継承
        各種StreamListenerの処理を行う
     """
-    def __init__(self, config, logger, mastodon):
+    def __init__(self, context, worker_pool, intake=None):
         """コンストラクタ
             Args:
-                config:外部設定ファイル保持データクラス
-                logger:ロガーインスタンス
-                mastodon:Mastodonインスタンス
+                context:ApplicationContextインスタンス
+                worker_pool:WorkerPoolインスタンス
+                intake:MentionIntakeインスタンス。処理を終えた通知IDを記録する場合に指定する
+        """
+        self.context = context
+        self.logger = context.logger
+        self.mastodon = context.mastodon
+        self.rate_limiter = context.rate_limiter
+        self.cost_ledger = context.cost_ledger
+        self.reply_writer = context.reply_writer
+        self.toot_sender = context.toot_sender
+        self.canned_responder = context.canned_responder
+        self.metrics = context.metrics
+        self.worker_pool = worker_pool
+        self.intake = intake
+        self.validation = ValidationPipeline(self.__validation_rules(), self.metrics)
+
+    @property
+    def config(self):
+        """外部設定ファイル保持データクラス
+            SIGHUPによる再読込を反映するため、contextから都度参照する。
         """
-        self.logger = logger
-        self.mastodon = mastodon
-        self.config = config
+        return self.context.config
 
     def on_notification(self, notif):
         """通知受信処理
             通知を受信した場合の処理
+            通知内容の編集のみ行い、返信処理はワーカーに委譲する。
             Args:
                 notif:通知
         """
         try:
             if notif['type'] == 'mention':
                 self.logger.info("mentionの検知")
+                self.metrics.inc("mentions_total")
 
                 # 受け取った通知内容のセット
-                notifi_entity = self.__set_notification(notif)
-                
-                # 公開範囲設定。directでリプライされた際はdirectで、それ以外はunlistedで返答を行う。
-                if notifi_entity.visibility == 'direct':
-                    visibility_status = self.config.visibility_direct
-                else:
-                    visibility_status = self.config.visibility_unlisted
+                notifi_entity, visibility_status = self.parse_notification(notif)
 
-                # 返信要件チェック
-                if self.__check_validation(notifi_entity, visibility_status):
-                    # 正常処理
-                    now = datetime.now()
+                # 返信処理の投入。同一アカウントの通知は受信順に処理する
+                if not self.worker_pool.submit(notifi_entity.id, self.__process_mention, notif, notifi_entity, visibility_status):
+                    self.logger.warning("処理待ちの通知が上限に達したため、破棄しました。@%s", notifi_entity.id)
+                    self.__reject("queue_full")
+                    # 処理中のまま保持し、再処理する
+                    if self.intake is not None:
+                        self.intake.release(notif)
 
-                    # 質問文登録
-                    self.__regist_question(notifi_entity.id, now, notifi_entity.content)
+        except Exception as e:
+            self.logger.critical("通知の受信に関して、エラーが発生しました。" + str(e))
+            # 処理できない通知は再取得しない
+            if self.intake is not None:
+                self.intake.complete(notif)
 
-                    self.logger.info('@' + str(notifi_entity.id) + "さんへ返信処理開始")
-                    content = "こんにちは。" + notifi_entity.content
-                    self.logger.info("質問文:" + str(content))
+    def parse_notification(self, notif):
+        """通知内容編集
+            通知内容と返信時のvisibilityを設定する。
+            Args:
+                notif:通知
+            Returns:
+                NotifiEntity, 返信時のvisibility
+        """
+        with self.metrics.timer("stage_seconds", stage="parse"):
+            notifi_entity = self.__set_notification(notif)
 
-                    # 回答文生成
-                    generateToots = GenerateToots()
-                    loop = asyncio.get_event_loop()
-                    res = loop.run_until_complete((generateToots.process_wait(content, notifi_entity.id)))
+        # 公開範囲設定。directでリプライされた際はdirectで、それ以外はunlistedで返答を行う。
+        if notifi_entity.visibility == 'direct':
+            visibility_status = self.config.visibility_direct
+        else:
+            visibility_status = self.config.visibility_unlisted
 
-                    self.__do_toot(res, notifi_entity, visibility_status)
+        return notifi_entity, visibility_status
+
+    def accept_mention(self, notifi_entity, visibility_status, accepted_at=None):
+        """質問受付
+            返信要件チェックを行い、要件を満たす場合は質問文を登録する。
+            Args:
+                notifi_entity:受信した通知内容
+                visibility_status:botの返信時visibility
+                accepted_at:受付済みの場合は受付日時。返信要件チェックを省略し、同じ日時で質問文を登録する
+            Returns:
+                APIへの質問文, 登録した質問(ReplyRecord)。返信要件を満たさない場合None
+        """
+        if accepted_at is None:
+            # 返信要件チェック
+            with self.metrics.timer("stage_seconds", stage="validate"):
+                accepted = self.__check_validation(notifi_entity, visibility_status)
+            if not accepted:
+                return None
+            accepted_at = now_jst()
+
+        # 質問文登録
+        reply_record = self.__regist_question(notifi_entity.id, accepted_at, notifi_entity.content)
+        # 会話の文脈の判定
+        self.context.conversations.begin(notifi_entity.noti, reply_record)
+
+        self.logger.info("@%sさんへ返信処理開始", notifi_entity.id)
+        content = "こんにちは。" + notifi_entity.content
+        self.logger.info("質問文:%s", content)
+        return content, reply_record
+
+    def process_mention(self, notifi_entity, visibility_status, accepted_at=None, on_accepted=None):
+        """返信処理
+            返信要件チェックから返信までを行う。エラーは呼び出し元へ送出する。
+            イベントループを持つスレッド上で呼び出す。
+            Args:
+                notifi_entity:受信した通知内容
+                visibility_status:botの返信時visibility
+                accepted_at:受付済みの場合は受付日時
+                on_accepted:受付時に呼び出す関数。受付日時を受け取る
+        """
+        # 以降のログに通知のstatus IDを付与する
+        with self.logger.correlation(notifi_entity.noti['id']), self.metrics.timer("stage_seconds", stage="mention"):
+            accepted = self.accept_mention(notifi_entity, visibility_status, accepted_at)
+            if accepted is None:
+                return
+            content, reply_record = accepted
+            if on_accepted is not None:
+                on_accepted(reply_record.ts_question)
+
+            # 回答文生成
+            generateToots = GenerateToots(self.context)
+            if self.config.stream_response:
+                # 生成文を受信しながら返信する
+                acct = notifi_entity.noti['account']['acct']
+                reply = self.toot_sender.open(notifi_entity.noti, acct, visibility_status, track_first=True)
+                try:
+                    generateToots.process_stream(content, reply_record, acct,
+                                                 lambda line: self.toot_sender.append(reply, line))
+                finally:
+                    self.toot_sender.finish(reply)
+            else:
+                loop = asyncio.get_event_loop()
+                res = loop.run_until_complete((generateToots.process_wait(content, reply_record)))
+
+                self.__do_toot(res, notifi_entity, visibility_status)
+
+    def __process_mention(self, notif, notifi_entity, visibility_status):
+        """返信処理
+            ワーカースレッド上で、返信要件チェックから返信までを行う。
+            Args:
+                notif:通知
+                notifi_entity:受信した通知内容
+                visibility_status:botの返信時visibility
+        """
+        try:
+            self.process_mention(notifi_entity, visibility_status)
 
         except Exception as e:
-            self.logger.critical("通知の受信に関して、エラーが発生しました。" + str(e))
-        
+            self.logger.critical("返信処理に関して、エラーが発生しました。" + str(e))
+
+        finally:
+            if self.intake is not None:
+                self.intake.complete(notif)
+
     def __set_notification(self, notif):
         """通知内容のうち処理に必要な項目をデータクラスに設定する
             Args:
@@ -119,6 +240,9 @@ class Stream(StreamListener):
                 NotifiEntity
         """
         try:
+            # リプライ本文の解析
+            mention_content = self.__edit_content(str(notif['status']['content']))
+
             return NotifiEntity(
                                 noti = notif['status'], # status
                                 visibility = str(notif['status']['visibility']), # visivility
@@ -126,7 +250,8 @@ class Stream(StreamListener):
                                 id = str(notif['status']['account']['username']), # id
                                 uri = str(notif['status']['uri']), # ユーザのインスタンスURI
                                 content_raw = str(notif['status']['content']), # リプライ内容
-                                content = str(self.__edit_content(str(notif['status']['content']))) # 質問文の編集                         
+                                content = mention_content.text, # 質問文
+                                cn_link = mention_content.cn_link # メンション以外のリンク数
             )
         except Exception as e:
             self.logger.critical("NotifiEntity設定時にエラーが発生しました。" + str(e))
@@ -135,39 +260,69 @@ class Stream(StreamListener):
     def __edit_content(self, content_raw):
         '''質問内容編集
             取り出したリプライの情報より、質問文を編集する。
+            Mastodonのh-card、Misskeyのメンションリンクを除いた本文を質問文とし、あわせてリンク数を数える。
             Args:
                 content_raw:タグを含んだリプライ文
             Returns:
-                編集済質問文
+                MentionContent
         '''
         try:
             self.logger.info("質問文の編集処理開始")
-
-            # 改行の削除
-            content_raw = str(content_raw).replace("<br>", " ")
-            content_raw = str(content_raw).replace("</br>", " ")
-            content_raw = str(content_raw).replace("<br />", " ")
-
-            html_data = BeautifulSoup(content_raw, "html.parser")
-
-            # リプライ本文を抜き出す
-            content = ""
-            if not html_data.find("span", class_='h-card'):
-                # Misskeyからのリプライ
-                if html_data.find("a").next_sibling != None:
-                    content = html_data.find("a").next_sibling
-            else:
-                # Mastodonからのリプライ
-                if html_data.find("span").next_sibling != None:
-                    content = html_data.find("span").next_sibling
-
-            # リプライ本文返却
-            return content
+            return parse_mention_content(content_raw)
         
         except Exception as e:
             self.logger.critical("質問文編集処理で、エラーが発生しました。" + str(e))
             raise e
                 
+    def __validation_rules(self):
+        '''返信要件のルール
+            判定順はValidationPipelineが判定コストと返答有無から決める。
+            Returns:
+                ValidationRuleのリスト
+        '''
+        return [
+            # 質問者にエラー内容を返答しない種類のバリデーションチェック。
+            # インスタンスチェック 他インスタンスへは返信を行わない。
+            ValidationRule("server", COST_FIELD,
+                           lambda entity, visibility: self.context.server_filter.allows(entity.uri),
+                           message="許可外サーバーからのリプライです。"),
+            # 質問者以外のアカウントへのリプライ防止
+            ValidationRule("multi_mention", COST_FIELD,
+                           lambda entity, visibility: entity.cn_mention <= 1,
+                           message="複数アカウントの検知。"),
+            # 投稿間隔チェック
+            ValidationRule("rate_limit", COST_LEDGER,
+                           lambda entity, visibility: self.__check_receive_interval(entity.id),
+                           message="投稿間隔が短いです。"),
+
+            # 質問者にエラー内容を返答する種類のバリデーションチェック。
+            # 未入力チェック
+            ValidationRule("empty", COST_FIELD,
+                           lambda entity, visibility: len(str(entity.content).replace(' ', '')) > 0,
+                           reply='質問内容を入力してください。',
+                           message="質問未入力"),
+            # URLチェック
+            ValidationRule("url", COST_FIELD,
+                           lambda entity, visibility: entity.cn_link == 0,
+                           reply='質問文にURLが含まれています。URLを削除して再度投稿してくだいさい。',
+                           message="URLを含む投稿"),
+            # 文字数チェック APIを呼び出す前に、DBに保存できない長さの質問を除外する
+            ValidationRule("too_long", COST_FIELD,
+                           lambda entity, visibility: len(entity.content) <= QUESTION_MAX_LENGTH,
+                           reply='質問文が長すぎます。{ln}文字以内で再度投稿してください。'.format(ln=QUESTION_MAX_LENGTH),
+                           message="質問文の文字数超過"),
+            # 定型文で返信済みの場合、以降の処理は行わない
+            # 投稿を伴うため投稿間隔チェックの後に判定し、コスト超過時も返信する
+            ValidationRule("canned", COST_SCAN,
+                           lambda entity, visibility: not self.__reply_canned(entity, visibility),
+                           posts=True, counted=False),
+            # コストチェック
+            ValidationRule("cost_limit", COST_LEDGER,
+                           lambda entity, visibility: not self.cost_ledger.is_over_limit(self.config.cost_limit),
+                           reply='今日はもうちょっと疲れたから、質問に答えるのはしんどいわ。でもおみくじやったらできるで。「おみくじ」って話しかけてや。',
+                           message="コスト超過"),
+        ]
+
     def __check_validation(self, notifi_entity, visibility_status):
         '''バリデーションチェック
             受信した通知が返信要件をみたいしているかを確認
@@ -180,111 +335,60 @@ class Stream(StreamListener):
         '''
         try:
             self.logger.info("バリデーションチェック")
-
-            # 質問者にエラー内容を返答しない種類のバリデーションチェック。
-            regex_pattern = "|".join(self.config.permission_server)
-            if re.match(regex_pattern, notifi_entity.uri) is None:
-                # インスタンスチェック 他インスタンスへは返信を行わない。
-                self.logger.warning("許可外サーバーからのリプライです。")
-                return False
-
-            elif notifi_entity.cn_mention > 1:
-                # 質問者以外のアカウントへのリプライ防止
-                self.logger.warning("複数アカウントの検知。")
-                return False
-            
-            elif not self.__check_receive_interval(notifi_entity.id):
-                # 投稿間隔チェック
-                self.logger.warning("投稿間隔が短いです。")
-                return False
-
-
-            # 質問者にエラー内容を返答する種類のバリデーションチェック。
-            # コスト取得
-            self.api_cost = self.__get_api_cost()
-
-            if len(str(notifi_entity.content).replace(' ', '')) == 0: 
-                # 未入力チェック
-                self.logger.warning("質問未入力")
-                self.mastodon.status_reply(notifi_entity.noti, '質問内容を入力してください。', notifi_entity.id, visibility = visibility_status)
-
-            elif(self.api_cost > float(self.config.cost_limit)):
-                # コストチェック
-                self.logger.warning("コスト超過")
-                if 'おみくじ' in notifi_entity.content:
-                    self.mastodon.status_reply(notifi_entity.noti, self.__lottery(), notifi_entity.id, visibility = visibility_status)
-
-                else:
-                    # コスト超過時告知文
-                    self.mastodon.status_reply(notifi_entity.noti, '今日はもうちょっと疲れたから、質問に答えるのはしんどいわ。でもおみくじやったらできるで。「おみくじ」って話しかけてや。',\
-                                            notifi_entity.id, visibility = visibility_status)
-
-            elif self.__check_include_url(notifi_entity.content_raw):
-                # URLチェック
-                self.logger.warning("URLを含む投稿")
-                self.mastodon.status_reply(notifi_entity.noti, '質問文にURLが含まれています。URLを削除して再度投稿してくだいさい。', notifi_entity.id, visibility = visibility_status)
-
-            else:
-                return True
+            rule = self.validation.run(notifi_entity, visibility_status)
+            if rule is None:
+                # 返信する場合のみ投稿間隔のトークンを消費する
+                return self.__acquire(notifi_entity.id)
+
+            if rule.message:
+                self.logger.warning(rule.message)
+            if rule.counted:
+                self.__reject(rule.name)
+            if rule.reply is not None:
+                self.reply(notifi_entity, rule.reply, visibility_status)
+            return False
 
         except Exception as e:
             self.logger.critical("バリデーションチェックで、エラーが発生しました。" + str(e))
             raise e        
 
-    def __get_api_cost(self):
-        """APIコスト取得
-            実行日のAPIコストを取得する。
-            Return:
-                APIコスト数
-        """
-        try:
-            # DatabaseManagerインスタンス化
-            dbmanager_instance = DatabaseManager(self.config, "SQL_001.sql")
-            # SQL実行
-            dr = dbmanager_instance.exec_select()
-
-            if dr['API_COST'] is None or len(dr['API_COST']) == 0:
-                api_cost = 0
-            else:
-                api_cost = float(dr['API_COST'])
-        
-            return api_cost
-        except Exception as e:
-            self.logger.critical("APIコスト取得処理で、エラーが発生しました。" + str(e))
-            raise e
+    def __reject(self, reason):
+        '''返信要件不備の計上
+            Args:
+                reason:理由
+        '''
+        self.metrics.inc("rejections_total", reason=reason)
+        self.reply_writer.count_rejection(reason, self.cost_ledger.today())
 
-    def __check_include_url(self, content_raw):
-        '''URLチェック
-            URLリンクが質問文に含まれる場合は返信を行わない。
+    def __reply_canned(self, notifi_entity, visibility_status):
+        '''定型文の返信
+            質問文が定型文のルールに該当する場合、DB、OpenAI APIを呼び出さずに返信する。
             Args:
-                content_raw:HTML情報を含んだ通知情報
+                notifi_entity:受信した通知内容
+                visibility_status:botの返信時visibility
             Returns:
-                True:チェックOK
-                False:チェックNG
+                True:定型文で返信した
+                False:該当するルールなし
         '''
-        try:
-            content_raw = str(content_raw).replace("<br>", " ")
-            content_raw = str(content_raw).replace("</br>", " ")
-            content_raw = str(content_raw).replace("<br />", " ")
-
-            html_data = BeautifulSoup(content_raw, "html.parser")
-
-            # リンクを抽出
-            links = html_data.find_all("a")
-
-            # URL検知
-            if len(links) > 1:
-                return True
-            else:
-                return False
-
-        except Exception as e:
-            self.logger.critical("リンクチェックで、エラーが発生しました。" + str(e))
-            raise e        
+        acct = notifi_entity.noti['account']['acct']
+        canned = self.canned_responder.match(notifi_entity.content, acct)
+        if canned is None:
+            return False
+
+        rule_name, text = canned
+        if not self.__acquire(notifi_entity.id):
+            # 返信済みとして扱い、以降の判定は行わない
+            return True
+        self.logger.info("定型文の返信:%s", rule_name)
+        self.metrics.inc("canned_responses_total", rule=rule_name)
+        self.toot_sender.send(notifi_entity.noti, acct, split_toot(text, acct), visibility_status)
+        return True
 
     def __check_receive_interval(self, id):
         '''投稿間隔チェック
             同一IDより規定時間以内に再度投稿されたかを確認する。規定時間以内の場合は処理を行わない。
+            判定はメモリ上で行い、起動直後のみ前回の投稿時刻をDBから取得する。
+            トークンは消費しないため、返信要件不備の返答後に投稿し直した質問は受け付ける。
             Args:
                 id:アカウントID
             Returns:
@@ -293,41 +397,41 @@ class Stream(StreamListener):
         '''
         try:
             self.logger.info("投稿間隔チェック")
-            # DatabaseManagerインスタンス化
-            dbmanager_instance = DatabaseManager(self.config, "SQL_002.sql")
             # SQL実行
-            dr = dbmanager_instance.exec_select((id))
-
-            # 前回の投稿時刻の取得
-            dt_recent = dr['RECENT_POST_TIME'][0]
-            
-            if dt_recent is None:
-                return True
-            else:
-                if datetime.now() > dt_recent + timedelta(seconds = int(self.config.receive_interval)):
-                    # 規定間隔を超過していた場合
-                    return True
-                else:
-                    # 規定間隔内の場合
-                    return False
+            return self.rate_limiter.allows(id)
 
         except Exception as e:
             self.logger.critical("投稿間隔チェックで、エラーが発生しました。" + str(e))
             raise e
 
+    def __acquire(self, id):
+        '''投稿間隔のトークン消費
+            返信要件チェックの後、返信を決めた時点で呼び出す。
+            同一アカウントの通知が並行して処理され、先に消費されていた場合は投稿間隔不備とする。
+            Args:
+                id:アカウントID
+            Returns:
+                True:消費した
+                False:投稿間隔が短い
+        '''
+        if self.rate_limiter.try_acquire(id):
+            return True
+        self.logger.warning("投稿間隔が短いです。")
+        self.__reject("rate_limit")
+        return False
+
     def __regist_question(self, id, ts, content):
         '''質問登録
-            質問をDB上に登録する。
+            質問を登録する。DBへは書き込みスレッドがまとめて登録する。
             Args:
                 id:アカウントID
                 ts:現在日時
                 content:本文
+            Returns:
+                ReplyRecord
         '''
         try:
-            # DatabaseManagerインスタンス化
-            dbmanager_instance = DatabaseManager(self.config, "SQL_003.sql")
-            # SQL実行
-            dbmanager_instance.exec_query(id, ts, content)
+            return self.reply_writer.regist_question(id, ts, content)
         
         except Exception as e:
             self.logger.critical("DB登録に関して、エラーが発生しました。" + str(e))
@@ -347,45 +451,20 @@ class Stream(StreamListener):
                 self.mastodon.status_post('予期せぬエラーの発生。強制終了します。', visibility = 'unlisted')
                 exit()
 
-            # 予期せぬリプライの防止
-            response = str(response).replace('@', '＠')
-
             self.logger.info("トゥート")
-            if len('@' + notifi_entity.id + ' ' + response) > 500:  # トゥート上限エラー回避。
-                length = len('@' + notifi_entity.id + ' ' + response)
-                splitLine =  [response[i:i+450] for i in range(0, length, 450)]
-
-                for num in range(len(splitLine)):
-                    # 返信
-                    self.mastodon.status_reply(notifi_entity.noti,
-                                str(splitLine[num]),
-                                notifi_entity.id,
-                                visibility = visibility_param)
-            else:
-                # 返信
-                self.mastodon.status_reply(notifi_entity.noti,
-                        str(response),
-                        notifi_entity.id,
-                        visibility = visibility_param)
+            # 返信 投稿は送信スレッドが行う
+            acct = notifi_entity.noti['account']['acct']
+            self.toot_sender.send(notifi_entity.noti, acct, split_toot(response, acct), visibility_param)
                 
         except Exception as e:
             self.logger.critical("トゥート処理にて、エラーが発生しました。" + str(e))
             raise e
-        
-    def __lottery(self):
-        '''おみくじ
-            Returns:
-                result:結果
-        '''
-        result = ''
-        lines = ''
-
-        lineCnt = len(open(self.config.lottery_path).readlines())
 
-        linePos = random.randint(1, lineCnt);
-
-        with open(self.config.lottery_path, "r") as f:
-            lines = f.read().splitlines()
-        
-        result = lines[linePos]
-        return result
\ No newline at end of file
+    def reply(self, notifi_entity, text, visibility_param):
+        """定型文の返信
+            Args:
+                notifi_entity:通知情報保持データエンティティ
+                text:返信文
+                visibility_param:返信時のvisibility
+        """
+        self.toot_sender.send(notifi_entity.noti, notifi_entity.noti['account']['acct'], [text], visibility_param)
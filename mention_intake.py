@@ -0,0 +1,406 @@
+"""mention_intake.py
+    通知の取り込み
+    処理を終えた通知IDをDB(AIB_T_INTAKE_STATE)に記録し、起動時・再接続時にそれ以降のmentionを一括取得する(バックフィル)。
+    処理中の通知より新しい通知IDは記録しないため、停止時に処理中だった通知は次回のバックフィルで再取得する。
+    処理できずに破棄した通知は処理中のまま保持し、一定間隔で再処理する。
+    Streamとバックフィルで重複して受信した通知は1回だけ処理する。処理を終えたmentionのstatus IDはDB(AIB_T_INTAKE_PROCESSED)にも記録し、
+    再起動後のバックフィルで処理済みのmentionを再処理しない。
+"""
+import collections
+import random
+import threading
+import time
+
+from mastodon import StreamListener
+
+
+# バックフィルで1回に取得する通知数(APIの上限)
+BACKFILL_PAGE_SIZE = 40
+# 重複判定のため保持する通知IDの件数
+RECENT_IDS_MAX = 10000
+# 再接続時の待機秒数(初回、上限)
+RECONNECT_WAIT_MIN = 1.0
+RECONNECT_WAIT_MAX = 60.0
+# 無通信の確認間隔(秒)
+WATCH_INTERVAL = 1.0
+# 破棄した通知の再処理間隔(秒)
+RETRY_INTERVAL = 5.0
+# 処理済みのmentionを記録しておく日数
+PROCESSED_RETENTION_DAYS = 7
+
+
+class IntakeListener(StreamListener):
+    """StreamListenerを継承
+       受信時刻を記録し、未処理のmentionのみ処理を委譲する
+    """
+    def __init__(self, intake, handler):
+        """コンストラクタ
+            Args:
+                intake:MentionIntakeインスタンス
+                handler:通知を受け取る関数
+        """
+        self.intake = intake
+        self.handler = handler
+
+    def on_notification(self, notif):
+        """通知受信処理
+            委譲先は処理を終えた時点でMentionIntake.complete、破棄した場合はMentionIntake.releaseを呼び出す。
+            破棄した通知はMentionIntakeが同じ委譲先で再処理する。
+            Args:
+                notif:通知
+        """
+        self.intake.touch()
+        if notif['type'] == 'mention' and self.intake.accept(notif):
+            self.handler(notif)
+
+    def on_update(self, status):
+        """ステータス受信処理
+            受信時刻の記録のみ行う。
+            Args:
+                status:ステータス
+        """
+        self.intake.touch()
+
+    def handle_heartbeat(self):
+        """ハートビート受信処理
+        """
+        self.intake.touch()
+
+
+class MentionIntake:
+    """通知の取り込み
+        プロセス内で1インスタンスを生成し、Stream受信処理で使用する。
+        Streamの無通信がstream_silence_timeout秒続いた場合は切断とみなし、待機時間を延ばしながら再接続する。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.logger = context.logger
+        self.metrics = context.metrics
+        self.db_manager = context.db_manager
+        self.__lock = threading.Lock()
+        self.__save_lock = threading.Lock()
+        # 重複判定用の受付済み通知ID
+        self.__recent = collections.OrderedDict()
+        # 受け付けて処理を終えていない通知ID
+        self.__outstanding = set()
+        # 処理を終えた、未記録の通知ID
+        self.__completed = set()
+        # 破棄した、再処理待ちの通知(通知ID -> 通知)
+        self.__released = collections.OrderedDict()
+        self.__retried_at = time.monotonic()
+        # 接続からバックフィル完了までは通知IDを記録しない
+        self.__backfilling = False
+        self.__last_event_at = time.monotonic()
+        # 統計情報
+        self.__backfilled_cnt = 0
+        self.__duplicate_cnt = 0
+        self.__reconnect_cnt = 0
+
+        self.state_key = context.config.account_id
+        self.checkpoint = self.db_manager.fetch_scalar("SQL_025.sql", self.state_key)
+
+    @property
+    def config(self):
+        """外部設定ファイル保持データクラス
+            SIGHUPによる再読込を反映するため、contextから都度参照する。
+        """
+        return self.context.config
+
+    def run(self, handler):
+        """Stream受信
+            接続後にバックフィルを行い、以降は無通信を監視する。切断、無通信時は再接続する。
+            停止(Ctrl+C)されるまで戻らない。
+            Args:
+                handler:通知を受け取る関数
+        """
+        wait = RECONNECT_WAIT_MIN
+        while True:
+            connected_at = time.monotonic()
+            handle = None
+            try:
+                self.touch()
+                self.hold_checkpoint()
+                handle = self.context.mastodon.stream_user(IntakeListener(self, handler),
+                                                           run_async = True,
+                                                           timeout = self.config.stream_silence_timeout)
+                self.logger.info("StreamListnerの起動")
+                # 接続後に取得し、接続までの間の通知を取りこぼさない
+                self.backfill(handler)
+                reason = self.__watch(handle, handler)
+            except Exception as e:
+                self.logger.warning("Streamの接続に失敗しました。" + str(e))
+                reason = "error"
+            finally:
+                if handle is not None:
+                    handle.close()
+
+            self.metrics.inc("stream_reconnects_total", reason=reason)
+            with self.__lock:
+                self.__reconnect_cnt += 1
+            if time.monotonic() - connected_at >= RECONNECT_WAIT_MAX:
+                # 一定時間接続できていた場合は、待機時間を初期値に戻す
+                wait = RECONNECT_WAIT_MIN
+            time.sleep(wait * random.uniform(0.5, 1.5))
+            wait = min(wait * 2, RECONNECT_WAIT_MAX)
+
+    def hold_checkpoint(self):
+        """通知IDの記録保留
+            Streamの接続前に呼び出す。バックフィルが完了するまで、処理を終えた通知IDは記録しない。
+        """
+        with self.__lock:
+            self.__backfilling = True
+
+    def touch(self):
+        """受信時刻記録
+        """
+        self.__last_event_at = time.monotonic()
+
+    def silent_for(self):
+        """無通信時間
+            Return:
+                最後に受信してからの秒数
+        """
+        return time.monotonic() - self.__last_event_at
+
+    def accept(self, notif, backfill=False):
+        """通知受付
+            受付済みの通知でなければ、処理中の通知とする。
+            バックフィルで取得した通知は、処理済みのmentionとしてDBに記録されている場合も受付済みとする。
+            Args:
+                notif:通知
+                backfill:バックフィルで取得した通知の場合True
+            Return:
+                True:未処理の通知
+                False:受付済みの通知
+        """
+        notif_id = str(notif['id'])
+        processed = backfill and self.__is_processed(notif)
+        with self.__lock:
+            if notif_id in self.__recent:
+                self.__duplicate_cnt += 1
+                duplicate = True
+            elif processed:
+                # 前回の起動までに処理済み。処理を終えた通知として通知IDを記録する
+                self.__duplicate_cnt += 1
+                duplicate = True
+                self.__recent[notif_id] = True
+                if len(self.__recent) > RECENT_IDS_MAX:
+                    self.__recent.popitem(last=False)
+                self.__completed.add(notif_id)
+            else:
+                duplicate = False
+                self.__recent[notif_id] = True
+                if len(self.__recent) > RECENT_IDS_MAX:
+                    self.__recent.popitem(last=False)
+                self.__outstanding.add(notif_id)
+                if backfill:
+                    self.__backfilled_cnt += 1
+
+        if duplicate:
+            self.metrics.inc("intake_duplicates_total")
+            return False
+        self.metrics.inc("intake_notifications_total", source="backfill" if backfill else "stream")
+        return True
+
+    def complete(self, notif):
+        """処理完了
+            返信、返信要件不備、ジョブ登録等で処理を終えた通知とし、処理中の通知より古い範囲の通知IDを記録する。
+            Args:
+                notif:acceptで受け付けた通知
+        """
+        notif_id = str(notif['id'])
+        with self.__lock:
+            if notif_id not in self.__outstanding:
+                return
+            self.__outstanding.discard(notif_id)
+            self.__completed.add(notif_id)
+        self.__record_processed(notif)
+        self.__advance()
+
+    def release(self, notif):
+        """処理破棄
+            処理できずに破棄した通知とする。処理中のまま保持し、retry_releasedで再処理する。
+            再処理を終えるまで通知IDは記録しないため、停止した場合は次回のバックフィルで再取得する。
+            Args:
+                notif:acceptで受け付けた通知
+        """
+        notif_id = str(notif['id'])
+        with self.__lock:
+            if notif_id not in self.__outstanding:
+                return
+            self.__released[notif_id] = notif
+        self.metrics.inc("intake_released_total")
+
+    def retry_released(self, handler):
+        """破棄した通知の再処理
+            再処理でも破棄した場合は、委譲先が再度releaseを呼び出す。
+            Args:
+                handler:通知を受け取る関数
+            Return:
+                再処理した通知数
+        """
+        with self.__lock:
+            released = list(self.__released.values())
+            self.__released.clear()
+            self.__retried_at = time.monotonic()
+        for notif in released:
+            handler(notif)
+        if released:
+            self.logger.info("破棄したmentionを%d件再処理しました。", len(released))
+            self.metrics.inc("intake_retries_total", len(released))
+        return len(released)
+
+    def backfill(self, handler):
+        """バックフィル
+            記録済みの通知ID以降のmentionを古い順に取得し、未処理のものを処理する。
+            初回起動時(記録なし)は取得せず、最新の通知IDを記録する。
+            すべて取得した場合のみ、保留していた処理済みの通知IDを記録する。
+            取得に失敗した場合は保留したままとし、次回のバックフィルで記録済みの通知IDから再取得する。
+            Args:
+                handler:通知を受け取る関数
+            Return:
+                処理した通知数
+        """
+        self.hold_checkpoint()
+        count = 0
+        min_id = self.checkpoint
+        if min_id is None:
+            page = self.context.mastodon.notifications(types=["mention"], limit=1)
+            if page:
+                self.__save(str(page[0]['id']))
+        else:
+            for _ in range(self.config.backfill_max_pages):
+                # min_idの直後から取得する。ページ内は新しい順のため並べ替える
+                page = self.context.mastodon.notifications(types=["mention"], min_id=min_id, limit=BACKFILL_PAGE_SIZE)
+                if not page:
+                    break
+                page = sorted(page, key=lambda notif: _id_key(notif['id']))
+                for notif in page:
+                    if self.accept(notif, backfill=True):
+                        handler(notif)
+                        count += 1
+                min_id = str(page[-1]['id'])
+                if len(page) < BACKFILL_PAGE_SIZE:
+                    break
+            else:
+                self.logger.warning("バックフィルの取得上限に達しました。以降の未取得の通知は処理しません。")
+
+        with self.__lock:
+            self.__backfilling = False
+        self.__advance()
+
+        if count:
+            self.logger.info("未処理のmentionを%d件取得しました。", count)
+        return count
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                処理中件数、バックフィル件数、重複件数、再接続回数、無通信時間
+        """
+        with self.__lock:
+            return {
+                "outstanding_count": len(self.__outstanding),
+                "released_count": len(self.__released),
+                "backfilled_count": self.__backfilled_cnt,
+                "duplicate_count": self.__duplicate_cnt,
+                "reconnect_count": self.__reconnect_cnt,
+                "silent_seconds": self.silent_for(),
+            }
+
+    def __watch(self, handle, handler):
+        """無通信監視
+            あわせて、破棄した通知をRETRY_INTERVAL秒ごとに再処理する。
+            Args:
+                handle:Streamのハンドル
+                handler:通知を受け取る関数
+            Return:
+                切断理由
+        """
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            if time.monotonic() - self.__retried_at >= RETRY_INTERVAL:
+                self.retry_released(handler)
+            if not handle.is_alive():
+                self.logger.warning("Streamが切断されました。")
+                return "closed"
+            if self.silent_for() > self.config.stream_silence_timeout:
+                self.logger.warning("Streamの無通信が%d秒続いたため、再接続します。", self.config.stream_silence_timeout)
+                return "silent"
+
+    def __advance(self):
+        """処理済み範囲の記録
+            処理中の最も古い通知より前の、処理を終えた通知IDのうち最新のものを記録する。
+        """
+        with self.__lock:
+            if self.__backfilling or not self.__completed:
+                return
+            oldest = min(self.__outstanding, key=_id_key) if self.__outstanding else None
+            done = [notif_id for notif_id in self.__completed
+                    if oldest is None or _id_key(notif_id) < _id_key(oldest)]
+            if not done:
+                return
+            self.__completed.difference_update(done)
+        self.__save(max(done, key=_id_key))
+
+    def __is_processed(self, notif):
+        """処理済み判定
+            Args:
+                notif:通知
+            Return:
+                True:処理済みのmentionとしてDBに記録されている
+                False:未記録
+        """
+        try:
+            return self.db_manager.fetch_scalar("SQL_043.sql", self.state_key, str(notif['status']['id'])) is not None
+        except Exception as e:
+            # 判定できない場合は処理する
+            self.logger.error("処理済みのmentionの確認に失敗しました。" + str(e))
+            return False
+
+    def __record_processed(self, notif):
+        """処理済みのmentionの記録
+            Args:
+                notif:通知
+        """
+        status = notif.get('status')
+        if not status:
+            return
+        try:
+            self.db_manager.exec_query("SQL_042.sql", self.state_key, str(status['id']))
+        except Exception as e:
+            # 記録できなかった場合は、再起動後のバックフィルで重複して処理する
+            self.logger.error("処理済みのmentionの記録に失敗しました。" + str(e))
+
+    def __save(self, notif_id):
+        """通知ID記録
+            記録済みの通知IDより新しい場合のみ記録する。
+            Args:
+                notif_id:通知ID
+        """
+        # 古い通知IDで上書きしないよう、判定から登録までを排他する
+        with self.__save_lock:
+            if self.checkpoint is not None and _id_key(notif_id) <= _id_key(self.checkpoint):
+                return
+            self.checkpoint = notif_id
+            try:
+                self.db_manager.exec_query("SQL_026.sql", self.state_key, notif_id)
+            except Exception as e:
+                # 記録できなかった場合は、次回の起動時に重複して取得する
+                self.logger.error("通知IDの記録に失敗しました。" + str(e))
+
+
+def _id_key(notif_id):
+    """通知IDの比較キー
+        MastodonのIDは数字の文字列のため、桁数、文字列の順で比較する。
+        Args:
+            notif_id:通知ID
+        Return:
+            比較キー
+    """
+    notif_id = str(notif_id)
+    return (len(notif_id), notif_id)
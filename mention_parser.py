@@ -0,0 +1,94 @@
+"""mention_parser.py
+    リプライ本文(HTML)の解析
+    1回の走査で質問文、リンク数、メンション先を取り出す。
+"""
+import dataclasses
+from html.parser import HTMLParser
+import re
+from typing import List
+
+
+# 質問文の区切りとして空白に置き換えるタグ
+BREAK_TAGS = ("br", "p")
+
+
+@dataclasses.dataclass
+class MentionContent:
+    """データエンティティ
+        リプライ本文の解析結果保持用エンティティクラス
+    """
+    text: str
+    cn_link: int
+    mentions: List[str]
+
+
+class MentionContentParser(HTMLParser):
+    """リプライ本文解析
+        Mastodonのh-card、Misskeyのメンションリンクを読み飛ばし、残りのテキストを質問文とする。
+    """
+    def __init__(self):
+        """コンストラクタ
+        """
+        super().__init__(convert_charrefs=True)
+        self.texts = []
+        self.cn_link = 0
+        self.mentions = []
+        # メンション部分の入れ子の深さ。0より大きい間のテキストは質問文に含めない
+        self.__mention_depth = 0
+        self.__mention_text = []
+        self.__open_tags = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BREAK_TAGS:
+            self.texts.append(" ")
+            return
+
+        classes = (dict(attrs).get("class") or "").split()
+        if self.__mention_depth > 0:
+            self.__mention_depth += 1
+        elif (tag == "span" and "h-card" in classes) or (tag == "a" and "mention" in classes and "hashtag" not in classes):
+            # メンション開始
+            self.__mention_depth = 1
+            self.__mention_text = []
+        elif tag == "a":
+            # メンション以外のリンク(URL、ハッシュタグ)
+            self.cn_link += 1
+        self.__open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in BREAK_TAGS:
+            self.texts.append(" ")
+            return
+
+        if tag not in self.__open_tags:
+            return
+        # 閉じ忘れのタグはまとめて閉じる
+        while self.__open_tags:
+            opened = self.__open_tags.pop()
+            if self.__mention_depth > 0:
+                self.__mention_depth -= 1
+                if self.__mention_depth == 0:
+                    self.mentions.append("".join(self.__mention_text).strip())
+            if opened == tag:
+                break
+
+    def handle_data(self, data):
+        if self.__mention_depth > 0:
+            self.__mention_text.append(data)
+        else:
+            self.texts.append(data)
+
+
+def parse_mention_content(content_raw):
+    """リプライ本文解析
+        Args:
+            content_raw:タグを含んだリプライ文
+        Returns:
+            MentionContent
+    """
+    parser = MentionContentParser()
+    parser.feed(str(content_raw))
+    parser.close()
+
+    text = re.sub(r"\s+", " ", "".join(parser.texts)).strip()
+    return MentionContent(text=text, cn_link=parser.cn_link, mentions=parser.mentions)
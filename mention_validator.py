@@ -0,0 +1,118 @@
+"""mention_validator.py
+    返信要件チェック
+    受信した通知の返信要件をルールの並びとして宣言し、判定コストの小さいルールから順に判定する。
+    いずれかのルールを満たさない時点で以降の判定は行わない。
+"""
+import dataclasses
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+
+# ルールの判定コスト
+COST_FIELD = 1     # 通知内容の値の比較のみ
+COST_SCAN = 2      # 質問文の走査
+COST_LEDGER = 3    # メモリ上の集計値。必要に応じてDBを参照する
+
+
+@dataclasses.dataclass
+class ValidationRule:
+    """データエンティティ
+        返信要件のルール保持用エンティティクラス
+    """
+    # ルール名。返信要件不備の理由として計上する
+    name: str
+    # 判定コスト(COST_*)
+    cost: int
+    # 判定関数。引数は(通知内容, botの返信時visibility)、要件を満たす場合True
+    check: Callable
+    # 要件を満たさない場合に質問者へ返答する文。Noneの場合は返答しない
+    reply: Optional[str] = None
+    # 判定関数内で投稿する場合True(定型文の返信等)
+    posts: bool = False
+    # 要件を満たさない場合の警告ログ
+    message: str = ""
+    # 返信要件不備として計上する場合True。定型文の返信等、判定関数内で処理済みの場合False
+    counted: bool = True
+
+    @property
+    def replies(self):
+        """質問者への返答有無
+            返答文を持つルール、判定関数内で投稿するルールはTrue
+        """
+        return self.reply is not None or self.posts
+
+
+class ValidationPipeline:
+    """返信要件チェックの実行
+        返答しないルールを先に、返答するルール(ValidationRule.replies)を後に判定し、それぞれの中では判定コストの小さい順とする(同じコストは宣言順)。
+        返答するルールは投稿を伴うため、投稿間隔チェック等の返答しないルールをすべて満たした場合のみ判定する。
+    """
+    def __init__(self, rules, metrics):
+        """コンストラクタ
+            Args:
+                rules:ValidationRuleのリスト
+                metrics:MetricsRegistryインスタンス
+        """
+        self.rules = sorted(rules, key=lambda rule: (rule.replies, rule.cost))
+        self.metrics = metrics
+
+    def run(self, notifi_entity, visibility_status):
+        """返信要件チェック
+            Args:
+                notifi_entity:受信した通知内容
+                visibility_status:botの返信時visibility
+            Return:
+                要件を満たさなかったルール。すべて満たす場合None
+        """
+        for rule in self.rules:
+            passed = rule.check(notifi_entity, visibility_status)
+            # ルール別の判定件数、不備件数
+            self.metrics.inc("validation_checks_total", rule=rule.name)
+            if not passed:
+                self.metrics.inc("validation_rejections_total", rule=rule.name)
+                return rule
+        return None
+
+
+class ServerFilter:
+    """サーバー判定
+        許可サーバー(permission_server)、拒否サーバー(block_server)をホスト名の集合として保持し、
+        statusのURIのホスト名で判定する。許可サーバーが未設定の場合は、拒否サーバー以外を許可する。
+    """
+    def __init__(self, config):
+        """コンストラクタ
+            Args:
+                config:外部設定ファイル保持データクラス
+        """
+        self.allowed = frozenset(_hostname(server) for server in config.permission_server)
+        self.blocked = frozenset(_hostname(server) for server in config.block_server)
+
+    def allows(self, uri):
+        """許可判定
+            Args:
+                uri:statusのURI
+            Return:
+                True:許可
+                False:許可外
+        """
+        host = _hostname(uri)
+        if not host or host in self.blocked:
+            return False
+        return not self.allowed or host in self.allowed
+
+
+def _hostname(value):
+    """ホスト名取得
+        URL(https://example.com/...)、ホスト名(example.com)のいずれからも小文字のホスト名を返す。
+        Args:
+            value:URLまたはホスト名
+        Return:
+            ホスト名。取得できない場合は空文字
+    """
+    value = str(value).strip()
+    if "//" not in value:
+        value = "//" + value
+    try:
+        return urlsplit(value).hostname or ""
+    except ValueError:
+        return ""
@@ -0,0 +1,345 @@
+"""metrics.py
+    処理段階ごとの処理時間、件数の計測
+    計測値はメモリ上に保持し、Prometheus形式のHTTPエンドポイントと定期的なサマリファイルで出力する。
+"""
+import contextlib
+import datetime
+import http.server
+import json
+import os
+import threading
+import time
+
+
+JST = datetime.timezone(datetime.timedelta(hours=9), 'JST')
+
+# 処理時間のヒストグラムの区切り(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# メトリクス名の接頭辞
+PREFIX = "nandemo_"
+
+
+class Histogram:
+    """ヒストグラム
+        区切りごとの件数、合計、件数を保持する。排他はMetricsRegistryで行う。
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        """コンストラクタ
+            Args:
+                buckets:区切り(昇順)
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """計測値追加
+            Args:
+                value:計測値
+        """
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """分位点(区切り内で線形補間した推定値)
+            Args:
+                q:0～1
+            Return:
+                推定値。計測値がない場合None
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for index, bucket_cnt in enumerate(self.counts):
+            upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+            if bucket_cnt and cumulative + bucket_cnt >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / bucket_cnt
+            cumulative += bucket_cnt
+            lower = upper
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """メトリクス保持
+        プロセス内で1インスタンスを生成し、各処理で共有する。
+        名前はPREFIXを除いた名前で指定し、ラベルはキーワード引数で指定する。
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """コンストラクタ
+            Args:
+                buckets:処理時間のヒストグラムの区切り(秒)
+        """
+        self.buckets = tuple(buckets)
+        self.__lock = threading.Lock()
+        self.__counters = {}
+        self.__histograms = {}
+        self.__gauges = {}
+        self.__started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        """カウンタ加算
+            Args:
+                name:メトリクス名
+                value:加算値
+                labels:ラベル
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """ヒストグラムへ計測値追加
+            Args:
+                name:メトリクス名
+                value:計測値(秒)
+                labels:ラベル
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """処理時間計測
+            ブロックの処理時間をヒストグラムへ追加する。例外発生時も計測する。
+            Args:
+                name:メトリクス名
+                labels:ラベル
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def register_gauge(self, name, func):
+        """ゲージ登録
+            出力時にfuncを呼び出して値を取得する。
+            Args:
+                name:メトリクス名
+                func:値を返す関数。ラベル別の値はdictで返す
+        """
+        with self.__lock:
+            self.__gauges[name] = func
+
+    def render(self):
+        """Prometheus形式の出力
+            Return:
+                テキスト形式のメトリクス
+        """
+        with self.__lock:
+            counters = sorted(self.__counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in self.__histograms.items())
+            gauges = sorted(self.__gauges.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append("# TYPE {nm} counter".format(nm=PREFIX + name))
+                typed.add(name)
+            lines.append("{nm}{lb} {val}".format(nm=PREFIX + name, lb=_format_labels(labels), val=_format_value(value)))
+
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in typed:
+                lines.append("# TYPE {nm} histogram".format(nm=PREFIX + name))
+                typed.add(name)
+            cumulative = 0
+            for index, bucket in enumerate(self.buckets):
+                cumulative += counts[index]
+                lines.append("{nm}_bucket{lb} {val}".format(nm=PREFIX + name,
+                                                           lb=_format_labels(labels + (("le", _format_value(bucket)),)),
+                                                           val=cumulative))
+            lines.append("{nm}_bucket{lb} {val}".format(nm=PREFIX + name, lb=_format_labels(labels + (("le", "+Inf"),)), val=count))
+            lines.append("{nm}_sum{lb} {val}".format(nm=PREFIX + name, lb=_format_labels(labels), val=_format_value(total)))
+            lines.append("{nm}_count{lb} {val}".format(nm=PREFIX + name, lb=_format_labels(labels), val=count))
+
+        for name, func in gauges:
+            lines.append("# TYPE {nm} gauge".format(nm=PREFIX + name))
+            for labels, value in _gauge_values(func):
+                lines.append("{nm}{lb} {val}".format(nm=PREFIX + name, lb=_format_labels(labels), val=_format_value(value)))
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """サマリ
+            Return:
+                カウンタ、処理時間の件数・平均・分位点、ゲージの値
+        """
+        with self.__lock:
+            counters = {name + _format_labels(labels): value for (name, labels), value in sorted(self.__counters.items())}
+            timings = {}
+            for (name, labels), histogram in sorted(self.__histograms.items()):
+                timings[name + _format_labels(labels)] = {
+                    "count": histogram.count,
+                    "avg": histogram.sum / histogram.count if histogram.count else None,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+            gauges = sorted(self.__gauges.items())
+
+        return {
+            "time": datetime.datetime.now(JST).isoformat(timespec="seconds"),
+            "uptime": time.time() - self.__started_at,
+            "counters": counters,
+            "timings": timings,
+            "gauges": {name + _format_labels(labels): value for name, func in gauges for labels, value in _gauge_values(func)},
+        }
+
+
+class MetricsServer:
+    """メトリクス出力
+        Prometheus形式のHTTPエンドポイント(/metrics)と、定期的なサマリファイル出力を行う。
+    """
+    def __init__(self, registry, config, logger):
+        """コンストラクタ
+            Args:
+                registry:MetricsRegistryインスタンス
+                config:外部設定ファイル保持データクラス
+                logger:ロガーインスタンス
+        """
+        self.registry = registry
+        self.host = config.metrics_host
+        self.port = int(config.metrics_port)
+        self.summary_interval = float(config.metrics_summary_interval)
+        self.file_path = os.path.dirname(os.path.abspath(__file__)) + config.file_save_dir + '/' + config.file_nm_base + '_metrics_{p}.log'
+        self.logger = logger
+        self.__httpd = None
+        self.__stop = threading.Event()
+        self.__threads = []
+
+    def start(self):
+        """出力開始
+            metrics_portが0の場合HTTPエンドポイント、metrics_summary_intervalが0の場合サマリファイルを出力しない。
+        """
+        if self.port > 0:
+            try:
+                self.__httpd = http.server.ThreadingHTTPServer((self.host, self.port), self.__handler_class())
+            except OSError as e:
+                # 計測の不備でbotを止めない
+                self.logger.error("メトリクスのHTTPエンドポイントを起動できませんでした。" + str(e))
+            else:
+                self.__httpd.daemon_threads = True
+                self.__start_thread("metrics-http", self.__httpd.serve_forever)
+                self.logger.info("メトリクス出力 http://%s:%d/metrics", self.host, self.port)
+
+        if self.summary_interval > 0:
+            self.__start_thread("metrics-summary", self.__run_summary)
+
+    def stop(self):
+        """出力停止
+            停止時にサマリを1回出力する。
+        """
+        self.__stop.set()
+        if self.__httpd is not None:
+            self.__httpd.shutdown()
+            self.__httpd.server_close()
+        if self.summary_interval > 0:
+            self.write_summary()
+
+    def write_summary(self):
+        """サマリファイル出力
+            1行1サマリのJSON形式で追記する。
+        """
+        try:
+            path = self.file_path.format(p=datetime.datetime.now(JST).strftime('%Y%m%d'))
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.registry.summary(), ensure_ascii=False) + "\n")
+        except Exception as e:
+            self.logger.error("メトリクスのサマリを出力できませんでした。" + str(e))
+
+    def __run_summary(self):
+        """サマリ出力スレッド
+        """
+        while not self.__stop.wait(self.summary_interval):
+            self.write_summary()
+
+    def __start_thread(self, name, target):
+        """スレッド起動
+            Args:
+                name:スレッド名
+                target:実行処理
+        """
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.__threads.append(thread)
+
+    def __handler_class(self):
+        """HTTPリクエストハンドラ生成
+            Return:
+                リクエストハンドラクラス
+        """
+        registry = self.registry
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # アクセスログは出力しない
+                pass
+
+        return MetricsHandler
+
+
+def _gauge_values(func):
+    """ゲージ値取得
+        Args:
+            func:値を返す関数
+        Return:
+            (ラベル, 値)のリスト
+    """
+    try:
+        value = func()
+    except Exception:
+        return []
+    if isinstance(value, dict):
+        return [((("name", str(label)),), item) for label, item in sorted(value.items()) if isinstance(item, (int, float))]
+    return [((), value)]
+
+
+def _format_labels(labels):
+    """ラベル編集
+        Args:
+            labels:(名前, 値)のタプル
+        Return:
+            {name="value",...}形式の文字列
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join('{k}="{v}"'.format(k=key, v=str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for key, value in labels) + "}"
+
+
+def _format_value(value):
+    """値編集
+        Args:
+            value:数値
+        Return:
+            文字列
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
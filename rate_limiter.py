@@ -0,0 +1,205 @@
+"""rate_limiter.py
+    アカウント別の投稿間隔制御
+    トークンバケットをメモリ上で保持し、DBを参照せずに投稿間隔をチェックする。
+"""
+import collections
+import threading
+import time
+
+from cost_ledger import now_jst
+
+
+class TokenBucket:
+    """トークンバケット
+        アカウント1件分の残りトークン数を保持する。
+    """
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens, updated_at):
+        """コンストラクタ
+            Args:
+                tokens:残りトークン数
+                updated_at:最終更新時刻(time.monotonic)
+        """
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class RateLimiter:
+    """投稿間隔制御
+        burst件まで連続で受け付け、以降はrefill_interval秒ごとに1件ずつ受付可能数を回復する。
+        burst=1、refill_interval=receive_intervalのとき、従来の固定間隔チェックと同じ動作となる。
+        sharedの場合は、バケットをDB(AIB_T_RATE_BUCKET)に保持して複数のワーカープロセスで共有する。
+    """
+    def __init__(self, db_manager, receive_interval, burst=1, refill_interval=None, max_users=10000, shared=False):
+        """コンストラクタ
+            Args:
+                db_manager:DatabaseManagerインスタンス
+                receive_interval:投稿間隔(秒)
+                burst:連続で受け付ける件数
+                refill_interval:1件回復するまでの秒数。未指定時はreceive_interval
+                max_users:保持するアカウント数の上限
+                shared:バケットを複数プロセスで共有する場合True
+        """
+        self.db_manager = db_manager
+        self.shared = shared
+        self.__started_at = time.monotonic()
+        self.__buckets = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.configure(receive_interval, burst, refill_interval, max_users)
+
+    def configure(self, receive_interval, burst=1, refill_interval=None, max_users=10000):
+        """設定変更
+            設定の再読込時に呼び出す。保持中のアカウントの残りトークン数は新しいburstを上限とする。
+            Args:
+                receive_interval:投稿間隔(秒)
+                burst:連続で受け付ける件数
+                refill_interval:1件回復するまでの秒数。未指定時はreceive_interval
+                max_users:保持するアカウント数の上限
+        """
+        with self.__lock:
+            self.burst = float(burst)
+            self.refill_interval = float(refill_interval if refill_interval else receive_interval)
+            self.max_users = int(max_users)
+            # バケットが満杯に戻るまでの秒数。これ以上操作のないアカウントは保持不要
+            self.full_refill_time = self.burst * self.refill_interval
+            for bucket in self.__buckets.values():
+                bucket.tokens = min(bucket.tokens, self.burst)
+
+    def allows(self, id):
+        """受付可否
+            トークンは消費しない。返信要件チェックで使用し、消費は返信を決めた時点でtry_acquireにより行う。
+            Args:
+                id:アカウントID
+            Returns:
+                True:受付可
+                False:投稿間隔が短い
+        """
+        if self.shared:
+            return self.__shared_tokens(id, now_jst()) >= 1
+
+        now = time.monotonic()
+        bucket = self.__prepare(id, now)
+        with self.__lock:
+            bucket = self.__buckets.setdefault(id, bucket)
+            self.__refill(bucket, now)
+            return bucket.tokens >= 1
+
+    def try_acquire(self, id):
+        """受付判定
+            受付可能な場合はトークンを1件消費する。
+            Args:
+                id:アカウントID
+            Returns:
+                True:受付可
+                False:投稿間隔が短い
+        """
+        if self.shared:
+            return self.__try_acquire_shared(id)
+
+        now = time.monotonic()
+        bucket = self.__prepare(id, now)
+        with self.__lock:
+            # 初回参照時は他スレッドが先に登録していればそちらを使う
+            bucket = self.__buckets.setdefault(id, bucket)
+            self.__buckets.move_to_end(id)
+
+            self.__refill(bucket, now)
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                accepted = True
+            else:
+                accepted = False
+
+            self.__evict(now)
+            return accepted
+
+    def __try_acquire_shared(self, id):
+        """受付判定(共有)
+            同一アカウントの通知はジョブキューが1件ずつ処理するため、読込から登録までの間に他プロセスが更新することはない。
+            Args:
+                id:アカウントID
+            Returns:
+                True:受付可
+                False:投稿間隔が短い
+        """
+        now = now_jst()
+        tokens = self.__shared_tokens(id, now)
+        accepted = tokens >= 1
+        if accepted:
+            tokens -= 1
+        self.db_manager.exec_query("SQL_024.sql", id, tokens, now)
+        return accepted
+
+    def __shared_tokens(self, id, now):
+        """残りトークン数取得(共有)
+            Args:
+                id:アカウントID
+                now:現在日時
+            Return:
+                残りトークン数
+        """
+        row = self.db_manager.fetch_one("SQL_023.sql", id)
+        if row is None:
+            return self.burst
+        elapsed = max((now - row.REFILLED_AT).total_seconds(), 0.0)
+        return min(self.burst, float(row.TOKENS) + elapsed / self.refill_interval)
+
+    def __prepare(self, id, now):
+        """バケット取得
+            保持していないアカウントは初期化したバケットを返す。登録は呼び出し元で行う。
+            Args:
+                id:アカウントID
+                now:現在時刻(time.monotonic)
+            Return:
+                TokenBucket
+        """
+        with self.__lock:
+            bucket = self.__buckets.get(id)
+        if bucket is None:
+            bucket = self.__warm(id, now)
+        return bucket
+
+    def __warm(self, id, now):
+        """バケット初期化
+            起動直後は前回の投稿時刻をDBから取得して残りトークン数を求める。
+            起動からバケットが満杯に戻る時間が経過していれば、未保持のアカウントは満杯とみなす。
+            Args:
+                id:アカウントID
+                now:現在時刻(time.monotonic)
+            Return:
+                TokenBucket
+        """
+        if now - self.__started_at >= self.full_refill_time:
+            return TokenBucket(self.burst, now)
+
+        dt_recent = self.db_manager.fetch_scalar("SQL_002.sql", id)
+        if dt_recent is None:
+            return TokenBucket(self.burst, now)
+
+        elapsed = max((now_jst() - dt_recent).total_seconds(), 0.0)
+        return TokenBucket(min(self.burst, elapsed / self.refill_interval), now)
+
+    def __refill(self, bucket, now):
+        """トークン回復
+            Args:
+                bucket:TokenBucket
+                now:現在時刻(time.monotonic)
+        """
+        elapsed = now - bucket.updated_at
+        if elapsed > 0:
+            bucket.tokens = min(self.burst, bucket.tokens + elapsed / self.refill_interval)
+            bucket.updated_at = now
+
+    def __evict(self, now):
+        """アカウント破棄
+            満杯に戻った古いアカウントと、上限件数を超えたアカウントを破棄する。
+            Args:
+                now:現在時刻(time.monotonic)
+        """
+        while self.__buckets:
+            id, bucket = next(iter(self.__buckets.items()))
+            if len(self.__buckets) > self.max_users or now - bucket.updated_at >= self.full_refill_time:
+                self.__buckets.popitem(last=False)
+            else:
+                break
@@ -0,0 +1,262 @@
+"""reply_writer.py
+    質問・回答の書き込み
+    質問、回答をメモリ上に溜め、一定件数または一定時間ごとにまとめてDBへ登録する。
+    回答のコスト、トークン数は、同じトランザクションで日次集計(AIB_T_COST_DAILY)へ加算する。
+    返信要件を満たさなかった件数は、理由別に日次集計(AIB_T_REJECTION_DAILY)へ加算する。
+"""
+import collections
+import dataclasses
+import datetime
+import threading
+from typing import Optional
+
+from cost_ledger import now_jst
+
+
+@dataclasses.dataclass
+class ReplyRecord:
+    """データエンティティ
+        質問・回答保持用エンティティクラス
+        id_user、ts_questionがAIB_T_REPLY_SENTENSEの主キーとなる。
+    """
+    id_user: str
+    ts_question: datetime.datetime
+    cm_question: str
+    ts_answer: Optional[datetime.datetime] = None
+    cm_answer: Optional[str] = None
+    su_cost: Optional[float] = None
+
+    @property
+    def key(self):
+        """主キー
+        """
+        return (self.id_user, self.ts_question)
+
+
+class ReplyWriter:
+    """質問・回答の書き込み
+        プロセス内で1インスタンスを生成し、Stream、GenerateTootsで共有する。
+        登録はメモリ上で行い、書き込みスレッドがSQL_008で複数行をまとめて登録する。
+    """
+    def __init__(self, db_manager, batch_size, flush_interval, logger):
+        """コンストラクタ
+            Args:
+                db_manager:DatabaseManagerインスタンス
+                batch_size:1回に登録する件数。溜まった件数がこの値に達した時点で書き込む
+                flush_interval:書き込み間隔(秒)
+                logger:ロガーインスタンス
+        """
+        self.db_manager = db_manager
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.logger = logger
+        # 主キー -> SQLパラメータ。書き込み中に更新された行は次回に持ち越す
+        self.__pending = collections.OrderedDict()
+        # 主キー -> 日次集計への加算分(集計日, モデル, アカウントID, コスト, 入力トークン, 出力トークン)
+        self.__rollup = {}
+        # (集計日, 理由) -> 未登録の返信要件不備の件数
+        self.__rejections = collections.Counter()
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__closed = False
+        self.__thread = None
+        # 統計情報
+        self.__flushed_cnt = 0
+        self.__batch_cnt = 0
+        self.__error_cnt = 0
+
+    def start(self):
+        """書き込みスレッド起動
+        """
+        if self.__thread is not None:
+            return
+        self.__thread = threading.Thread(target=self.__run, name="reply-writer", daemon=True)
+        self.__thread.start()
+
+    def regist_question(self, id_user, ts_question, cm_question):
+        """質問登録
+            Args:
+                id_user:アカウントID
+                ts_question:質問日時
+                cm_question:質問文
+            Return:
+                ReplyRecord
+        """
+        # DBの日時型に合わせ、秒未満は切り捨てる
+        record = ReplyRecord(id_user=str(id_user),
+                             ts_question=ts_question.replace(microsecond=0),
+                             cm_question=str(cm_question))
+        self.__put(record)
+        return record
+
+    def regist_answer(self, record, cm_answer, su_cost, model, dt_cost, input_tokens=0, output_tokens=0):
+        """回答登録
+            Args:
+                record:regist_questionで登録したReplyRecord
+                cm_answer:回答文
+                su_cost:コスト
+                model:モデル名
+                dt_cost:日次集計の日付(CostLedgerの集計日付)
+                input_tokens:入力トークン数
+                output_tokens:出力トークン数
+        """
+        with self.__lock:
+            record.ts_answer = now_jst().replace(microsecond=0)
+            record.cm_answer = str(cm_answer)
+            record.su_cost = float(su_cost)
+            self.__rollup[record.key] = (dt_cost, str(model), record.id_user,
+                                         record.su_cost, int(input_tokens), int(output_tokens))
+        self.__put(record)
+
+    def count_rejection(self, reason, dt_reject):
+        """返信要件不備の件数加算
+            Args:
+                reason:理由
+                dt_reject:日次集計の日付(CostLedgerの集計日付)
+        """
+        with self.__lock:
+            self.__rejections[(dt_reject, str(reason))] += 1
+
+    def pending_cost(self):
+        """未登録のコスト合計
+            Return:
+                DBへ未登録の回答のコスト合計
+        """
+        with self.__lock:
+            return sum(params[5] for params in self.__pending.values() if params[5] is not None)
+
+    def flush(self):
+        """書き込み
+            溜まっている質問・回答を全てDBへ登録する。
+            Return:
+                登録件数
+        """
+        flushed = 0
+        with self.__flush_lock:
+            self.__flush_rejections()
+            while True:
+                with self.__lock:
+                    batch = list(self.__pending.items())[:self.batch_size]
+                    rollup = [(key, self.__rollup.pop(key)) for key, _ in batch if key in self.__rollup]
+                if not batch:
+                    return flushed
+
+                try:
+                    # 回答と日次集計は、どちらか一方だけが登録されないよう1トランザクションで登録する
+                    with self.db_manager.transaction() as session:
+                        session.exec_many("SQL_008.sql", [params for _, params in batch])
+                        if rollup:
+                            session.exec_many("SQL_028.sql", _aggregate([delta for _, delta in rollup]))
+                except Exception:
+                    with self.__lock:
+                        for key, delta in rollup:
+                            self.__rollup.setdefault(key, delta)
+                    raise
+
+                with self.__lock:
+                    for key, params in batch:
+                        # 書き込み中に回答が登録された行は残す
+                        if self.__pending.get(key) is params:
+                            del self.__pending[key]
+                    self.__flushed_cnt += len(batch)
+                    self.__batch_cnt += 1
+                flushed += len(batch)
+
+    def close(self, timeout=None):
+        """終了処理
+            書き込みスレッドを停止し、溜まっている質問・回答を登録する。
+            Args:
+                timeout:書き込みスレッドの停止待ち秒数
+        """
+        self.__closed = True
+        self.__wakeup.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+        try:
+            self.flush()
+        except Exception as e:
+            # 登録できなかった内容はログに残す
+            self.logger.critical("質問・回答の登録に失敗しました。" + str(e))
+            with self.__lock:
+                for params in self.__pending.values():
+                    self.logger.critical("未登録:" + repr(params))
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                未登録件数、登録件数等の統計情報
+        """
+        with self.__lock:
+            return {
+                "pending_count": len(self.__pending),
+                "flushed_count": self.__flushed_cnt,
+                "batch_count": self.__batch_cnt,
+                "error_count": self.__error_cnt,
+            }
+
+    def __flush_rejections(self):
+        """返信要件不備の件数の書き込み
+            登録できなかった件数は次回に持ち越す。
+        """
+        with self.__lock:
+            counts, self.__rejections = self.__rejections, collections.Counter()
+        if not counts:
+            return
+        try:
+            self.db_manager.exec_many("SQL_033.sql", [key + (count,) for key, count in sorted(counts.items())])
+        except Exception:
+            with self.__lock:
+                self.__rejections.update(counts)
+            raise
+
+    def __put(self, record):
+        """登録待ちへ追加
+            Args:
+                record:ReplyRecord
+        """
+        now = now_jst().replace(microsecond=0)
+        with self.__lock:
+            self.__pending[record.key] = (record.id_user, record.ts_question, record.cm_question,
+                                          record.ts_answer, record.cm_answer, record.su_cost,
+                                          '0', now, 'system', now, 'system')
+            pending_cnt = len(self.__pending)
+        if pending_cnt >= self.batch_size:
+            self.__wakeup.set()
+
+    def __run(self):
+        """書き込みスレッド
+            一定件数溜まるか、書き込み間隔が経過した時点で書き込む。
+        """
+        while not self.__closed:
+            self.__wakeup.wait(self.flush_interval)
+            self.__wakeup.clear()
+            if self.__closed:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                # 登録できなかった内容は残し、次回に再試行する
+                with self.__lock:
+                    self.__error_cnt += 1
+                self.logger.error("質問・回答の登録に失敗しました。" + str(e))
+
+
+def _aggregate(deltas):
+    """日次集計への加算分の集約
+        同じ集計日、モデル、アカウントIDの加算分を1行にまとめる。
+        複数プロセスの同時更新でデッドロックしないよう、主キー順に並べる。
+        Args:
+            deltas:加算分のリスト
+        Return:
+            SQL_028のSQLパラメータのリスト
+    """
+    totals = {}
+    for dt_cost, model, id_user, cost, input_tokens, output_tokens in deltas:
+        total = totals.setdefault((dt_cost, model, id_user), [0.0, 0, 0, 0])
+        total[0] += cost
+        total[1] += input_tokens
+        total[2] += output_tokens
+        total[3] += 1
+    return [key + tuple(total) for key, total in sorted(totals.items())]
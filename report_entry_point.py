@@ -0,0 +1,45 @@
+"""report_entry_point.py
+    利用状況レポートのエントリポイント
+    指定期間のAPIコスト、トークン数、回答時間、返信要件不備の件数をCSVまたはJSON Linesで出力する。
+    例:python report_entry_point.py --report daily --from 2024-04-01 --to 2024-04-30 --output daily.csv
+"""
+import argparse
+import datetime
+import sys
+
+from application_context import ApplicationContext, ROLE_MAINTENANCE
+from cost_ledger import today_jst
+from usage_report import FORMAT_CSV, FORMATS, REPORTS, UsageReport
+
+
+# 期間未指定時の日数(当日を含む)
+DEFAULT_DAYS = 7
+
+today = today_jst()
+arg_parser = argparse.ArgumentParser(description="利用状況レポート")
+arg_parser.add_argument("--report", choices=sorted(REPORTS), default="daily",
+                        help=" / ".join(name + ":" + REPORTS[name][1] for name in sorted(REPORTS)))
+arg_parser.add_argument("--from", dest="date_from", type=datetime.date.fromisoformat,
+                        default=today - datetime.timedelta(days=DEFAULT_DAYS - 1), help="開始日(YYYY-MM-DD)")
+arg_parser.add_argument("--to", dest="date_to", type=datetime.date.fromisoformat, default=today,
+                        help="終了日(YYYY-MM-DD、当日を含む)")
+arg_parser.add_argument("--format", choices=FORMATS, default=FORMAT_CSV, help="出力形式")
+arg_parser.add_argument("--output", help="出力ファイル。未指定時は標準出力")
+args = arg_parser.parse_args()
+
+# インスタンス化
+context = ApplicationContext(ROLE_MAINTENANCE)
+report = UsageReport(context)
+
+# 処理開始
+try:
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as out:
+            report.write(args.report, args.date_from, args.date_to, args.format, out)
+    else:
+        report.write(args.report, args.date_from, args.date_to, args.format, sys.stdout)
+except Exception as e:
+    context.logger.critical("レポート出力で、エラーが発生しました。" + str(e))
+    raise
+finally:
+    context.close()
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""single_flight.py
+    同一の質問の同時呼び出しの集約
+    同じ質問のOpenAI API呼び出しが実行中の間、後続の呼び出しは実行中の呼び出しの結果を待つ。
+"""
+import concurrent.futures
+import threading
+
+
+class Flight:
+    """実行中の呼び出し
+        先頭の呼び出し元が結果を設定し、後続の呼び出し元はfutureで結果を待つ。
+    """
+    __slots__ = ("key", "future", "size")
+
+    def __init__(self, key):
+        """コンストラクタ
+            Args:
+                key:キャッシュキー
+        """
+        self.key = key
+        self.future = concurrent.futures.Future()
+        # 結果を受け取る呼び出し元の数。結果の設定時に確定する
+        self.size = 1
+
+
+class SingleFlight:
+    """同時呼び出しの集約
+        プロセス内で1インスタンスを生成し、GenerateTootsで共有する。
+        スレッド(ワーカー)、イベントループのどちらから呼び出してもよい。
+    """
+    def __init__(self):
+        """コンストラクタ
+        """
+        self.__flights = {}
+        self.__lock = threading.Lock()
+        # 統計情報
+        self.__leader_cnt = 0
+        self.__follower_cnt = 0
+
+    def join(self, key):
+        """呼び出し参加
+            Args:
+                key:キャッシュキー
+            Return:
+                Flight, 先頭の呼び出し元の場合True
+        """
+        with self.__lock:
+            flight = self.__flights.get(key)
+            if flight is not None:
+                flight.size += 1
+                self.__follower_cnt += 1
+                return flight, False
+            flight = self.__flights[key] = Flight(key)
+            self.__leader_cnt += 1
+            return flight, True
+
+    def resolve(self, flight, result=None, error=None):
+        """結果設定
+            以降の同じ質問は新しい呼び出しとする。
+            Args:
+                flight:joinで先頭として受け取ったFlight
+                result:結果
+                error:例外。設定した場合、後続の呼び出し元へ送出する
+        """
+        if error is not None and not isinstance(error, Exception):
+            # 取り消し等は後続の呼び出し元では通常のエラーとして扱う
+            error = RuntimeError("実行中の呼び出しが中断されました。" + repr(error))
+        with self.__lock:
+            if self.__flights.get(flight.key) is flight:
+                del self.__flights[flight.key]
+        if flight.future.done():
+            return
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                実行中件数、先頭・後続の呼び出し件数
+        """
+        with self.__lock:
+            return {
+                "in_flight": len(self.__flights),
+                "leader_count": self.__leader_cnt,
+                "follower_count": self.__follower_cnt,
+            }
@@ -0,0 +1,198 @@
+"""sql_catalog.py
+    SQLファイルのカタログ
+    起動時にSQLファイルを一括で読み込み、検証したうえで名前付きのステートメントとして払い出す。
+"""
+import dataclasses
+import os
+import re
+import threading
+
+
+# 各SQLファイルの呼び出し元が渡すパラメータ数
+STATEMENT_PARAM_COUNTS = {
+    "SQL_001.sql": 1,   # 実行日のAPIコスト取得(日次集計)(dt_cost)
+    "SQL_002.sql": 1,   # 前回投稿時刻取得(id_user)
+    "SQL_004.sql": 1,   # トークン単価取得(nm_ai_model)
+    "SQL_006.sql": 1,   # 回答キャッシュ取得(cd_cache_key)
+    "SQL_007.sql": 5,   # 回答キャッシュ登録(cd_cache_key, nm_ai_model, cm_answer, su_cost, 有効秒数)
+    "SQL_008.sql": 11,  # 質問・回答の一括登録(AIB_T_REPLY_SENTENSEの全列)
+    "SQL_009.sql": 7,   # 未送信の返信の保存(cd_reply_key, id_acct, id_reply_to, nm_visibility, cm_parts, nu_part, flg_delete)
+    "SQL_010.sql": 0,   # 未送信の返信取得
+    "SQL_011.sql": 3,   # 通知のジョブ登録(id_status, id_user, cm_payload)
+    "SQL_012.sql": 0,   # 実行可能なジョブの取得(行ロック)
+    "SQL_013.sql": 3,   # ジョブの取得登録(id_worker, リース秒数, id_job)
+    "SQL_014.sql": 3,   # ジョブのリース延長(リース秒数, id_job, id_worker)
+    "SQL_015.sql": 3,   # ジョブの受付日時登録(ts_accepted, id_job, id_worker)
+    "SQL_016.sql": 5,   # ジョブの終了登録(nm_state, 再実行までの秒数, cm_error, id_job, id_worker)
+    "SQL_017.sql": 1,   # 終了したジョブの削除(保持日数)
+    "SQL_018.sql": 0,   # 状態別のジョブ件数取得
+    "SQL_019.sql": 2,   # コスト予算の日次行登録(dt_cost, 集計日)
+    "SQL_020.sql": 1,   # コスト予算取得(dt_cost)
+    "SQL_021.sql": 4,   # コスト予約(予約額, dt_cost, 予約額, コスト上限)
+    "SQL_022.sql": 3,   # コスト予約の解放(予約額, 確定コスト, dt_cost)
+    "SQL_023.sql": 1,   # 投稿間隔のバケット取得(id_user)
+    "SQL_024.sql": 3,   # 投稿間隔のバケット登録(id_user, su_tokens, ts_refill)
+    "SQL_025.sql": 1,   # 最後に受け付けた通知ID取得(nm_stream)
+    "SQL_026.sql": 2,   # 最後に受け付けた通知IDの記録(nm_stream, id_last_notification)
+    "SQL_027.sql": 6,   # 返信先のスレッドの直近の質問・回答取得(返信先status ID, acct, ts_question, ts_question, 取得時間数, 取得件数)
+    "SQL_028.sql": 7,   # コストの日次集計加算(dt_cost, nm_ai_model, id_user, su_cost, nu_input_tokens, nu_output_tokens, nu_answer)
+    "SQL_029.sql": 0,   # AIB_T_REPLY_SENTENSEのパーティション一覧取得
+    "SQL_030.sql": 0,   # 最も古い質問日時取得
+    "SQL_031.sql": 2,   # AIB_T_REPLY_SENTENSEのパーティション追加(パーティション名, 上限日)
+    "SQL_032.sql": 2,   # AIB_T_REPLY_SENTENSEのパーティション削除(パーティション名, 退避フラグ)
+    "SQL_033.sql": 3,   # 返信要件不備の日次集計加算(dt_reject, nm_reason, nu_count)
+    "SQL_034.sql": 2,   # 利用状況レポート:日別・モデル別コスト(開始日, 終了日)
+    "SQL_035.sql": 2,   # 利用状況レポート:ユーザー別・モデル別コスト(開始日, 終了日)
+    "SQL_036.sql": 2,   # 利用状況レポート:日別・モデル別・ユーザー別コスト(開始日, 終了日)
+    "SQL_037.sql": 2,   # 利用状況レポート:日別の回答時間(開始日, 終了日)
+    "SQL_038.sql": 2,   # 利用状況レポート:回答ごとの回答時間(開始日, 終了日)
+    "SQL_039.sql": 2,   # 利用状況レポート:日別・理由別の返信要件不備件数(開始日, 終了日)
+    "SQL_040.sql": 5,   # 会話のスレッドの投稿登録(id_status, id_thread, nm_acct, id_user, ts_question)
+    "SQL_041.sql": 2,   # 会話のスレッドの投稿削除(現在日時, 保持時間数)
+    "SQL_042.sql": 2,   # 処理済みのmention登録(nm_stream, id_status)
+    "SQL_043.sql": 2,   # 処理済みのmention取得(nm_stream, id_status)
+    "SQL_044.sql": 1,   # 処理済みのmention削除(保持日数)
+}
+
+# プレースホルダ(%s)とエスケープ済みの%(%%)
+PLACEHOLDER_PATTERN = re.compile(r"%%|%s")
+
+
+class SqlCatalogError(Exception):
+    """SQLカタログエラー
+        SQLファイルの欠落、内容不正時に送出する。
+    """
+
+
+@dataclasses.dataclass(frozen=True)
+class SqlStatement:
+    """データエンティティ
+        SQLステートメント保持用エンティティクラス
+    """
+    name: str
+    path: str
+    query: str
+    param_count: int
+    mtime: float
+
+    def bind(self, args):
+        """パラメータ検証
+            Args:
+                args:SQLパラメータ
+            Return:
+                SQLパラメータ
+        """
+        if len(args) != self.param_count:
+            raise SqlCatalogError("{nm}のパラメータ数が不正です。想定:{ex} 実際:{ac}"
+                                  .format(nm=self.name, ex=self.param_count, ac=len(args)))
+        return tuple(args)
+
+
+class SqlCatalog:
+    """SQLカタログ
+        sql_file_dir配下のSQLファイルを保持する。
+    """
+    def __init__(self, conf, logger=None, expected=STATEMENT_PARAM_COUNTS):
+        """コンストラクタ
+            Args:
+                conf:外部設定ファイル
+                logger:ロガーインスタンス
+                expected:SQLファイル名とパラメータ数の対応
+        """
+        self.sql_dir = os.path.dirname(os.path.abspath(__file__)) + conf.sql_file_dir
+        self.auto_reload = conf.sql_auto_reload
+        self.logger = logger
+        self.expected = dict(expected)
+        self.__statements = {}
+        self.__lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """SQLファイル一括読込
+            sql_file_dir配下のSQLファイルを読み込み、検証する。
+        """
+        if not os.path.isdir(self.sql_dir):
+            raise SqlCatalogError("SQLディレクトリが存在しません。" + self.sql_dir)
+
+        statements = {}
+        for name in sorted(os.listdir(self.sql_dir)):
+            path = os.path.join(self.sql_dir, name)
+            if name.endswith(".sql") and os.path.isfile(path):
+                statements[name] = self.__read_statement(name, path)
+
+        missing = [name for name in self.expected if name not in statements]
+        if missing:
+            raise SqlCatalogError("SQLファイルが存在しません。" + ",".join(missing))
+
+        with self.__lock:
+            self.__statements = statements
+
+    def get(self, name):
+        """ステートメント取得
+            auto_reloadが有効な場合、更新日時が変わっていれば再読込する。
+            Args:
+                name:SQLファイル名
+            Return:
+                SqlStatement
+        """
+        statement = self.__statements.get(name)
+        if statement is None:
+            raise SqlCatalogError("未登録のSQLです。" + str(name))
+
+        if self.auto_reload:
+            statement = self.__reload_if_modified(statement)
+
+        return statement
+
+    def names(self):
+        """登録済みSQLファイル名一覧
+            Return:
+                SQLファイル名リスト
+        """
+        return sorted(self.__statements)
+
+    def __reload_if_modified(self, statement):
+        """更新日時による再読込
+            再読込に失敗した場合は読込済みのステートメントを使い続ける。
+            Args:
+                statement:読込済みステートメント
+            Return:
+                SqlStatement
+        """
+        try:
+            if os.path.getmtime(statement.path) == statement.mtime:
+                return statement
+
+            reloaded = self.__read_statement(statement.name, statement.path)
+            with self.__lock:
+                self.__statements[statement.name] = reloaded
+            if self.logger is not None:
+                self.logger.info("SQLファイル再読込:" + statement.name)
+            return reloaded
+
+        except (OSError, SqlCatalogError) as e:
+            if self.logger is not None:
+                self.logger.error("SQLファイル再読込に失敗しました。" + str(e))
+            return statement
+
+    def __read_statement(self, name, path):
+        """SQLファイル読込
+            Args:
+                name:SQLファイル名
+                path:SQLファイルパス
+            Return:
+                SqlStatement
+        """
+        mtime = os.path.getmtime(path)
+        with open(path, "r") as file:
+            query = file.read()
+
+        if len(query.strip()) == 0:
+            raise SqlCatalogError("SQLファイルが空です。" + name)
+
+        param_count = PLACEHOLDER_PATTERN.findall(query).count("%s")
+        if name in self.expected and param_count != self.expected[name]:
+            raise SqlCatalogError("{nm}のプレースホルダ数が不正です。想定:{ex} 実際:{ac}"
+                                  .format(nm=name, ex=self.expected[name], ac=param_count))
+
+        return SqlStatement(name=name, path=path, query=query, param_count=param_count, mtime=mtime)
@@ -0,0 +1,51 @@
+"""test_canned_response.py
+    定型文の返信のテスト
+"""
+import types
+
+from canned_response import CannedResponder, KeywordMatcher
+
+
+def test_matcher_finds_overlapping_keywords():
+    matcher = KeywordMatcher([("he", 0), ("she", 1), ("hers", 2), ("his", 3)])
+    assert matcher.search("ushers") == {0, 1, 2}
+    assert matcher.search("this") == {3}
+    assert matcher.search("xyz") == set()
+
+
+def test_matcher_follows_failure_links_into_shorter_keyword():
+    matcher = KeywordMatcher([("abcd", 0), ("bc", 1)])
+    assert matcher.search("abce") == {1}
+
+
+def make_responder(tmp_path, rules):
+    path = tmp_path / "canned.ini"
+    path.write_text(rules, encoding="utf-8")
+    return CannedResponder(types.SimpleNamespace(canned_response_path=str(path)), seed=1)
+
+
+def test_first_defined_rule_wins(tmp_path):
+    responder = make_responder(tmp_path, """
+[ヘルプ]
+keywords = help
+responses = {acct}さん、使い方です。
+
+[おみくじ]
+keywords = おみくじ
+responses = 大吉
+""")
+    # 後に定義したルールのキーワードを先に含んでいても、先に定義したルールを優先する
+    assert responder.match("おみくじのhelp", "alice") == ("ヘルプ", "aliceさん、使い方です。")
+    assert responder.match("ＯＭＩＫＵＪＩ", "alice") is None
+    assert responder.match("おみくじ", "alice") == ("おみくじ", "大吉")
+
+
+def test_max_length_and_normalization(tmp_path):
+    responder = make_responder(tmp_path, """
+[ヘルプ]
+keywords = HELP
+max_length = 6
+responses = 使い方
+""")
+    assert responder.match("ｈｅｌｐ", "bob") == ("ヘルプ", "使い方")
+    assert responder.match("help me please", "bob") is None
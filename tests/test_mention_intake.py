@@ -0,0 +1,130 @@
+"""test_mention_intake.py
+    MentionIntakeの処理済み範囲の記録、バックフィル、重複排除のテスト
+"""
+import logging
+import types
+
+import pytest
+
+pytest.importorskip("mastodon")
+
+from mention_intake import BACKFILL_PAGE_SIZE, MentionIntake
+from metrics import MetricsRegistry
+
+
+class FakeDatabase:
+    """通知IDの記録と処理済みのmentionのみ保持するDB"""
+    def __init__(self, checkpoint=None, processed=()):
+        self.checkpoint = checkpoint
+        self.saved = []
+        self.processed = set(processed)
+
+    def fetch_scalar(self, sqlfile, *args):
+        if sqlfile == "SQL_025.sql":
+            return self.checkpoint
+        if sqlfile == "SQL_043.sql":
+            return args[1] if args[1] in self.processed else None
+        raise AssertionError(sqlfile)
+
+    def exec_query(self, sqlfile, *args):
+        if sqlfile == "SQL_026.sql":
+            self.checkpoint = args[1]
+            self.saved.append(args[1])
+        elif sqlfile == "SQL_042.sql":
+            self.processed.add(args[1])
+        else:
+            raise AssertionError(sqlfile)
+        return 1
+
+
+class FakeMastodon:
+    """notificationsの応答を順に返す。例外の場合は送出する"""
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    def notifications(self, **kwargs):
+        page = self.pages.pop(0)
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+
+def mention(notif_id):
+    return {"id": str(notif_id), "type": "mention", "status": {"id": "s" + str(notif_id)}}
+
+
+def newest_first(ids):
+    return [mention(notif_id) for notif_id in sorted(ids, reverse=True)]
+
+
+def make_intake(db, pages=()):
+    context = types.SimpleNamespace(
+        logger=logging.getLogger("test"),
+        metrics=MetricsRegistry(),
+        db_manager=db,
+        mastodon=FakeMastodon(pages),
+        config=types.SimpleNamespace(account_id="bot", backfill_max_pages=25),
+    )
+    return MentionIntake(context)
+
+
+def test_backfill_failure_keeps_checkpoint():
+    db = FakeDatabase(checkpoint="100")
+    first = newest_first(range(101, 101 + BACKFILL_PAGE_SIZE))
+    intake = make_intake(db, [first, RuntimeError("503"), newest_first([141, 142])])
+
+    with pytest.raises(RuntimeError):
+        intake.backfill(intake.complete)
+    # 取得できなかった範囲があるため、処理済みの通知も記録しない
+    live = mention(500)
+    assert intake.accept(live)
+    intake.complete(live)
+    assert db.saved == []
+    assert intake.checkpoint == "100"
+
+    # 次回のバックフィルは記録済みの通知IDから取得し、完了後に記録する
+    assert intake.backfill(intake.complete) == 2
+    assert db.saved == ["500"]
+
+
+def test_release_then_completions_advance():
+    db = FakeDatabase(checkpoint="100")
+    intake = make_intake(db)
+    notifs = [mention(notif_id) for notif_id in (101, 102, 103)]
+    for notif in notifs:
+        assert intake.accept(notif)
+
+    intake.release(notifs[0])
+    intake.complete(notifs[1])
+    intake.complete(notifs[2])
+    # 破棄した通知より新しい通知IDは記録しない
+    assert db.saved == []
+    assert intake.stats()["released_count"] == 1
+
+    # 再処理で処理を終えると、まとめて記録する
+    assert intake.retry_released(intake.complete) == 1
+    assert db.saved == ["103"]
+    assert intake.stats()["outstanding_count"] == 0
+    assert intake.stats()["released_count"] == 0
+
+
+def test_duplicate_across_stream_and_backfill_is_dropped():
+    db = FakeDatabase(checkpoint="100", processed={"s102"})
+    intake = make_intake(db, [newest_first([101, 102, 103])])
+    handled = []
+
+    def handler(notif):
+        handled.append(notif["id"])
+        intake.complete(notif)
+
+    intake.hold_checkpoint()
+    live = mention(101)
+    assert intake.accept(live)
+    # 101はStreamで受付済み、102は前回の起動までに処理済み
+    assert intake.backfill(handler) == 1
+    assert handled == ["103"]
+    assert intake.stats()["duplicate_count"] == 2
+
+    intake.complete(live)
+    assert db.saved == ["103"]
+    assert "s103" in db.processed
@@ -0,0 +1,95 @@
+"""test_single_flight.py
+    同一の質問の同時呼び出しの集約、後続の呼び出し元のコスト按分のテスト
+"""
+import concurrent.futures
+import logging
+import types
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_followers_share_leader_result():
+    single_flight = SingleFlight()
+    flight, leader = single_flight.join("q")
+    follower, follower_leader = single_flight.join("q")
+    assert leader and not follower_leader
+    assert follower is flight
+    assert flight.size == 2
+
+    single_flight.resolve(flight, "answer")
+    assert follower.future.result() == "answer"
+    # 結果の設定後は新しい呼び出しとなる
+    next_flight, next_leader = single_flight.join("q")
+    assert next_leader and next_flight is not flight
+    assert single_flight.stats() == {"in_flight": 1, "leader_count": 2, "follower_count": 1}
+
+
+def test_cancelled_leader_fails_followers_with_error():
+    single_flight = SingleFlight()
+    flight, _ = single_flight.join("q")
+    single_flight.join("q")
+    single_flight.resolve(flight, error=KeyboardInterrupt())
+    with pytest.raises(RuntimeError):
+        flight.future.result()
+
+
+class FakeReplyWriter:
+    def __init__(self):
+        self.answers = []
+
+    def regist_answer(self, record, answer, cost, model, dt_cost, input_tokens=0, output_tokens=0):
+        self.answers.append((record, answer, cost, input_tokens, output_tokens))
+
+
+class FakeCostLedger:
+    def __init__(self):
+        self.total = 0.0
+
+    def add(self, cost):
+        self.total += cost
+
+    def today(self):
+        return None
+
+
+def make_generator(single_flight):
+    generate_toots = pytest.importorskip("generate_toots")
+    metrics = pytest.importorskip("metrics")
+    context = types.SimpleNamespace(
+        config=types.SimpleNamespace(timeout_interval=0.01, chatgpt_model="model"),
+        logger=logging.getLogger("test"),
+        encoder=None, answer_cache=None, token_budget=None, conversations=None,
+        cost_ledger=FakeCostLedger(), reply_writer=FakeReplyWriter(),
+        single_flight=single_flight, metrics=metrics.MetricsRegistry(),
+    )
+    return generate_toots.GenerateToots(context), context
+
+
+def test_late_follower_is_billed_when_result_arrives():
+    single_flight = SingleFlight()
+    generator, context = make_generator(single_flight)
+    flight, _ = single_flight.join("q")
+    single_flight.join("q")
+
+    with pytest.raises(concurrent.futures.TimeoutError):
+        generator._GenerateToots__wait_shared("record", flight)
+    assert context.reply_writer.answers == []
+
+    single_flight.resolve(flight, ("answer", 0.4, 100, 50))
+    assert context.reply_writer.answers == [("record", generator.TIMEOUT_MESSAGE, 0.2, 50, 25)]
+    assert context.cost_ledger.total == pytest.approx(0.2)
+
+
+def test_late_follower_is_not_billed_when_leader_fails():
+    single_flight = SingleFlight()
+    generator, context = make_generator(single_flight)
+    flight, _ = single_flight.join("q")
+    single_flight.join("q")
+
+    with pytest.raises(concurrent.futures.TimeoutError):
+        generator._GenerateToots__wait_shared("record", flight)
+    single_flight.resolve(flight, error=KeyboardInterrupt())
+    assert context.reply_writer.answers == []
+    assert context.cost_ledger.total == 0.0
@@ -0,0 +1,45 @@
+"""test_sql_catalog.py
+    SQLカタログのプレースホルダ数の検証のテスト
+"""
+import os
+import types
+
+import pytest
+
+from sql_catalog import STATEMENT_PARAM_COUNTS, SqlCatalog, SqlCatalogError
+
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_catalog(sql_dir, expected):
+    # sql_file_dirはbotの配置ディレクトリからの相対パス
+    conf = types.SimpleNamespace(sql_file_dir="/" + os.path.relpath(str(sql_dir), BASE_DIR), sql_auto_reload=False)
+    return SqlCatalog(conf, expected=expected)
+
+
+def test_bundled_sql_matches_expected_counts():
+    catalog = make_catalog(os.path.join(BASE_DIR, "SQL"), STATEMENT_PARAM_COUNTS)
+    for name, count in STATEMENT_PARAM_COUNTS.items():
+        assert catalog.get(name).param_count == count
+
+
+def test_escaped_percent_is_not_a_placeholder(tmp_path):
+    (tmp_path / "SQL_A.sql").write_text("SELECT * FROM T WHERE a LIKE '%%x' AND b = %s AND c = %s;")
+    catalog = make_catalog(tmp_path, {"SQL_A.sql": 2})
+    statement = catalog.get("SQL_A.sql")
+    assert statement.bind(("1", "2")) == ("1", "2")
+    with pytest.raises(SqlCatalogError):
+        statement.bind(("1",))
+
+
+def test_wrong_placeholder_count_is_rejected(tmp_path):
+    (tmp_path / "SQL_A.sql").write_text("DELETE FROM T WHERE a = %s;")
+    with pytest.raises(SqlCatalogError):
+        make_catalog(tmp_path, {"SQL_A.sql": 2})
+
+
+def test_missing_file_is_rejected(tmp_path):
+    (tmp_path / "SQL_A.sql").write_text("SELECT 1;")
+    with pytest.raises(SqlCatalogError):
+        make_catalog(tmp_path, {"SQL_A.sql": 0, "SQL_B.sql": 1})
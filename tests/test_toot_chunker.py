@@ -0,0 +1,41 @@
+"""test_toot_chunker.py
+    返信文の分割のテスト
+"""
+from toot_chunker import TOOT_MAX_LENGTH, TootChunker, split_toot
+
+
+def test_split_reserves_room_for_acct():
+    acct = "user@example.com"
+    response = "これはテストの文です。" * 120
+    chunks = split_toot(response, acct)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len("@" + acct + " " + chunk) <= TOOT_MAX_LENGTH
+    assert "".join(chunks) == response
+
+
+def test_split_at_last_sentence_end_within_limit():
+    acct = "a" * 20
+    limit = TOOT_MAX_LENGTH - len("@" + acct + " ")
+    first = "あ" * (limit - 10) + "。"
+    second = "い" * 20 + "。"
+    chunks = split_toot(first + second, acct)
+    assert chunks == [first, second]
+
+
+def test_split_without_sentence_end_falls_back_to_limit():
+    acct = "bot"
+    limit = TOOT_MAX_LENGTH - len("@bot ")
+    chunks = split_toot("x" * (limit + 5), acct)
+    assert chunks == ["x" * limit, "x" * 5]
+
+
+def test_feed_releases_complete_sentences_only():
+    chunker = TootChunker("bot", min_length=5)
+    assert chunker.feed("こんにちは。続き") == ["こんにちは。"]
+    assert chunker.feed("の文") == []
+    assert chunker.flush() == ["続きの文"]
+
+
+def test_at_mark_is_neutralized():
+    assert split_toot("@someone へ", "bot") == ["＠someone へ"]
@@ -0,0 +1,144 @@
+"""token_budget.py
+    OpenAI API呼び出し前のトークン見積もり
+    質問文のトークン数と実行日の残りコストから、回答の最大トークン数を決め、見積もりコストを予約する。
+"""
+import dataclasses
+import math
+import threading
+from typing import Optional
+
+from cost_ledger import CostReservation
+
+
+# チャット形式のメッセージ1件あたりの付加トークン数
+TOKENS_PER_MESSAGE = 4
+# 回答開始の付加トークン数
+TOKENS_PER_REPLY = 3
+# DB上の質問文、回答文の最大文字数(AIB_T_REPLY_SENTENSE.cm_question、cm_answer)
+QUESTION_MAX_LENGTH = 500
+ANSWER_MAX_LENGTH = 1500
+
+
+@dataclasses.dataclass
+class BudgetPlan:
+    """データエンティティ
+        トークン見積もり結果保持用エンティティクラス
+    """
+    prompt_tokens: int
+    max_tokens: int
+    estimated_cost: float
+    # 見積もりコストの予約。解放済みの場合None
+    reservation: Optional[CostReservation] = None
+
+
+class TokenBudget:
+    """トークン見積もり
+        プロセス内で1インスタンスを生成し、GenerateTootsで共有する。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.__lock = threading.Lock()
+        self.__system_tokens = {}
+        self.__prices = {}
+
+    def plan(self, content, history_tokens=0):
+        """トークン見積もり
+            見積もりコストを予約する。回答後はreleaseで予約を解放する。
+            予約できなかった場合は、残りコストを取得し直して1回だけ見積もり直す。
+            Args:
+                content:質問文
+                history_tokens:会話の文脈のトークン数
+            Return:
+                BudgetPlan。残りコストで回答できない場合None
+        """
+        config = self.context.config
+        cost_ledger = self.context.cost_ledger
+        input_price, output_price = self.prices(config.chatgpt_model)
+
+        prompt_tokens = (self.system_tokens(config.role_system_content)
+                         + len(self.context.encoder.encode(content))
+                         + history_tokens
+                         + TOKENS_PER_MESSAGE * 2 + TOKENS_PER_REPLY)
+        input_cost = prompt_tokens * input_price / 1000
+
+        for _ in range(2):
+            remaining = cost_ledger.available(config.cost_limit)
+
+            # 残りコストで出力できるトークン数
+            if output_price > 0:
+                affordable = math.floor((remaining - input_cost) / (output_price / 1000))
+            else:
+                affordable = config.max_answer_tokens
+            max_tokens = min(affordable, config.max_answer_tokens)
+            if max_tokens < config.min_answer_tokens:
+                return None
+
+            plan = BudgetPlan(prompt_tokens=prompt_tokens,
+                              max_tokens=max_tokens,
+                              estimated_cost=input_cost + max_tokens * output_price / 1000)
+            plan.reservation = cost_ledger.reserve(plan.estimated_cost, config.cost_limit)
+            if plan.reservation is not None:
+                return plan
+        return None
+
+    def release(self, plan, spent=0.0):
+        """見積もりコストの予約解放
+            同じ見積もりに対して複数回呼び出した場合、2回目以降は何もしない。
+            Args:
+                plan:BudgetPlan。見積もり前の場合None
+                spent:確定したコスト
+        """
+        if plan is None or plan.reservation is None:
+            return
+        reservation, plan.reservation = plan.reservation, None
+        self.context.cost_ledger.release(reservation, spent)
+
+    def system_tokens(self, role_system_content):
+        """システムプロンプトのトークン数
+            プロンプトごとに1回だけ算出する。
+            Args:
+                role_system_content:システムプロンプト
+            Return:
+                トークン数
+        """
+        tokens = self.__system_tokens.get(role_system_content)
+        if tokens is None:
+            tokens = len(self.context.encoder.encode(role_system_content))
+            with self.__lock:
+                # 設定再読込でプロンプトが変わった場合に備え、最新の1件のみ保持する
+                self.__system_tokens = {role_system_content: tokens}
+        return tokens
+
+    def prices(self, model):
+        """トークン単価取得
+            モデルごとに1回だけDBから取得する。
+            Args:
+                model:モデル名
+            Return:
+                入力、出力の1000トークンあたりの単価
+        """
+        prices = self.__prices.get(model)
+        if prices is None:
+            dr = self.context.db_manager.fetch_one("SQL_004.sql", model)
+            if dr is None:
+                raise ValueError("トークン単価が未登録のモデルです。" + str(model))
+            prices = (float(dr.INPUT_COST), float(dr.OUTPUT_COST))
+            with self.__lock:
+                self.__prices[model] = prices
+        return prices
+
+    def cost(self, model, input_tokens, output_tokens):
+        """コスト算出
+            Args:
+                model:モデル名
+                input_tokens:入力トークン
+                output_tokens:出力トークン
+            Return:
+                コスト
+        """
+        input_price, output_price = self.prices(model)
+        return input_tokens * (input_price / 1000) + output_tokens * (output_price / 1000)
@@ -0,0 +1,120 @@
+"""toot_chunker.py
+    返信文の分割
+    生成文を文末で区切り、返信先の@アカウントを含めてトゥート上限文字数以内に収める。
+    ストリーミングで受信した生成文は、区切り位置が確定した分から順に払い出す。
+"""
+import re
+
+
+# トゥートの上限文字数
+TOOT_MAX_LENGTH = 500
+
+# 文末(句点、感嘆符、疑問符、改行、英文のピリオド)
+SENTENCE_END_PATTERN = re.compile(r"[。．！？!?\n]+[」』）)]*|\.(?=\s)")
+# 文末がない場合の区切り(読点、空白)
+SOFT_BREAK_PATTERN = re.compile(r"[、，,\s]+")
+
+
+class TootChunker:
+    """返信文分割
+        feedで受け取った生成文を、min_length文字以上かつ文末で区切れる分から払い出す。
+        上限文字数を超える場合は上限以内の最後の文末、読点、空白の順で区切り、いずれもなければ上限で区切る。
+    """
+    def __init__(self, acct, min_length=None, max_length=TOOT_MAX_LENGTH):
+        """コンストラクタ
+            Args:
+                acct:返信先アカウント。返信時に先頭へ付与される@acctの分を上限から除く
+                min_length:払い出す最小文字数。未指定時は上限文字数まで溜めてから払い出す
+                max_length:トゥートの上限文字数
+        """
+        self.limit = max(1, max_length - len('@' + str(acct) + ' '))
+        self.min_length = self.limit if min_length is None else max(1, min(int(min_length), self.limit))
+        self.__buffer = ""
+
+    def feed(self, text):
+        """生成文追加
+            Args:
+                text:生成文の断片
+            Return:
+                払い出し可能になった返信文のリスト
+        """
+        # 予期せぬリプライの防止
+        self.__buffer += str(text).replace('@', '＠')
+        return self.__drain(final=False)
+
+    def flush(self):
+        """残り払い出し
+            Return:
+                残りの返信文のリスト
+        """
+        return self.__drain(final=True)
+
+    def __drain(self, final):
+        """払い出し
+            Args:
+                final:生成文の末尾まで受信済みの場合True
+            Return:
+                返信文のリスト
+        """
+        chunks = []
+        while True:
+            self.__buffer = self.__buffer.lstrip()
+            if not self.__buffer:
+                return chunks
+            cut = self.__find_cut(final)
+            if cut is None:
+                return chunks
+            chunk = self.__buffer[:cut].strip()
+            self.__buffer = self.__buffer[cut:]
+            if chunk:
+                chunks.append(chunk)
+
+    def __find_cut(self, final):
+        """区切り位置検索
+            Args:
+                final:生成文の末尾まで受信済みの場合True
+            Return:
+                区切り位置。まだ区切らない場合None
+        """
+        buffer = self.__buffer
+        if len(buffer) <= self.limit:
+            if final:
+                return len(buffer)
+            if len(buffer) < self.min_length:
+                return None
+            cut = self.__last_end(SENTENCE_END_PATTERN, buffer)
+            return cut if cut is not None and cut >= self.min_length else None
+
+        window = buffer[:self.limit]
+        for pattern in (SENTENCE_END_PATTERN, SOFT_BREAK_PATTERN):
+            cut = self.__last_end(pattern, window)
+            # 極端に短い返信にならないよう、上限の半分未満の位置では区切らない
+            if cut is not None and cut >= self.limit // 2:
+                return cut
+        return self.limit
+
+    def __last_end(self, pattern, text):
+        """最後の区切りの終了位置
+            Args:
+                pattern:区切りの正規表現
+                text:検索対象
+            Return:
+                終了位置。区切りがない場合None
+        """
+        cut = None
+        for match in pattern.finditer(text):
+            cut = match.end()
+        return cut
+
+
+def split_toot(response, acct):
+    """返信文分割
+        生成文を文末で区切り、トゥート上限文字数以内の返信文に分割する。
+        Args:
+            response:生成文
+            acct:返信先アカウント
+        Returns:
+            分割した返信文のリスト
+    """
+    chunker = TootChunker(acct)
+    return chunker.feed(response) + chunker.flush()
@@ -0,0 +1,527 @@
+"""toot_sender.py
+    返信の送信
+    返信を送信キューへ溜め、送信スレッドがレート制限の残り回数を見ながら順に投稿する。
+    複数に分割した返信は、直前の投稿への返信としてスレッドにつなげる。
+    送信に失敗した返信は待機時間をおいて再送し、未送信のまま終了した返信はDBへ保存して次回起動時に再送する。
+"""
+import collections
+import dataclasses
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from mastodon import MastodonAPIError, MastodonRatelimitError, MastodonServerError
+
+
+# 再送待機秒数の上限
+RETRY_WAIT_MAX = 300.0
+
+
+@dataclasses.dataclass
+class OutboundReply:
+    """データエンティティ
+        送信待ちの返信保持用エンティティクラス
+        reply_keyは返信先の通知のstatus IDで、AIB_T_OUTBOUND_REPLYの主キーとなる。
+    """
+    reply_key: str
+    acct: str
+    reply_to_id: Any
+    visibility: str
+    parts: collections.deque = dataclasses.field(default_factory=collections.deque)
+    # 送信済みの件数。投稿の重複防止キーに用いる
+    part_no: int = 0
+    attempt: int = 0
+    # 返信文の追加が完了している場合True
+    closed: bool = False
+    # idle:送信待ちなし queued:送信待ち delayed:再送待ち busy:送信中
+    state: str = "idle"
+    # DBへ保存済みの場合True
+    stored: bool = False
+    # 1件目の送信までの時間を計測する場合の起点(time.perf_counter)
+    started: Optional[float] = None
+
+
+class RateLimitTracker:
+    """レート制限の残り回数管理
+        投稿時の応答ヘッダ(X-RateLimit-Remaining、X-RateLimit-Reset)から残り回数とリセット時刻を保持し、
+        残り回数がreserve以下になった場合はリセットまで投稿を止める。
+        残り回数がreserveの3倍を下回った場合は、リセットまでの時間に均等に投稿を割り振る。
+    """
+    def __init__(self, reserve):
+        """コンストラクタ
+            Args:
+                reserve:投稿以外のAPI呼び出し用に残しておく回数
+        """
+        self.reserve = max(0, int(reserve))
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.__next_at = 0.0
+        self.__lock = threading.Lock()
+
+    def update(self, limit, remaining, reset_at):
+        """応答ヘッダの反映
+            Args:
+                limit:上限回数
+                remaining:残り回数
+                reset_at:リセット時刻(エポック秒)
+        """
+        if remaining is None or reset_at is None:
+            return
+        with self.__lock:
+            self.limit = limit
+            self.remaining = int(remaining)
+            self.reset_at = float(reset_at)
+
+    def acquire(self):
+        """投稿枠の確保
+            Return:
+                投稿までの待機秒数。0の場合は投稿枠を1回分確保済み
+        """
+        with self.__lock:
+            now = time.time()
+            if self.reset_at is not None and now >= self.reset_at:
+                # リセット後は次の応答ヘッダを受け取るまで制限しない
+                self.remaining = None
+                self.reset_at = None
+            if self.remaining is None:
+                return 0.0
+
+            budget = self.remaining - self.reserve
+            if budget <= 0:
+                return self.reset_at - now
+            if self.remaining < self.reserve * 3:
+                if self.__next_at > now:
+                    return self.__next_at - now
+                self.__next_at = now + (self.reset_at - now) / budget
+            self.remaining -= 1
+            return 0.0
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                上限回数、残り回数、リセットまでの秒数
+        """
+        with self.__lock:
+            return {
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "reset_in": None if self.reset_at is None else max(0.0, self.reset_at - time.time()),
+            }
+
+
+class TootSender:
+    """返信の送信
+        プロセス内で1インスタンスを生成し、Stream、GenerateTootsで共有する。
+        同じ返信の分割分は1スレッドが順に投稿し、別の返信は複数の送信スレッドで並行して投稿する。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        # レート制限時に例外を送出するクライアントを用い、再送は送信スレッドで管理する
+        self.mastodon = context.post_mastodon
+        self.db_manager = context.db_manager
+        self.metrics = context.metrics
+        self.logger = context.logger
+        self.rate_limit = RateLimitTracker(context.config.post_rate_reserve)
+        self.__cond = threading.Condition()
+        self.__ready = collections.deque()
+        # (再送時刻, 連番, OutboundReply)
+        self.__delayed = []
+        self.__seq = itertools.count()
+        # reply_key -> 送信完了前のOutboundReply
+        self.__replies = {}
+        self.__stop = threading.Event()
+        self.__threads = []
+        # 統計情報
+        self.__posted_cnt = 0
+        self.__retry_cnt = 0
+        self.__dropped_cnt = 0
+
+    @property
+    def config(self):
+        """外部設定ファイル保持データクラス
+            SIGHUPによる再読込を反映するため、contextから都度参照する。
+        """
+        return self.context.config
+
+    def start(self):
+        """送信スレッド起動
+            前回終了時に未送信だった返信をDBから読み込み、送信キューへ戻す。
+        """
+        if self.__threads:
+            return
+        self.__restore()
+        for num in range(max(1, self.config.post_workers)):
+            thread = threading.Thread(target=self.__work, name="toot-sender-{n}".format(n=num), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def open(self, to_status, acct, visibility, track_first=False):
+        """返信開始
+            返信文はappendで追加し、全て追加した時点でfinishを呼び出す。
+            Args:
+                to_status:返信先status
+                acct:返信先アカウント
+                visibility:返信時のvisibility
+                track_first:1件目の送信までの時間を計測する場合True
+            Return:
+                OutboundReply
+        """
+        reply = OutboundReply(reply_key=str(to_status['id']),
+                              acct=str(acct),
+                              reply_to_id=to_status['id'],
+                              visibility=visibility,
+                              started=time.perf_counter() if track_first else None)
+        with self.__cond:
+            self.__replies[reply.reply_key] = reply
+        return reply
+
+    def append(self, reply, text):
+        """返信文追加
+            Args:
+                reply:openで開始したOutboundReply
+                text:返信文(@acctを除く)
+        """
+        with self.__cond:
+            reply.parts.append(str(text))
+            if reply.state == "idle":
+                self.__enqueue(reply)
+
+    def finish(self, reply):
+        """返信終了
+            送信済みの返信は、この時点で送信完了とする。
+            Args:
+                reply:openで開始したOutboundReply
+        """
+        with self.__cond:
+            reply.closed = True
+            done = reply.state == "idle" and not reply.parts
+        if done:
+            self.__complete(reply)
+
+    def send(self, to_status, acct, parts, visibility):
+        """返信
+            Args:
+                to_status:返信先status
+                acct:返信先アカウント
+                parts:返信文(@acctを除く)のリスト
+                visibility:返信時のvisibility
+        """
+        reply = self.open(to_status, acct, visibility)
+        for text in parts:
+            self.append(reply, text)
+        self.finish(reply)
+
+    def close(self, timeout=None):
+        """終了処理
+            送信待ちがなくなるまで待機し、未送信の返信はDBへ保存する。
+            Args:
+                timeout:送信待ちの待機秒数
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__cond:
+            while self.__replies and self.__threads:
+                wait = None if deadline is None else deadline - time.monotonic()
+                if wait is not None and wait <= 0:
+                    break
+                self.__cond.wait(wait)
+
+        self.__stop.set()
+        with self.__cond:
+            self.__cond.notify_all()
+        for thread in self.__threads:
+            thread.join(self.config.timeout_interval)
+
+        with self.__cond:
+            unsent = [reply for reply in self.__replies.values() if reply.parts]
+        for reply in unsent:
+            self.logger.warning("未送信の返信を保存します。%s", reply.reply_key)
+            self.__store(reply)
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                送信待ち件数、送信件数等の統計情報
+        """
+        with self.__cond:
+            stats = {
+                "active_count": len(self.__replies),
+                "queued_count": len(self.__ready),
+                "delayed_count": len(self.__delayed),
+                "posted_count": self.__posted_cnt,
+                "retry_count": self.__retry_cnt,
+                "dropped_count": self.__dropped_cnt,
+            }
+        rate = self.rate_limit.stats()
+        stats["rate_remaining"] = rate["remaining"]
+        stats["rate_reset_in"] = rate["reset_in"]
+        return stats
+
+    def __enqueue(self, reply):
+        """送信待ちへ追加(__cond取得済みで呼び出す)
+            Args:
+                reply:OutboundReply
+        """
+        reply.state = "queued"
+        self.__ready.append(reply)
+        self.__cond.notify()
+
+    def __next_reply(self):
+        """送信対象取得
+            再送時刻を過ぎた返信を送信待ちへ戻し、送信待ちの先頭を返す。
+            Return:
+                OutboundReply。停止時None
+        """
+        with self.__cond:
+            while not self.__stop.is_set():
+                now = time.monotonic()
+                while self.__delayed and self.__delayed[0][0] <= now:
+                    self.__enqueue(heapq.heappop(self.__delayed)[2])
+                if self.__ready:
+                    reply = self.__ready.popleft()
+                    reply.state = "busy"
+                    return reply
+                self.__cond.wait(self.__delayed[0][0] - now if self.__delayed else None)
+        return None
+
+    def __work(self):
+        """送信スレッド
+        """
+        while True:
+            reply = self.__next_reply()
+            if reply is None:
+                return
+            try:
+                self.__send_parts(reply)
+            except Exception as e:
+                self.logger.critical("返信の送信処理で、エラーが発生しました。" + str(e))
+                self.__drop(reply)
+
+    def __send_parts(self, reply):
+        """返信文送信
+            送信待ちの返信文を順に投稿する。失敗時は再送待ちへ移す。
+            Args:
+                reply:送信中のOutboundReply
+        """
+        while True:
+            with self.__cond:
+                if not reply.parts:
+                    reply.state = "idle"
+                    done = reply.closed
+                    break
+                text = reply.parts[0]
+
+            if not self.__wait_rate_limit():
+                # 停止中は送信中のまま残し、終了処理で保存する
+                return
+
+            try:
+                status = self.__post(reply, text)
+            except Exception as e:
+                self.metrics.inc("toot_errors_total")
+                retry_wait = self.__retry_wait(reply, e)
+                if retry_wait is None:
+                    self.logger.error("返信を送信できませんでした。再送しません。" + str(e))
+                    self.__drop(reply)
+                elif reply.attempt > self.config.post_max_retries:
+                    self.logger.error("返信の再送回数が上限に達しました。次回起動時に再送します。" + str(e))
+                    self.__shelve(reply)
+                else:
+                    self.__defer(reply, retry_wait, e)
+                return
+
+            with self.__cond:
+                reply.parts.popleft()
+                reply.part_no += 1
+                reply.attempt = 0
+                if status is not None and status.get('id') is not None:
+                    reply.reply_to_id = status['id']
+                self.__posted_cnt += 1
+                stored = reply.stored
+            if status is not None and status.get('id') is not None and self.context.conversations is not None:
+                # 投稿への返信を、同じ会話の続きとして扱う
+                self.context.conversations.link(reply.reply_key, status['id'])
+            if stored:
+                # 保存済みの返信は、再起動時に送信済みの分を再送しないよう進捗を保存する
+                self.__store(reply)
+
+        if done:
+            self.__complete(reply)
+
+    def __post(self, reply, text):
+        """投稿
+            Args:
+                reply:OutboundReply
+                text:返信文
+            Return:
+                投稿したstatus
+        """
+        with self.metrics.timer("stage_seconds", stage="post"):
+            status = self.mastodon.status_post("@" + reply.acct + " " + text,
+                                               in_reply_to_id = reply.reply_to_id,
+                                               visibility = reply.visibility,
+                                               # 再送時に同じ返信文が重複して投稿されないようにする
+                                               idempotency_key = "{k}-{n}".format(k=reply.reply_key, n=reply.part_no))
+        self.__update_rate_limit()
+        self.metrics.inc("toots_total")
+        if reply.started is not None and reply.part_no == 0:
+            self.metrics.observe("stage_seconds", time.perf_counter() - reply.started, stage="first_reply")
+        return status
+
+    def __update_rate_limit(self):
+        """レート制限の残り回数の更新
+            Mastodonクライアントが直前の応答ヘッダから保持している値を反映する。
+        """
+        self.rate_limit.update(getattr(self.mastodon, 'ratelimit_limit', None),
+                               getattr(self.mastodon, 'ratelimit_remaining', None),
+                               getattr(self.mastodon, 'ratelimit_reset', None))
+
+    def __wait_rate_limit(self):
+        """レート制限待機
+            Return:
+                True:投稿可能
+                False:待機中に停止した
+        """
+        while True:
+            wait = self.rate_limit.acquire()
+            if wait <= 0:
+                return True
+            self.logger.info("レート制限のため、返信を%.1f秒待機します。", wait)
+            if self.__stop.wait(wait):
+                return False
+
+    def __retry_wait(self, reply, error):
+        """再送待機秒数
+            Args:
+                reply:OutboundReply
+                error:投稿時の例外
+            Return:
+                再送までの待機秒数。再送しない場合None
+        """
+        if isinstance(error, MastodonRatelimitError):
+            # レート制限超過はリセットまで待ち、再送回数に数えない
+            self.__update_rate_limit()
+            reset_in = self.rate_limit.stats()["reset_in"]
+            return (reset_in or self.config.post_retry_wait) + random.uniform(0, self.config.post_retry_wait)
+
+        if isinstance(error, MastodonAPIError) and not isinstance(error, MastodonServerError):
+            # 4xx(文字数超過、返信先削除等)は再送しても成功しない
+            return None
+
+        reply.attempt += 1
+        wait = min(self.config.post_retry_wait * 2 ** (reply.attempt - 1), RETRY_WAIT_MAX)
+        return wait * random.uniform(0.5, 1.5)
+
+    def __defer(self, reply, wait, error):
+        """再送待ちへ移動
+            初回の失敗時に、再起動後も再送できるようDBへ保存する。
+            Args:
+                reply:OutboundReply
+                wait:再送までの待機秒数
+                error:投稿時の例外
+        """
+        self.logger.warning("返信の送信に失敗しました。%.1f秒後に再送します。%s", wait, str(error))
+        self.metrics.inc("post_retries_total")
+        with self.__cond:
+            self.__retry_cnt += 1
+            reply.state = "delayed"
+            heapq.heappush(self.__delayed, (time.monotonic() + wait, next(self.__seq), reply))
+            self.__cond.notify()
+            stored = reply.stored
+        if not stored:
+            self.__store(reply)
+
+    def __shelve(self, reply):
+        """再送打ち切り
+            DBへ保存したまま送信キューから外し、次回起動時に再送する。
+            Args:
+                reply:OutboundReply
+        """
+        self.__store(reply)
+        with self.__cond:
+            reply.state = "idle"
+            if self.__replies.get(reply.reply_key) is reply:
+                del self.__replies[reply.reply_key]
+            self.__cond.notify_all()
+
+    def __drop(self, reply):
+        """返信破棄
+            Args:
+                reply:OutboundReply
+        """
+        self.metrics.inc("post_dropped_total")
+        with self.__cond:
+            self.__dropped_cnt += 1
+            for text in reply.parts:
+                self.logger.error("未送信:@%s %s", reply.acct, text)
+            reply.parts.clear()
+            reply.closed = True
+            reply.state = "idle"
+        self.__complete(reply)
+
+    def __complete(self, reply):
+        """送信完了
+            Args:
+                reply:OutboundReply
+        """
+        with self.__cond:
+            if self.__replies.get(reply.reply_key) is reply:
+                del self.__replies[reply.reply_key]
+            self.__cond.notify_all()
+            stored = reply.stored
+        if stored:
+            self.__store(reply, deleted=True)
+
+    def __store(self, reply, deleted=False):
+        """DB保存
+            Args:
+                reply:OutboundReply
+                deleted:送信完了の場合True
+        """
+        with self.__cond:
+            params = (reply.reply_key, reply.acct, str(reply.reply_to_id), reply.visibility,
+                      json.dumps(list(reply.parts), ensure_ascii=False), reply.part_no,
+                      '1' if deleted else '0')
+            reply.stored = not deleted
+        try:
+            self.db_manager.exec_query("SQL_009.sql", *params)
+        except Exception as e:
+            # 保存できなかった内容はログに残す
+            self.logger.critical("未送信の返信の保存に失敗しました。" + str(e))
+            if not deleted:
+                self.logger.critical("未保存:" + repr(params))
+
+    def __restore(self):
+        """未送信の返信の読込
+        """
+        try:
+            rows = list(self.db_manager.fetch_iter("SQL_010.sql"))
+        except Exception as e:
+            self.logger.critical("未送信の返信の読込に失敗しました。" + str(e))
+            return
+
+        for row in rows:
+            reply = OutboundReply(reply_key=row['REPLY_KEY'],
+                                  acct=row['ACCT'],
+                                  reply_to_id=row['REPLY_TO_ID'],
+                                  visibility=row['VISIBILITY'],
+                                  parts=collections.deque(json.loads(row['PARTS'])),
+                                  part_no=int(row['PART_NO']),
+                                  closed=True,
+                                  stored=True)
+            with self.__cond:
+                self.__replies[reply.reply_key] = reply
+                if reply.parts:
+                    self.__enqueue(reply)
+            if not reply.parts:
+                self.__complete(reply)
+        if rows:
+            self.logger.info("未送信の返信を%d件読み込みました。", len(rows))
@@ -0,0 +1,117 @@
+"""usage_report.py
+    利用状況レポート
+    日別・ユーザー別・モデル別のAPIコスト、トークン数、回答時間、返信要件不備の件数を集計し、CSVまたはJSON Linesで出力する。
+    コスト、トークン数、返信要件不備の件数は日次集計(AIB_T_COST_DAILY、AIB_T_REJECTION_DAILY)から取得する。
+    日次集計のない回答時間のみAIB_T_REPLY_SENTENSEを質問日時(JST)の範囲で参照し、対象月のパーティションだけを読む。
+"""
+import csv
+import datetime
+import decimal
+import json
+
+
+# レポート名 -> (SQLファイル, 説明)
+REPORTS = {
+    "daily": ("SQL_034.sql", "日別・モデル別のコスト、トークン数"),
+    "user": ("SQL_035.sql", "ユーザー別・モデル別のコスト、トークン数"),
+    "detail": ("SQL_036.sql", "日別・モデル別・ユーザー別のコスト、トークン数"),
+    "latency": ("SQL_037.sql", "日別の回答時間(秒)"),
+    "answers": ("SQL_038.sql", "回答ごとの回答時間(秒)"),
+    "rejections": ("SQL_039.sql", "日別・理由別の返信要件不備の件数"),
+}
+
+# 出力形式
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMATS = (FORMAT_CSV, FORMAT_JSONL)
+
+
+class UsageReport:
+    """利用状況レポート
+        結果はサーバサイドカーソルから1行ずつ読み、そのまま出力するため、期間の長さによらずメモリ使用量は一定となる。
+    """
+    def __init__(self, context):
+        """コンストラクタ
+            Args:
+                context:ApplicationContextインスタンス
+        """
+        self.context = context
+        self.logger = context.logger
+        self.db_manager = context.db_manager
+
+    def write(self, report, date_from, date_to, fmt, out):
+        """レポート出力
+            Args:
+                report:レポート名(REPORTSのキー)
+                date_from:開始日
+                date_to:終了日(当日を含む)
+                fmt:出力形式(csv/jsonl)
+                out:出力先のテキストストリーム
+            Return:
+                出力した行数
+        """
+        if report not in REPORTS:
+            raise ValueError("不明なレポートです。" + str(report))
+        if fmt not in FORMATS:
+            raise ValueError("不明な出力形式です。" + str(fmt))
+        if date_from > date_to:
+            raise ValueError("開始日が終了日より後です。")
+
+        sqlfile, _ = REPORTS[report]
+        rows = self.db_manager.fetch_iter(sqlfile, date_from, date_to)
+        if fmt == FORMAT_CSV:
+            count = _write_csv(rows, out)
+        else:
+            count = _write_jsonl(rows, out)
+        self.logger.info("レポート出力完了 %s %s～%s %d行", report, date_from.isoformat(), date_to.isoformat(), count)
+        return count
+
+
+def _write_csv(rows, out):
+    """CSV出力
+        見出し行は最初の行の列名から出力する。結果が0行の場合は何も出力しない。
+        Args:
+            rows:行のイテレータ
+            out:出力先のテキストストリーム
+        Return:
+            出力した行数
+    """
+    writer = csv.writer(out, lineterminator="\n")
+    count = 0
+    for row in rows:
+        if count == 0:
+            writer.writerow(row._fields)
+        writer.writerow([_to_value(value) for value in row])
+        count += 1
+    return count
+
+
+def _write_jsonl(rows, out):
+    """JSON Lines出力
+        Args:
+            rows:行のイテレータ
+            out:出力先のテキストストリーム
+        Return:
+            出力した行数
+    """
+    count = 0
+    for row in rows:
+        record = {field: _to_value(value) for field, value in zip(row._fields, row)}
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def _to_value(value):
+    """出力値変換
+        日付、日時はISO形式、DECIMALは浮動小数点数とする。
+        Args:
+            value:列の値
+        Return:
+            変換後の値
+    """
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
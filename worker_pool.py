@@ -0,0 +1,153 @@
+"""worker_pool.py
+    受信した通知の処理を複数のワーカースレッドで並行して行う。
+    同一キーの処理は受付順に1件ずつ実行する。
+"""
+import asyncio
+import collections
+import queue
+import threading
+import time
+
+
+class WorkerPool:
+    """ワーカープール
+        上限件数付きのジョブキューと、それを処理するワーカースレッドを保持する。
+    """
+    def __init__(self, worker_count, queue_size, logger):
+        """コンストラクタ
+            Args:
+                worker_count:ワーカースレッド数
+                queue_size:待機ジョブ数の上限
+                logger:ロガーインスタンス
+        """
+        self.worker_count = int(worker_count)
+        self.queue_size = int(queue_size)
+        self.logger = logger
+        self.__ready = queue.Queue()
+        # キーごとの後続ジョブ。キーが存在する間は、そのキーのジョブが実行待ちまたは実行中
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        self.__threads = []
+        self.__started_at = None
+        # 統計情報
+        self.__depth = 0
+        self.__running = 0
+        self.__submitted_cnt = 0
+        self.__rejected_cnt = 0
+        self.__completed_cnt = 0
+        self.__failed_cnt = 0
+        self.__wait_time_total = 0.0
+        self.__wait_time_max = 0.0
+        self.__busy_time_total = 0.0
+
+    def start(self):
+        """ワーカー起動
+        """
+        self.__started_at = time.monotonic()
+        for num in range(self.worker_count):
+            thread = threading.Thread(target=self.__work, name="worker-{n}".format(n=num), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def submit(self, key, func, *args):
+        """ジョブ投入
+            Args:
+                key:順序を保証する単位(アカウントID)
+                func:実行処理
+                args:実行処理の引数
+            Returns:
+                True:投入成功
+                False:キューが上限に達している
+        """
+        job = (func, args, time.monotonic())
+        with self.__lock:
+            if self.__depth >= self.queue_size:
+                self.__rejected_cnt += 1
+                return False
+            self.__depth += 1
+            self.__submitted_cnt += 1
+
+            if key in self.__pending:
+                # 同一キーのジョブが処理中の場合は、完了後に投入する
+                self.__pending[key].append(job)
+                return True
+            self.__pending[key] = collections.deque()
+
+        self.__ready.put((key, job))
+        return True
+
+    def shutdown(self, timeout=None):
+        """ワーカー停止
+            実行中のジョブの完了を待ち、ワーカーを停止する。
+            Args:
+                timeout:ワーカー1件あたりの待機秒数
+        """
+        for _ in self.__threads:
+            self.__ready.put((None, None))
+        for thread in self.__threads:
+            thread.join(timeout)
+        self.__threads = []
+
+    def stats(self):
+        """統計情報取得
+            Return:
+                待機件数、待機時間、稼働率等の統計情報
+        """
+        with self.__lock:
+            started_cnt = self.__completed_cnt + self.__failed_cnt + self.__running
+            elapsed = time.monotonic() - self.__started_at if self.__started_at else 0.0
+            return {
+                "workers": self.worker_count,
+                "queue_size": self.queue_size,
+                "depth": self.__depth,
+                "running": self.__running,
+                "submitted_count": self.__submitted_cnt,
+                "rejected_count": self.__rejected_cnt,
+                "completed_count": self.__completed_cnt,
+                "failed_count": self.__failed_cnt,
+                "wait_time_max": self.__wait_time_max,
+                "wait_time_avg": self.__wait_time_total / started_cnt if started_cnt else 0.0,
+                "utilization": self.__busy_time_total / (elapsed * self.worker_count) if elapsed else 0.0,
+            }
+
+    def __work(self):
+        """ワーカー処理
+            ジョブを取り出して実行する。ワーカーごとにイベントループを持つ。
+        """
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        while True:
+            key, job = self.__ready.get()
+            if job is None:
+                break
+
+            func, args, enqueued_at = job
+            started_at = time.monotonic()
+            with self.__lock:
+                self.__depth -= 1
+                self.__running += 1
+                self.__wait_time_total += started_at - enqueued_at
+                self.__wait_time_max = max(self.__wait_time_max, started_at - enqueued_at)
+
+            failed = False
+            try:
+                func(*args)
+            except Exception as e:
+                failed = True
+                self.logger.critical("ワーカー処理で、エラーが発生しました。" + str(e))
+
+            with self.__lock:
+                self.__running -= 1
+                self.__busy_time_total += time.monotonic() - started_at
+                if failed:
+                    self.__failed_cnt += 1
+                else:
+                    self.__completed_cnt += 1
+
+                # 同一キーの後続ジョブを投入する
+                followers = self.__pending[key]
+                next_job = followers.popleft() if followers else None
+                if next_job is None:
+                    del self.__pending[key]
+
+            if next_job is not None:
+                self.__ready.put((key, next_job))